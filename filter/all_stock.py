@@ -1,10 +1,11 @@
-import requests
-import gzip
 import json
-import time
 from datetime import datetime, timedelta
 import os
 
+from filter.fetcher import QUOTE_HOST, fetch_pages
+import update.fetch_market_local as fl
+from update.intraday_store import IntradayStore
+
 # https://quote.eastmoney.com/center/gridlist.html#hs_a_board
 
 # 手动补充数据指令
@@ -18,26 +19,15 @@ import os
 now = datetime.now()
 date_str = now.strftime("%Y-%m-%d")
 
-output_file = f"/root/stock/data/{date_str}_all_market.txt"
-
-if os.path.exists(output_file):
-    new_timestr = datetime.now().strftime("%Y-%m-%d_%H:%M")  # 注意：Windows 文件名不支持冒号 ":"
-    new_file = f"/root/stock/data/{new_timestr}_all_market.txt"
-    
-    # 重命名文件
-    try:
-        os.rename(output_file, new_file)
-        print(f"文件已重命名为: {new_file}")
-    except FileNotFoundError:
-        print(f"错误：源文件 '{output_file}' 不存在")
-    except OSError as e:
-        print(f"重命名失败: {e}")
+# 当天只保留一份文本快照（bulk_ingest 和本地增量更新读取），每次拉取整体覆盖；
+# 盘中的历次快照由 IntradayStore 按批次保存
+output_file = fl.snapshot_path(date_str)
 
 # -----------------------
 # 请求配置
 # -----------------------
 BASE_URL = (
-    "http://push2.eastmoney.com/api/qt/clist/get"
+    f"{QUOTE_HOST}/api/qt/clist/get"
     "?np=1&fltt=1&invt=2"
     "&fs=m%3A0%2Bt%3A6%2Bf%3A!2%2C"
     "m%3A0%2Bt%3A80%2Bf%3A!2%2C"
@@ -49,75 +39,24 @@ BASE_URL = (
     "&ut=fa5fd1943c7b386f172d6893dbfba10b"
     "&wbp2u=%7C0%7C1%7C0%7Cweb"
 )
-HEADERS = {
-    "User-Agent": (
-        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
-        "AppleWebKit/537.36 (KHTML, like Gecko) "
-        "Chrome/142.0.0.0 Safari/537.36"
-    ),
-}
-PROXY = {"http": "http://127.0.0.1:18888", "https": "http://127.0.0.1:18888"}
-
-
-# -----------------------
-# 拉取单页（带重试 + 自动解压）
-# -----------------------
-def fetch_page(page, retries=6):
-    url = f"{BASE_URL}&pn={page}"
-    for attempt in range(retries):
-        try:
-            resp = requests.get(url, headers=HEADERS, proxies=PROXY, timeout=10)
-            if resp.status_code != 200:
-                print(f"⚠️ 第{page}页请求失败({resp.status_code})，重试 {attempt+1}/{retries}")
-                time.sleep(2)
-                continue
-
-            content = resp.content
-            encoding = resp.headers.get("Content-Encoding", "").lower()
-
-            # 根据头部解压
-            # if "gzip" in encoding:
-            #     content = gzip.decompress(content)
-            # elif "br" in encoding:
-            #     # brotli压缩格式（需要安装brotli库）
-            #     import brotli
-            #     content = brotli.decompress(content)
-            # elif "deflate" in encoding:
-            #     import zlib
-            #     content = zlib.decompress(content)
-
-            data = json.loads(content.decode("utf-8", errors="ignore"))
-            if "data" not in data or not data["data"].get("diff"):
-                print(f"⚠️ 第{page}页数据为空，重试 {attempt+1}/{retries}")
-                time.sleep(2)
-                continue
-
-            return data["data"]["diff"]
-
-        except Exception as e:
-            print(f"⚠️ 第{page}页异常：{e}，重试 {attempt+1}/{retries}")
-            time.sleep(5)
-
-    print(f"❌ 第{page}页重试失败，跳过")
-    return []
 
 
 # -----------------------
 # 主流程
 # -----------------------
-all_stocks = []
-all_codes = []
-for page in range(1,56):
-    print(f"📄 正在拉取第 {page} 页...")
-    rows = fetch_page(page)
-    with open(output_file, "a", encoding="utf-8") as f:
+# 并发拉取，结果按页码顺序返回
+pages = fetch_pages(BASE_URL, range(1, 56))
+tmp_file = f"{output_file}.tmp"
+with open(tmp_file, "w", encoding="utf-8") as f:
+    for rows in pages:
         f.write(json.dumps(rows))
-    time.sleep(1)
+os.replace(tmp_file, output_file)
 
-# -----------------------
-# 写入文件
-# -----------------------
-# with open(output_code_file, "w", encoding="utf-8") as f:
-#     f.write("\n".join(all_codes))
+# 同时作为一个批次追加到当天的盘中存储
+try:
+    count = IntradayStore(now).append_pages(pages, now)
+    print(f"盘中存储追加 {count} 只股票")
+except Exception as e:
+    print(f"⚠️ 盘中存储追加失败: {e}")
 
-print(f"✅ 共获取 {len(all_stocks)} 条股票记录，已写入 {output_file}")
+print(f"✅ 共获取 {sum(len(rows) for rows in pages)} 条股票记录，已写入 {output_file}")
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+@file: fetcher.py
+@author: vanilla
+@date: 2025-10-28
+@desc: filter/ 下排名脚本共用的分页抓取：asyncio 并发 + 单个长连接 Session，
+       请求经 utils.ratelimit 的共享限速器（限速、退避重试、熔断、统计）。
+"""
+
+import os
+import json
+import time
+import asyncio
+import requests
+from requests.adapters import HTTPAdapter
+
+import utils.ratelimit as ratelimit
+
+# 行情接口地址，可指向本地的模拟服务做测试
+QUOTE_HOST = os.environ.get("STOCK_QUOTE_HOST", "http://push2.eastmoney.com")
+
+HEADERS = {
+    "User-Agent": (
+        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
+        "AppleWebKit/537.36 (KHTML, like Gecko) "
+        "Chrome/142.0.0.0 Safari/537.36"
+    ),
+}
+
+# 代理，STOCK_PROXY="" 表示直连
+_proxy = os.environ.get("STOCK_PROXY", "http://127.0.0.1:18888")
+PROXY = {"http": _proxy, "https": _proxy} if _proxy else None
+
+
+# ===============================
+# 抓取
+# ===============================
+class Fetcher:
+    """
+    :param concurrency: 同时在途的请求数
+    :param rate: 每秒请求数（共享限速器 "eastmoney"，与其他远程数据源一起统计、熔断）
+    :param retries: 单个页面最多尝试次数
+    """
+
+    def __init__(self, concurrency=8, rate=10, burst=None, retries=6, timeout=10, proxy=PROXY, headers=HEADERS, log=print):
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.log = log
+        self.limiter = ratelimit.limiter("eastmoney", rate=rate, burst=burst, retries=retries, log=log)
+        self.limiter.bucket.set_rate(rate)
+
+        # 一个 Session 复用长连接，连接池大小与并发数一致
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=concurrency)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update(headers)
+        if proxy:
+            self.session.proxies.update(proxy)
+
+    def close(self):
+        self.session.close()
+
+    def get_json(self, url):
+        """请求并解析 JSON，状态码非 200 时抛出异常"""
+        resp = self.session.get(url, timeout=self.timeout)
+        if resp.status_code != 200:
+            raise ConnectionError(f"请求失败({resp.status_code})")
+        return json.loads(resp.content.decode("utf-8", errors="ignore"))
+
+    @staticmethod
+    def is_empty(data):
+        return not (data and data.get("data") and data["data"].get("diff"))
+
+    async def fetch_json(self, url, semaphore, label=""):
+        """
+        经共享限速器请求并解析 JSON：出错或 data.diff 为空时由限速器降速、退避重试，
+        全部失败（或数据源熔断）返回 None
+        """
+        async with semaphore:
+            try:
+                data = await asyncio.to_thread(self.limiter.call, self.get_json, url, is_empty=self.is_empty)
+            except Exception as e:
+                self.log(f"❌ {label}重试失败，跳过：{e}")
+                return None
+        if self.is_empty(data):
+            self.log(f"❌ {label}数据为空，跳过")
+            return None
+        return data
+
+    async def fetch_pages_async(self, base_url, pages):
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def one(page):
+            data = await self.fetch_json(f"{base_url}&pn={page}", semaphore, label=f"第{page}页")
+            return data["data"]["diff"] if data else []
+
+        # gather 保持页码顺序
+        return await asyncio.gather(*(one(page) for page in pages))
+
+    def fetch_pages(self, base_url, pages):
+        return asyncio.run(self.fetch_pages_async(base_url, list(pages)))
+
+
+def fetch_pages(base_url, pages, **kwargs):
+    """
+    并发拉取分页接口，返回与 pages 顺序一致的 [每页的 data.diff]，失败的页为 []
+    """
+    fetcher = Fetcher(**kwargs)
+    try:
+        start = time.time()
+        result = fetcher.fetch_pages(base_url, pages)
+        fetcher.log(f"📄 共拉取 {len(result)} 页，耗时 {time.time() - start:.1f}s")
+        ratelimit.print_stats(fetcher.log)
+        return result
+    finally:
+        fetcher.close()
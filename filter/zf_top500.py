@@ -1,10 +1,9 @@
-import requests
-import gzip
 import json
-import time
 from datetime import datetime, timedelta
 import os
 
+from filter.fetcher import QUOTE_HOST, fetch_pages
+
 # https://quote.eastmoney.com/center/gridlist.html#hs_a_board
 
 # 手动补充数据指令
@@ -40,7 +39,7 @@ BASE_URL = (
 #    "m%3A0%2Bt%3A7%2Bf%3A!2%2C"
 #    "m%3A1%2Bt%3A3%2Bf%3A!2"
 #    "&fields=f12%2Cf14%2Cf3"
-    "http://push2.eastmoney.com/api/qt/clist/get"
+    f"{QUOTE_HOST}/api/qt/clist/get"
     "?fid=f3&po=1&pz=100&np=1&fltt=1&invt=2"
     "&ut=fa5fd1943c7b386f172d6893dbfba10b"
     "&fs=m%3A0%2Bt%3A6%2Bf%3A!2%2C"
@@ -50,57 +49,6 @@ BASE_URL = (
     "m%3A0%2Bt%3A81%2Bs%3A262144%2Bf%3A!2"
     "&fields=f12%2Cf14%2Cf3"
 )
-HEADERS = {
-    "User-Agent": (
-        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
-        "AppleWebKit/537.36 (KHTML, like Gecko) "
-        "Chrome/142.0.0.0 Safari/537.36"
-    ),
-}
-PROXY = {"http": "http://127.0.0.1:18888", "https": "http://127.0.0.1:18888"}
-
-
-# -----------------------
-# 拉取单页（带重试 + 自动解压）
-# -----------------------
-def fetch_page(page, retries=6):
-    url = f"{BASE_URL}&pn={page}"
-    for attempt in range(retries):
-        try:
-            resp = requests.get(url, headers=HEADERS, proxies=PROXY, timeout=10)
-            if resp.status_code != 200:
-                print(f"⚠️ 第{page}页请求失败({resp.status_code})，重试 {attempt+1}/{retries}")
-                time.sleep(2)
-                continue
-
-            content = resp.content
-            encoding = resp.headers.get("Content-Encoding", "").lower()
-
-            # 根据头部解压
-            # if "gzip" in encoding:
-            #     content = gzip.decompress(content)
-            # elif "br" in encoding:
-            #     # brotli压缩格式（需要安装brotli库）
-            #     import brotli
-            #     content = brotli.decompress(content)
-            # elif "deflate" in encoding:
-            #     import zlib
-            #     content = zlib.decompress(content)
-
-            data = json.loads(content.decode("utf-8", errors="ignore"))
-            if "data" not in data or not data["data"].get("diff"):
-                print(f"⚠️ 第{page}页数据为空，重试 {attempt+1}/{retries}")
-                time.sleep(2)
-                continue
-
-            return data["data"]["diff"]
-
-        except Exception as e:
-            print(f"⚠️ 第{page}页异常：{e}，重试 {attempt+1}/{retries}")
-            time.sleep(5)
-
-    print(f"❌ 第{page}页重试失败，跳过")
-    return []
 
 
 # -----------------------
@@ -108,9 +56,8 @@ def fetch_page(page, retries=6):
 # -----------------------
 all_stocks = []
 all_codes = []
-for page in range(1, 4):
-    print(f"📄 正在拉取第 {page} 页...")
-    rows = fetch_page(page)
+# 并发拉取，结果按页码顺序返回
+for rows in fetch_pages(BASE_URL, range(1, 4)):
     for item in rows:
         code = item.get("f12")
         name = item.get("f14")
@@ -125,7 +72,6 @@ for page in range(1, 4):
                 all_codes.append(f"{code}")
         except Exception as e:
             print("fail to get zf")
-    time.sleep(5)
 
 # -----------------------
 # 写入文件
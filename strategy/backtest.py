@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+@file: backtest.py
+@author: vanilla
+@date: 2025-10-21
+@desc: 基于 numpy 数组的单股回测引擎，交易记录以紧凑账本保存，持仓窗口以下标区间表示。
+"""
+
+import numpy as np
+import pandas as pd
+
+
+FUND = 10000            # 初始资金
+FEE_RATE = 0.00026      # 手续费率
+FEE_LIMIT = 5           # 手续费封顶（与原逻辑保持一致）
+LOT = 100               # 一手股数
+WARMUP = 21             # 前 21 行指标未稳定，不参与回测
+
+# 交易账本：一行一笔交易，exit == -1 表示仍在持仓
+LEDGER_DTYPE = np.dtype([
+    ("entry", np.int64),
+    ("exit", np.int64),
+    ("entry_price", np.float64),
+    ("exit_price", np.float64),
+    ("shares", np.int64),
+    ("entry_fee", np.float64),
+    ("exit_fee", np.float64),
+    ("entry_cash", np.float64),
+    ("exit_cash", np.float64),
+])
+
+
+# ===============================
+# 行/窗口视图（代替 iterrows 生成的 Series）
+# ===============================
+def columns(records):
+    """把 DataFrame 拆成 {列名: 数组}，日期列保留 Timestamp 语义"""
+    cols = {}
+    for c in records.columns:
+        s = records[c]
+        if pd.api.types.is_datetime64_any_dtype(s):
+            cols[c] = s.array
+        else:
+            cols[c] = s.to_numpy()
+    cols["__index__"] = records.index.to_numpy()
+    return cols
+
+
+class Row:
+    """单行只读视图，支持 r["close"]、r.get(...)、r.name，与策略中对 Series 的用法一致"""
+
+    __slots__ = ("cols", "i")
+
+    def __init__(self, cols, i):
+        self.cols = cols
+        self.i = i
+
+    def __getitem__(self, key):
+        return self.cols[key][self.i]
+
+    def __contains__(self, key):
+        return key in self.cols and key != "__index__"
+
+    def get(self, key, default=None):
+        if key in self:
+            return self.cols[key][self.i]
+        return default
+
+    @property
+    def name(self):
+        return self.cols["__index__"][self.i]
+
+    def to_dict(self):
+        return {k: v[self.i] for k, v in self.cols.items() if k != "__index__"}
+
+    def __repr__(self):
+        return f"Row({self.name}, {self.to_dict()})"
+
+
+class RecordWindow:
+    """持仓期间的行情窗口 [start, stop)，按需生成 Row，不复制数据"""
+
+    __slots__ = ("cols", "start", "stop")
+
+    def __init__(self, cols, start=0, stop=0):
+        self.cols = cols
+        self.start = start
+        self.stop = stop
+
+    def __len__(self):
+        return self.stop - self.start
+
+    def __getitem__(self, k):
+        n = len(self)
+        if k < 0:
+            k += n
+        if k < 0 or k >= n:
+            raise IndexError("record index out of range")
+        return Row(self.cols, self.start + k)
+
+    def __iter__(self):
+        for i in range(self.start, self.stop):
+            yield Row(self.cols, i)
+
+
+def fee(capital):
+    return min(capital * FEE_RATE, FEE_LIMIT)
+
+
+# ===============================
+# 回测主循环
+# ===============================
+def run(cols, signal, signal_desc, sell, start=WARMUP, stop=None, fund=FUND, stop_flag=None, state=None):
+    """
+    :param cols: columns(records) 的结果
+    :param signal: 买入信号 bool 数组
+    :param signal_desc: desc(i) -> 买入描述
+    :param sell: sell(i, status) -> (ok, desc)，只在持仓日调用
+    :param state: 上次运行保存的 status["state"]，从其 next 行继续，只处理新增的行
+    :return: status 字典（字段与旧版回测保持一致）+ ledger 账本 + state 检查点
+    """
+    close = cols["close"]
+    n = len(close)
+    stop = n if stop is None else min(stop, n)
+
+    status = {
+        "hold": False,
+        "buy": 0,
+        "base": fund,
+        "fund": fund,
+        "capital": 0,
+        "lose": 0,
+        "win": 0,
+        "hand": 0,
+        "days": 0,
+        "record": RecordWindow(cols),
+        "operations": [],
+        "stopped": False,
+    }
+    trades = []
+    buy_descs = []
+    sell_descs = []
+    entry = -1
+    if state is not None:
+        for k in ("hold", "buy", "base", "fund", "capital", "lose", "win", "hand", "days"):
+            status[k] = state[k]
+        trades = [list(t) for t in state["ledger"].tolist()]
+        buy_descs = list(state["buy_descs"])
+        sell_descs = list(state["sell_descs"])
+        start = state["next"]
+        entry = state["entry"]
+        if status["hold"]:
+            status["record"] = RecordWindow(cols, entry, start)
+
+    # 空仓时直接跳到下一个买点，不逐行扫描
+    buy_points = np.flatnonzero(np.asarray(signal[:stop], dtype=bool))
+    buy_points = buy_points[buy_points >= start]
+
+    i = start
+    while i < stop:
+        if stop_flag and stop_flag.is_set():
+            status["stopped"] = True
+            break
+
+        if not status["hold"]:
+            k = np.searchsorted(buy_points, i)
+            if k >= len(buy_points):
+                break
+            i = int(buy_points[k])
+            price = close[i]
+            hand = int(status["fund"] / price / LOT) * LOT
+            capital = price * hand
+            status["fund"] -= capital
+            buy_fee = fee(capital)
+            status["fund"] -= buy_fee
+            status["hand"] = hand
+            status["buy"] = price
+            status["capital"] = capital
+            status["hold"] = True
+            status["record"] = RecordWindow(cols, i, i + 1)
+            entry = i
+            trades.append([i, -1, price, np.nan, hand, buy_fee, 0.0, status["fund"], np.nan])
+            buy_descs.append(signal_desc(i))
+            sell_descs.append("")
+        else:
+            status["days"] += 1
+            status["record"] = RecordWindow(cols, entry, i + 1)
+            status["capital"] = status["hand"] * close[i]
+            ok, desc = sell(i, status)
+            if ok:
+                price = close[i]
+                capital = status["hand"] * price
+                status["fund"] += capital
+                sell_fee = fee(capital)
+                status["fund"] -= sell_fee
+                rate = (price - status["buy"]) * 100.0 / status["buy"]
+                if rate >= 0:
+                    status["win"] += 1
+                else:
+                    status["lose"] += 1
+                trade = trades[-1]
+                trade[1] = i
+                trade[3] = price
+                trade[6] = sell_fee
+                trade[8] = status["fund"]
+                sell_descs[-1] = desc
+                status["hold"] = False
+                status["days"] = 0
+                status["capital"] = 0
+                status["hand"] = 0
+                status["record"] = RecordWindow(cols)
+        i += 1
+
+    ledger = np.array([tuple(t) for t in trades], dtype=LEDGER_DTYPE)
+    status["ledger"] = ledger
+    status["buy_descs"] = buy_descs
+    status["sell_descs"] = sell_descs
+    status["operations"] = operations(cols, ledger, buy_descs, sell_descs)
+    status["state"] = None if status["stopped"] else checkpoint(cols, status, entry, stop)
+    return status
+
+
+def checkpoint(cols, status, entry, stop):
+    """
+    引擎检查点：持仓/资金/计数 + 已处理到的位置，以及末行的日期与收盘价（用于校验新数据是否只是追加）
+    账本与买卖描述保存在 status 中，恢复时一并传回
+    """
+    return {
+        "next": int(stop),
+        "entry": int(entry) if status["hold"] else -1,
+        "hold": bool(status["hold"]),
+        "buy": float(status["buy"]),
+        "base": float(status["base"]),
+        "fund": float(status["fund"]),
+        "capital": float(status["capital"]),
+        "lose": int(status["lose"]),
+        "win": int(status["win"]),
+        "hand": int(status["hand"]),
+        "days": int(status["days"]),
+        "last_date": str(cols["trade_date"][stop - 1]) if stop > 0 else "",
+        "last_close": float(cols["close"][stop - 1]) if stop > 0 else None,
+    }
+
+
+def can_resume(cols, state):
+    """新数据的前 next 行与检查点一致（只在末尾追加了新行）时才能续跑"""
+    if not state:
+        return False
+    n = state["next"]
+    if n <= 0 or n > len(cols["close"]):
+        return False
+    return str(cols["trade_date"][n - 1]) == state["last_date"] and float(cols["close"][n - 1]) == state["last_close"]
+
+
+def resume_from(state):
+    """续跑时需要重新预处理的起始行：持仓中则从买入日起（卖出判断会用到持仓窗口），否则从新增行起"""
+    return state["entry"] if state["hold"] else state["next"]
+
+
+def operations(cols, ledger, buy_descs, sell_descs):
+    """由账本还原逐笔操作记录（用于日志输出）"""
+    dates = cols["trade_date"]
+    ops = []
+    for t, buy_desc, sell_desc in zip(ledger, buy_descs, sell_descs):
+        capital = t["entry_price"] * t["shares"]
+        ops.append({
+            "operator": "买入",
+            "strategy": buy_desc,
+            "trade_date": dates[t["entry"]],
+            "hand": t["shares"],
+            "price": t["entry_price"],
+            "capital": capital,
+            "cash_flow": t["entry_cash"],
+            "rate": 0,
+        })
+        if t["exit"] >= 0:
+            ops.append({
+                "operator": "卖出",
+                "trade_date": dates[t["exit"]],
+                "hand": t["shares"],
+                "price": t["exit_price"],
+                "capital": 0,
+                "cash_flow": t["exit_cash"],
+                "strategy": sell_desc,
+                "rate": (t["exit_price"] - t["entry_price"]) * 100.0 / t["entry_price"],
+            })
+    return ops
+
+
+def equity_curve(cols, status):
+    """由账本还原逐日净值：现金 + 持股 × 收盘价"""
+    close = np.asarray(cols["close"], dtype=np.float64)
+    n = len(close)
+    cash = np.full(n, float(status["base"]))
+    shares = np.zeros(n)
+    for t in status["ledger"]:
+        cash[t["entry"]:] = t["entry_cash"]
+        if t["exit"] >= 0:
+            shares[t["entry"]:t["exit"]] = t["shares"]
+            cash[t["exit"]:] = t["exit_cash"]
+        else:
+            shares[t["entry"]:] = t["shares"]
+    return cash + shares * close
+
+
+def total_return(status):
+    """区间收益率（%），持仓按最后一日市值计"""
+    return (status["fund"] + status["capital"] - status["base"]) * 100.0 / status["base"]
+
+
+def find_exit(cols, entry, sell, stop=None):
+    """
+    从 entry 日收盘买入后逐日调用 sell，返回 (卖出下标, 描述)；到 stop 仍未卖出返回 (-1, "")
+    卖出策略只依赖本股行情与持仓窗口，与资金无关，因此可以预先算好，供组合回测复用
+    """
+    close = cols["close"]
+    stop = len(close) if stop is None else min(stop, len(close))
+    status = {
+        "hold": True,
+        "buy": close[entry],
+        "days": 0,
+        "hand": 0,
+        "capital": 0,
+        "record": RecordWindow(cols, entry, entry + 1),
+    }
+    for i in range(entry + 1, stop):
+        status["days"] += 1
+        status["record"] = RecordWindow(cols, entry, i + 1)
+        ok, desc = sell(i, status)
+        if ok:
+            return i, desc
+    return -1, ""
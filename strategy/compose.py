@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+@file: compose.py
+@author: vanilla
+@date: 2025-10-20
+@desc: 策略组合表达式，把 kdj&fish_tub、volumn_break|volumn_detect、!kdj_ready 编译成一次评估计划。
+"""
+
+import re
+import numpy as np
+
+from strategy.backtest import columns, Row
+from utils.parse import parse_tuning
+
+
+# ===============================
+# 语法
+# ===============================
+# expr   := term ("|" term)*
+# term   := factor ("&" factor)*
+# factor := "!" factor | "(" expr ")" | 策略名
+TOKEN_RE = re.compile(r"\s*(?:([A-Za-z_][A-Za-z0-9_]*)|(.))")
+
+
+def tokenize(expr):
+    tokens = []
+    for name, op in TOKEN_RE.findall(expr):
+        if name:
+            tokens.append(("name", name))
+        elif op.strip():
+            if op not in "&|!()":
+                raise ValueError(f"策略表达式 {expr} 含非法字符: {op}")
+            tokens.append(("op", op))
+    return tokens
+
+
+class Parser:
+    def __init__(self, expr):
+        self.expr = expr
+        self.tokens = tokenize(expr)
+        self.pos = 0
+
+    def peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else (None, None)
+
+    def take(self, value=None):
+        kind, tok = self.peek()
+        if kind is None or (value is not None and tok != value):
+            raise ValueError(f"策略表达式 {self.expr} 语法错误，期望 {value or '策略名'}")
+        self.pos += 1
+        return kind, tok
+
+    def parse(self):
+        if not self.tokens:
+            raise ValueError("策略表达式为空")
+        node = self.parse_expr()
+        if self.pos != len(self.tokens):
+            raise ValueError(f"策略表达式 {self.expr} 语法错误，多余内容: {self.peek()[1]}")
+        return node
+
+    def parse_expr(self):
+        node = self.parse_term()
+        while self.peek() == ("op", "|"):
+            self.take("|")
+            node = ("or", node, self.parse_term())
+        return node
+
+    def parse_term(self):
+        node = self.parse_factor()
+        while self.peek() == ("op", "&"):
+            self.take("&")
+            node = ("and", node, self.parse_factor())
+        return node
+
+    def parse_factor(self):
+        kind, tok = self.peek()
+        if (kind, tok) == ("op", "!"):
+            self.take("!")
+            return ("not", self.parse_factor())
+        if (kind, tok) == ("op", "("):
+            self.take("(")
+            node = self.parse_expr()
+            self.take(")")
+            return node
+        if kind == "name":
+            self.take()
+            return ("leaf", tok)
+        raise ValueError(f"策略表达式 {self.expr} 语法错误，期望策略名")
+
+
+def collect_leaves(node, negated=False, out=None):
+    """按出现顺序收集叶子策略，记录是否处于取反位置"""
+    if out is None:
+        out = []
+    if node[0] == "leaf":
+        out.append((node[1], negated))
+    elif node[0] == "not":
+        collect_leaves(node[1], not negated, out)
+    else:
+        collect_leaves(node[1], negated, out)
+        collect_leaves(node[2], negated, out)
+    return out
+
+
+# ===============================
+# 单只股票的评估上下文
+# ===============================
+class StockContext:
+    """
+    同一只股票上所有计划共享：每个叶子策略的 pretreatment 与 buy 信号只计算一次
+    stock["process_from"]：pretreatment 的逐行计算从这一行开始，之前的行只作为指标的历史窗口
+      - 增量回测（Predictor.excute）：之前的行已有检查点，设为续跑起点
+      - 信号回放（Predictor.replay）：之前的行在回放区间外，设为区间第一行
+    cache：同一只股票、同一 operate 下多组参数（参数网格）的上下文共享的预处理结果，
+      叶子策略按其 TUNING_KEYS 中参数的取值复用，没有声明 TUNING_KEYS 的策略按完整参数串区分
+    """
+
+    def __init__(self, stock, operate, tuning, mapping, debug=False, cache=None):
+        self.stock = stock
+        self.operate = operate
+        self.tuning = tuning
+        self.mapping = mapping
+        self.debug = debug
+        cache = {} if cache is None else cache
+        self.frames = cache.setdefault("frames", {})
+        self.cols = cache.setdefault("cols", {})
+        self.signals = cache.setdefault("signals", {})
+
+    def key(self, leaf):
+        """叶子策略预处理结果的缓存键：策略名 + 影响预处理的参数取值"""
+        keys = getattr(self.mapping[leaf], "TUNING_KEYS", None)
+        if keys is None:
+            return leaf, self.tuning
+        t_arr = parse_tuning(self.tuning)
+        return leaf, tuple((k, t_arr[k]) for k in keys if k in t_arr)
+
+    def frame(self, leaf):
+        key = self.key(leaf)
+        if key not in self.frames:
+            # 各策略在各自的视图上追加指标列，互不覆盖
+            view = dict(self.stock)
+            self.mapping[leaf].pretreatment(view, self.operate, self.tuning, self.debug)
+            self.frames[key] = view["records"]
+        return self.frames[key]
+
+    def columns(self, leaf):
+        """叶子策略视图的列数组，供 Row 逐行访问"""
+        key = self.key(leaf)
+        if key not in self.cols:
+            self.cols[key] = columns(self.frame(leaf))
+        return self.cols[key]
+
+    def leaf_signal(self, leaf, start, stop):
+        """返回 (bool 数组, 描述列表)，长度与 records 一致，[start, stop) 之外为 False"""
+        key = (self.key(leaf), start, stop)
+        if key not in self.signals:
+            cols = self.columns(leaf)
+            module = self.mapping[leaf]
+            n = len(self.frame(leaf))
+            signal = np.zeros(n, dtype=bool)
+            descs = [""] * n
+            for i in range(max(start, 0), min(stop, n)):
+                ok, desc = module.buy(Row(cols, i), {}, self.debug)
+                signal[i] = bool(ok)
+                descs[i] = desc
+            self.signals[key] = (signal, descs)
+        return self.signals[key]
+
+
+# ===============================
+# 评估计划
+# ===============================
+class Plan:
+    def __init__(self, expr, mapping):
+        self.expr = expr.strip()
+        self.mapping = mapping
+        self.tree = Parser(self.expr).parse()
+
+        leaves = collect_leaves(self.tree)
+        self.leaves = []
+        for name, _ in leaves:
+            if name not in mapping:
+                raise ValueError(f"未知策略: {name}, 支持: {list(mapping.keys())}")
+            if name not in self.leaves:
+                self.leaves.append(name)
+
+        # 卖出由非取反位置的策略决定；全部取反时退回到所有叶子策略
+        positive = [name for name, negated in leaves if not negated]
+        self.sell_leaves = list(dict.fromkeys(positive)) or list(self.leaves)
+        self.single = self.tree[0] == "leaf"
+
+    @property
+    def name(self):
+        if self.single:
+            return self.mapping[self.leaves[0]].__name__
+        return f"组合策略 {self.expr}"
+
+    def records(self, ctx):
+        """基础行情（所有叶子视图共有的列）取第一个叶子的视图"""
+        return ctx.frame(self.leaves[0])
+
+    def _eval(self, node, ctx, start, stop):
+        kind = node[0]
+        if kind == "leaf":
+            return ctx.leaf_signal(node[1], start, stop)[0]
+        if kind == "not":
+            return ~self._eval(node[1], ctx, start, stop)
+        left = self._eval(node[1], ctx, start, stop)
+        right = self._eval(node[2], ctx, start, stop)
+        return (left & right) if kind == "and" else (left | right)
+
+    def buy_signal(self, ctx, start, stop):
+        """
+        组合后的买入信号
+        返回: (bool 数组, 取描述的函数 desc(i))
+        """
+        n = len(self.records(ctx))
+        signal = self._eval(self.tree, ctx, start, stop)
+        # 取反会把窗口外的位置也翻成 True，这里统一裁掉
+        window = np.zeros(n, dtype=bool)
+        window[max(start, 0):min(stop, n)] = True
+        signal = signal & window
+
+        def desc(i):
+            if self.single:
+                return ctx.leaf_signal(self.leaves[0], start, stop)[1][i]
+            fired = []
+            for leaf in self.leaves:
+                leaf_sig, leaf_descs = ctx.leaf_signal(leaf, start, stop)
+                if leaf_sig[i]:
+                    fired.append(leaf_descs[i])
+            return f"{self.name}: {'; '.join(fired)}" if fired else self.name
+
+        return signal, desc
+
+    def sell(self, ctx, i, status, debug=False):
+        """任一卖出策略触发即卖出"""
+        for leaf in self.sell_leaves:
+            ok, desc = self.mapping[leaf].sell(Row(ctx.columns(leaf), i), status, debug)
+            if ok:
+                return ok, desc
+        return False, ""
+
+
+def compile_plan(expr, mapping):
+    return Plan(expr, mapping)
@@ -1,9 +1,6 @@
 import os
-import sys
 import json
 import base64
-import time
-import threading
 import requests
 from datetime import datetime
 from strategy.predict import Predictor  # 引入你的类版本predict
@@ -32,51 +29,67 @@ def encrypt_path(path: str) -> str:
     return b64
 
 # -------------------------
-# 单模型执行函数
+# 结果通知
 # -------------------------
-def run_predict(model: str, cond = None, code: str = "all"):
-    """执行单个模型预测任务"""
-    predictor = Predictor(model)
+def notify(model: str, filepath: str):
+    """推送单个模型结果文件的（加密）路径"""
+    print(f"[+] 模型 {model} 预测完成，结果写入：{filepath}")
+
+    # 加密路径
+    encrypted_path = encrypt_path(filepath)
+
+    # 推送通知
+    data = {
+        "msgtype": "text",
+        "text": {
+            "content": encrypted_path,
+        },
+    }
+    try:
+        resp = requests.post(NOTIFY_URL, json=data, timeout=5)
+        print(f"[+] 通知接口响应: {resp.status_code}")
+    except Exception as e:
+        print(f"[!] 通知接口请求失败: {e}")
+
+# -------------------------
+# 多模型执行函数
+# -------------------------
+def run_predict(models, cond = None, code: str = "all", workers: int = 1):
+    """
+    所有模型共用一个 Predictor，每只股票只加载一次，股票列表分给 workers 个进程
+    结果边产出边以 JSON lines 追加写入各模型的结果文件
+    """
+    predictor = Predictor(list(models))
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = f"{model}_{timestamp}.txt"
-    filepath = os.path.join(RESULT_DIR, filename)
+    paths = {model: os.path.join(RESULT_DIR, f"{model}_{timestamp}.jsonl") for model in models}
+    files = {model: open(path, "w", encoding="utf-8") for model, path in paths.items()}
 
-    print(f"[*] 开始执行模型: {model}")
+    print(f"[*] 开始执行模型: {', '.join(models)}")
 
     try:
-        # 调用predict方法
-        result = predictor.predict(
+        for stock_code, model, result in predictor.iter_predict(
             code=code,
             ktype=1,
             operate="buy",
             tuning="",
             cond=cond,
-        )
-
-        # 写入文件
-        with open(filepath, "w") as f:
-            f.write(json.dumps(result, ensure_ascii=False, indent=2))
-
-        print(f"[+] 模型 {model} 预测完成，结果写入：{filepath}")
-
-        # 加密路径
-        encrypted_path = encrypt_path(filepath)
+            workers=workers,
+        ):
+            f = files[model]
+            f.write(json.dumps({"code": stock_code, "result": result}, ensure_ascii=False) + "\n")
+            f.flush()
+    except Exception as e:
+        print(f"[x] 模型 {', '.join(models)} 执行失败: {e}")
+        return
+    finally:
+        for f in files.values():
+            f.close()
 
-        # 推送通知
-        data = {
-            "msgtype": "text",
-            "text": {
-                "content": encrypted_path,
-            },
-        }
+    for model in models:
         try:
-            resp = requests.post(NOTIFY_URL, json=data, timeout=5)
-            print(f"[+] 通知接口响应: {resp.status_code}")
+            notify(model, paths[model])
         except Exception as e:
-            print(f"[!] 通知接口请求失败: {e}")
-
-    except Exception as e:
-        print(f"[x] 模型 {model} 执行失败: {e}")
+            print(f"[x] 模型 {model} 执行失败: {e}")
 
 # -------------------------
 # 主入口
@@ -84,18 +97,10 @@ def run_predict(model: str, cond = None, code: str = "all"):
 if __name__ == "__main__":
     print(f"=== {datetime.now()} 开始执行每日预测任务 ===")
 
-    threads = []
     cond=None
-    for model in MODELS:
-        code = "all" 
-        # if model == "volumn_detect" or model == "volumn_break":
-        #     code = "file,data/zf5_top500.code" 
-        t = threading.Thread(target=run_predict, args=(model, cond, code))
-        t.start()
-        threads.append(t)
-
-    for t in threads:
-        t.join()
+    code = "all"
+    # if model == "volumn_detect" or model == "volumn_break":
+    #     code = "file,data/zf5_top500.code"
+    run_predict(MODELS, cond, code)
 
     print(f"=== {datetime.now()} 所有模型预测完成 ===")
-
@@ -11,6 +11,7 @@ import numpy as np
 from datetime import datetime, timedelta
 from utils.load_info import load_stock_data
 from utils.parse import parse_tuning
+from utils.stock_summary import CHEAP_KEYS, board_of, rejects
 
 
 TARGET_MARKET_CAP = 0  # 500亿，单位为元
@@ -44,6 +45,23 @@ def load_stock(code, tuning, path, end_date, ktype=1):
     if stock["amount"] < amount:
         return False, f"股票成交额小于 {amount} 元"
 
+    # 条件2：交易所、板块、上市天数（与 Predictor 预筛选同一口径）
+    # 只有设置了这些条件才构造单行表，大多数策略参数只有市值/成交额，已在上面判断
+    if any(k in t_arr for k in CHEAP_KEYS if k not in ("market", "amount")):
+        info = stock["info"].sort_values("change_date").iloc[-1]
+        row = pd.DataFrame([{
+            "code": code,
+            "exchange": stock["exchange"],
+            "board": board_of(code),
+            "list_date": info["list_date"],
+            "last_date": stock["records"]["trade_date"].iloc[-1],
+            "market_cap": stock["market_cap"],
+            "amount": stock["amount"],
+        }])
+        for rejected, reason in rejects(row, tuning):
+            if np.asarray(rejected)[0]:
+                return False, reason
+
     # ==========================================
     # 🔹 截取到指定 end_date 的数据
     # ==========================================
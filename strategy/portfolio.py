@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+@file: portfolio.py
+@author: vanilla
+@date: 2025-10-22
+@desc: 全市场组合回测：共享资金池、最大持仓数、按排名分配，按交易日历逐日推进一次。
+"""
+
+import numpy as np
+import pandas as pd
+
+from strategy.backtest import fee, LOT, FEE_RATE
+
+
+# ===============================
+# 对齐后的 (股票 × 交易日) 数组
+# ===============================
+class Universe:
+    """
+    逐只股票收集 日期/收盘价/买入信号/卖出位置/排名分数，build() 时对齐到统一交易日历
+    exits[i] 表示在本股第 i 行买入后将在第几行卖出（-1 表示到最后仍未卖出）
+    """
+
+    def __init__(self):
+        self.codes = []
+        self.names = []
+        self.items = []
+
+    def add(self, code, name, dates, close, signal, exits, score):
+        self.codes.append(code)
+        self.names.append(name)
+        self.items.append((
+            np.asarray(dates, dtype="datetime64[D]"),
+            np.asarray(close, dtype=np.float64),
+            np.asarray(signal, dtype=bool),
+            np.asarray(exits, dtype=np.int64),
+            np.asarray(score, dtype=np.float64),
+        ))
+
+    def build(self, calendar=None):
+        """
+        calendar: 共享交易日历（TradeCalendar），取其覆盖各股日期范围的一段；
+        有股票日期不在日历中（日历过旧等）时退回各股日期的并集
+        """
+        if not self.items:
+            self.calendar = np.array([], dtype="datetime64[D]")
+        else:
+            all_dates = np.concatenate([it[0] for it in self.items])
+            self.calendar = None
+            if calendar is not None and len(all_dates):
+                days = calendar.between(all_dates.min(), all_dates.max())
+                pos = np.clip(np.searchsorted(days, all_dates), 0, max(len(days) - 1, 0))
+                if len(days) and (days[pos] == all_dates).all():
+                    self.calendar = days
+            if self.calendar is None:
+                self.calendar = np.unique(all_dates)
+
+        s, d = len(self.items), len(self.calendar)
+        self.close = np.full((s, d), np.nan)
+        self.signal = np.zeros((s, d), dtype=bool)
+        self.exit = np.full((s, d), -1, dtype=np.int32)
+        self.score = np.zeros((s, d))
+
+        for k, (dates, close, signal, exits, score) in enumerate(self.items):
+            pos = np.searchsorted(self.calendar, dates)
+            self.close[k, pos] = close
+            self.signal[k, pos] = signal
+            self.score[k, pos] = np.nan_to_num(score)
+            # 本股行号 → 日历下标
+            self.exit[k, pos] = np.where(exits >= 0, pos[np.clip(exits, 0, None)], -1)
+        self.items = []
+
+        # 停牌日沿用前一日收盘价估值
+        valid = ~np.isnan(self.close)
+        idx = np.where(valid, np.arange(d), 0)
+        np.maximum.accumulate(idx, axis=1, out=idx)
+        self.close_ffill = np.take_along_axis(self.close, idx, axis=1)
+        return self
+
+
+# ===============================
+# 组合模拟
+# ===============================
+def simulate(universe, fund=100000, max_positions=10, stop_flag=None):
+    """
+    每个交易日：先处理到期卖出，再按分数从高到低用剩余现金等额买入新信号，最后记录净值
+    """
+    calendar = universe.calendar
+    close = universe.close
+    close_ffill = universe.close_ffill
+    n_days = len(calendar)
+
+    cash = float(fund)
+    held = {}  # 股票下标 -> 持仓
+    trades = []
+    equity = np.full(n_days, np.nan)
+    market_value = np.zeros(n_days)
+    positions = np.zeros(n_days, dtype=np.int32)
+
+    for t in range(n_days):
+        if stop_flag and stop_flag.is_set():
+            break
+
+        # 1️⃣ 到期卖出
+        exited = [s for s, p in held.items() if p["exit"] == t]
+        for s in exited:
+            p = held.pop(s)
+            price = close[s, t]
+            capital = p["shares"] * price
+            sell_fee = fee(capital)
+            cash += capital - sell_fee
+            trades.append((s, p["entry"], t, p["price"], price, p["shares"], p["fee"], sell_fee))
+
+        # 2️⃣ 新开仓：当日有信号、未持有、当日未卖出的股票，按分数排序
+        free = max_positions - len(held)
+        if free > 0:
+            cand = np.flatnonzero(universe.signal[:, t])
+            if len(cand):
+                busy = np.fromiter(list(held.keys()) + exited, dtype=np.int64)
+                cand = cand[~np.isin(cand, busy)]
+                cand = cand[np.argsort(-universe.score[cand, t], kind="stable")]
+                for s in cand:
+                    if free <= 0:
+                        break
+                    price = close[s, t]
+                    budget = cash / free
+                    shares = int(budget / (price * (1 + FEE_RATE)) / LOT) * LOT
+                    if shares <= 0:
+                        continue
+                    capital = price * shares
+                    buy_fee = fee(capital)
+                    cash -= capital + buy_fee
+                    held[int(s)] = {
+                        "entry": t,
+                        "exit": int(universe.exit[s, t]),
+                        "price": price,
+                        "shares": shares,
+                        "fee": buy_fee,
+                    }
+                    free -= 1
+
+        # 3️⃣ 当日净值
+        if held:
+            idx = np.fromiter(held.keys(), dtype=np.int64)
+            shares = np.fromiter((p["shares"] for p in held.values()), dtype=np.float64)
+            market_value[t] = float((shares * close_ffill[idx, t]).sum())
+        equity[t] = cash + market_value[t]
+        positions[t] = len(held)
+
+    # 期末未卖出的持仓
+    for s, p in held.items():
+        trades.append((s, p["entry"], -1, p["price"], np.nan, p["shares"], p["fee"], 0.0))
+
+    curve = pd.DataFrame({
+        "trade_date": pd.to_datetime(calendar),
+        "cash": equity - market_value,
+        "market_value": market_value,
+        "equity": equity,
+        "positions": positions,
+    }).dropna(subset=["equity"])
+
+    ledger = pd.DataFrame([
+        {
+            "code": universe.codes[s],
+            "name": universe.names[s],
+            "entry_date": pd.Timestamp(calendar[entry]),
+            "exit_date": pd.Timestamp(calendar[exit_t]) if exit_t >= 0 else pd.NaT,
+            "entry_price": entry_price,
+            "exit_price": exit_price,
+            "shares": shares,
+            "entry_fee": entry_fee,
+            "exit_fee": exit_fee,
+            "rate": (exit_price - entry_price) * 100.0 / entry_price if exit_t >= 0 else np.nan,
+        }
+        for s, entry, exit_t, entry_price, exit_price, shares, entry_fee, exit_fee in trades
+    ], columns=["code", "name", "entry_date", "exit_date", "entry_price", "exit_price",
+                "shares", "entry_fee", "exit_fee", "rate"])
+
+    return {"fund": fund, "curve": curve, "trades": ledger, "summary": summarize(fund, curve, ledger)}
+
+
+def summarize(fund, curve, ledger):
+    if curve.empty:
+        return {"return": 0.0, "max_drawdown": 0.0, "trades": 0, "win": 0, "lose": 0}
+    equity = curve["equity"].to_numpy()
+    peak = np.maximum.accumulate(equity)
+    closed = ledger.dropna(subset=["rate"])
+    return {
+        "return": float((equity[-1] - fund) * 100.0 / fund),
+        "max_drawdown": float(((peak - equity) / peak).max() * 100.0),
+        "trades": len(closed),
+        "win": int((closed["rate"] >= 0).sum()),
+        "lose": int((closed["rate"] < 0).sum()),
+    }
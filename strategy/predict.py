@@ -11,12 +11,24 @@
 import os
 import re
 import pickle
+import multiprocessing
 import pandas as pd
 import numpy as np
 from glob import glob
+from queue import Empty
 from datetime import datetime, timedelta
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 
+import strategy.backtest as backtest
 from strategy.load_stock import load_stock
+from strategy.compose import compile_plan, StockContext
+from strategy.portfolio import Universe, simulate
+from strategy.result_store import ResultStore, data_version
+from strategy.walk_forward import walk_forward
+from utils.parse import parse_grid, expand
+from utils.stock_summary import has_cheap_cond, prefilter
+from utils.trade_calendar import trade_calendar
 
 # 注册策略
 import strategy.strategy_hub.fish_tub as fish_tub
@@ -45,148 +57,130 @@ DATA_DIR = f"{WORK_DIR}/data"  # 本地数据路径
 # ===============================
 class Predictor:
     def __init__(self, mode, log_callback=None, stop_flag=None):
-        if mode not in mapping:
-            raise ValueError(f"未知策略: {mode}, 支持: {list(mapping.keys())}")
-        self.strategy_module = mapping[mode]
+        # mode 可以是单个策略（表达式），也可以是列表（多策略共享一次数据加载）
+        # 表达式示例: kdj&fish_tub、volumn_break|volumn_detect、!kdj_ready
+        self.multi = isinstance(mode, (list, tuple))
+        self.modes = list(mode) if self.multi else [mode]
+        self.plans = {m: compile_plan(m, mapping) for m in self.modes}
         self.log = log_callback or print
         self.stop_flag = stop_flag
-
-    # -------------------- 内部 buy/sell 调用 --------------------
-    def buy(self, r, status, debug=False):
-        return self.strategy_module.buy(r, status, debug)
-
-    def sell(self, r, status, debug=False):
-        return self.strategy_module.sell(r, status, debug)
+        self.store = None
 
     # -------------------- 回测函数 --------------------
-    def backtesting(self, records, debug=False):
-        fund = 10000
-        status = {
-            "hold": False,
-            "buy": 0,
-            "base": fund,
-            "fund": fund,
-            "capital": 0,
-            "lose": 0,
-            "win": 0,
-            "hand": 0,
-            "days": 0,
-            "record": [],
-            "operations": [],
-        }
-
-        operation = {}
-        for idx, r in records.iterrows():
-            if self.stop_flag and self.stop_flag.is_set():
-                self.log(">>> 用户终止任务")
-                return status
-
-            if idx < 21:
-                continue
-
-            if not status["hold"]:
-                ok, desc = self.buy(r, status, debug)
-                if ok:
-                    status["should_buy"] = True
-                    status["record"].append(r)
-                    operation["operator"] = "买入"
-                    operation["strategy"] = desc
-                    status["hand"] = int(status["fund"] / r["close"] / 100) * 100
-                    capital = r["close"] * status["hand"]
-                    status["fund"] -= capital
-                    status["fund"] -= min(capital * 0.00026, 5)
-                    status["buy"] = r["close"]
-                    operation["trade_date"] = r["trade_date"]
-                    operation["hand"] = status["hand"]
-                    operation["price"] = r["close"]
-                    operation["capital"] = capital
-                    status["capital"] = capital
-                    operation["cash_flow"] = status["fund"]
-                    operation["rate"] = 0
-                    status["operations"].append(operation)
-                    operation = {}
-                    status["hold"] = True
-
-            else:
-                status["days"] += 1
-                status["record"].append(r)
-                capital = status["hand"] * r["close"]
-                status["capital"] = capital
-                ok, desc = self.sell(r, status, debug)
-                if ok:
-                    status["hold"] = False
-                    status["days"] = 0
-                    capital = status["hand"] * r["close"]
-                    status["fund"] += capital
-                    status["fund"] -= min(capital * 0.00026, 5)
-                    rate = (r["close"] - status["buy"]) * 100.0 / status["buy"]
-                    if rate >= 0:
-                        status["win"] += 1
-                    else:
-                        status["lose"] += 1
-                    operation["operator"] = "卖出"
-                    operation["trade_date"] = r["trade_date"]
-                    operation["hand"] = status["hand"]
-                    operation["price"] = r["close"]
-                    operation["capital"] = 0
-                    status["capital"] = 0
-                    operation["cash_flow"] = status["fund"]
-                    operation["strategy"] = desc
-                    operation["rate"] = rate
-                    status["operations"].append(operation)
-                    operation = {}
-                    status["hand"] = 0
-                    status["record"] = []
-
+    def backtesting(self, ctx, plan, debug=False, state=None):
+        """state: 上次回测的引擎检查点，给定时只计算检查点之后新增的行"""
+        records = plan.records(ctx)
+        start = state["next"] if state else backtest.WARMUP
+        signal, signal_desc = plan.buy_signal(ctx, start, len(records))
+
+        def sell(i, status):
+            return plan.sell(ctx, i, status, debug)
+
+        status = backtest.run(
+            ctx.columns(plan.leaves[0]), signal, signal_desc, sell,
+            stop_flag=self.stop_flag, state=state,
+        )
+        if status["stopped"]:
+            self.log(">>> 用户终止任务")
         return status
 
     # -------------------- 执行股票任务 --------------------
-    def excute(self, code, ktype, operate, tuning, cond, path, target_date, debug=False):
+    def excute(self, code, ktype, operate, tuning, cond, path, target_date, debug=False, cache=False):
+        """
+        加载一次股票数据，依次执行所有策略
+        cache=True 时回测结果从结果库读取，只有数据变更过的股票才重新计算；
+        若新数据只是在上次回测的数据末尾追加了若干行，则从检查点续跑，只处理新增的行
+        返回: {策略名: 结果}，只包含命中的策略
+        """
+        hits = {}
+        modes = self.modes
+        keys = {}
+        states = {}
+        if cache and operate == "back_test":
+            store = self.result_store()
+            version = data_version(code, ktype, path)
+            for mode in modes:
+                keys[mode] = store.key(mode, tuning, code, cond, None, target_date, version)
+                status = store.get(keys[mode])
+                if status is not None:
+                    hits[mode] = self.report(self.plans[mode], code, status["name"], path, status)
+            modes = [m for m in modes if m not in hits]
+            if not modes:
+                return hits
+            states = {m: store.checkpoint(keys[m]) for m in modes}
+
         # 加载股票数据
         ok, stock = load_stock(code, cond, path, target_date, ktype)
         if not ok:
             if debug:
                 self.log(f"⚠️ 股票 {code} 数据加载失败: {stock}")
-            return False, ""
-
-        # 数据预处理
-        self.strategy_module.pretreatment(stock, operate, tuning, debug)
-        records = stock["records"]
+            return hits
+
+        if states:
+            records = stock["records"]
+            raw = {"trade_date": records["trade_date"].array, "close": records["close"].to_numpy()}
+            states = {m: st for m, st in states.items() if backtest.can_resume(raw, st)}
+            # 各策略共享预处理结果，只有全部策略都能续跑时才跳过历史行的预处理
+            if len(states) == len(modes):
+                stock["process_from"] = min(backtest.resume_from(st) for st in states.values())
+
+        # 所有策略（及组合表达式中的各个子策略）共享同一个上下文，
+        # 每个子策略的预处理与买入信号只计算一次
+        ctx = StockContext(stock, operate, tuning, mapping, debug)
+        for mode in modes:
+            ok, res = self.evaluate(self.plans[mode], ctx, operate, path, debug, keys.get(mode), states.get(mode))
+            if ok and res:
+                hits[mode] = res
+        return hits
+
+    def result_store(self):
+        if self.store is None:
+            self.store = ResultStore()
+        return self.store
+
+    def report(self, plan, code, name, path, status):
+        """输出回测操作日志与汇总"""
+        for op in status["operations"]:
+            op_str = (
+                f"操作 {op['operator']}\n"
+                f"日期 {op['trade_date']}\n"
+                f"股份 {op['hand']} 手\n"
+                f"股价 {op['price']}\n"
+                f"涨跌 {op['rate']:.2f}%\n"
+                f"持仓 {op['capital']}\n"
+                f"现金 {op['cash_flow']}\n"
+                f"策略 {op['strategy']}\n\n"
+            )
+            self.log(op_str)
+        summary = (
+            f"========= summary ===========\n"
+            f"代码: {code}\n"
+            f"名称: {name}\n"
+            f"量化策略: {plan.name}\n"
+            f"数据路径: {path}\n"
+            f"涨跌: {backtest.total_return(status):.2f}%\n"
+            f"胜率: 总计 {status['win'] + status['lose']} 轮操作, 取胜 {status['win']} 轮\n"
+            f"============================\n"
+        )
+        self.log(summary)
+        return summary
+
+    def evaluate(self, plan, ctx, operate, path, debug=False, store_key=None, state=None):
+        stock = ctx.stock
+        records = plan.records(ctx)
 
         if operate == "back_test":
-            status = self.backtesting(records, debug)
-            # 输出操作日志
-            for op in status["operations"]:
-                op_str = (
-                    f"操作 {op['operator']}\n"
-                    f"日期 {op['trade_date']}\n"
-                    f"股份 {op['hand']} 手\n"
-                    f"股价 {op['price']}\n"
-                    f"涨跌 {op['rate']:.2f}%\n"
-                    f"持仓 {op['capital']}\n"
-                    f"现金 {op['cash_flow']}\n"
-                    f"策略 {op['strategy']}\n\n"
-                )
-                self.log(op_str)
-            # capital = status["operations"][-1]["capital"] if status["operations"] else 0
-            capital = status["capital"]
-            summary = (
-                f"========= summary ===========\n"
-                f"代码: {code}\n"
-                f"名称: {stock['name']}\n"
-                f"量化策略: {self.strategy_module.__name__}\n"
-                f"数据路径: {path}\n"
-                f"涨跌: {(status['fund'] + capital - status['base']) * 100.0 / status['base']:.2f}%\n"
-                f"胜率: 总计 {status['win'] + status['lose']} 轮操作, 取胜 {status['win']} 轮\n"
-                f"============================\n"
-            )
-            self.log(summary)
-            return True, summary
+            status = self.backtesting(ctx, plan, debug, state)
+            if store_key and not status["stopped"]:
+                self.result_store().put(store_key, stock["name"], ctx.columns(plan.leaves[0]), status)
+            return True, self.report(plan, stock["code"], stock["name"], path, status)
 
         elif operate == "buy":
-            r = records.iloc[-1]
-            ok, desc = self.buy(r, {}, debug)
-            if ok:
+            n = len(records)
+            signal, signal_desc = plan.buy_signal(ctx, n - 1, n)
+            if signal[-1]:
+                r = records.iloc[-1]
+                desc = signal_desc(n - 1)
                 close = r["close"]
                 market = round(stock['market_cap'] / 10000 / 10000, 2)
                 amount = round(stock['amount'] / 10000 / 10000, 2)
@@ -198,19 +192,141 @@ class Predictor:
         return False, ""
 
     # -------------------- 主 predict 函数 --------------------
-    def predict(self, code, ktype, operate, tuning="", cond=None, path=None, target_date=None, debug=False, cache=False, progress_callback=None):
-        codes = []
-        if code == "all":
-            info_files = glob(os.path.join(DATA_DIR, "*_info.csv"))
-            codes = [os.path.basename(f).split("_")[0] for f in info_files]
-        elif "file" in code:
-            file = code.split(",")[1]
-            codes = self.get_codes_from_file(file)
+    def predict(self, code, ktype, operate, tuning="", cond=None, path=None, target_date=None, debug=False, cache=False, progress_callback=None, workers=1):
+        """
+        单策略返回结果列表；多策略返回 {策略名: 结果列表}
+        workers > 1 时股票列表按顺序分片交给进程池，结果顺序与单进程一致
+        """
+        results = {mode: [] for mode in self.modes}
+        for _, mode, res in self.iter_predict(code, ktype, operate, tuning, cond, path, target_date, debug, cache, progress_callback, workers, ordered=True):
+            results[mode].append(res)
+
+        if self.multi:
+            return results
+        return results[self.modes[0]]
+
+    def iter_predict(self, code, ktype, operate, tuning="", cond=None, path=None, target_date=None, debug=False, cache=False, progress_callback=None, workers=1, ordered=False):
+        """
+        逐条产出命中结果 (代码, 策略名, 结果)，不在内存中累积
+        ordered=False 时多进程结果按完成先后产出；ordered=True 时按股票列表顺序产出
+        """
+        codes = self.prefilter(self.resolve_codes(code), cond, ktype, path)
+
+        if workers > 1 and len(codes) > 1:
+            hits_iter = self.iter_parallel(codes, ktype, operate, tuning, cond, path, target_date, debug, cache, progress_callback, workers)
         else:
-            codes = code.split(",")
+            hits_iter = self.iter_serial(codes, ktype, operate, tuning, cond, path, target_date, debug, cache, progress_callback)
+
+        pending = {}
+        expect = 0
+        for idx, c, hits in hits_iter:
+            if not ordered:
+                for mode, res in hits.items():
+                    yield c, mode, res
+                continue
+            # 按顺序产出：先到的结果暂存，直到前面的股票都已完成
+            pending[idx] = (c, hits)
+            while expect in pending:
+                c, hits = pending.pop(expect)
+                for mode, res in hits.items():
+                    yield c, mode, res
+                expect += 1
+        # 中途终止时，剩余已完成的结果按顺序补齐
+        for idx in sorted(pending):
+            c, hits = pending[idx]
+            for mode, res in hits.items():
+                yield c, mode, res
+
+    def iter_serial(self, codes, ktype, operate, tuning, cond, path, target_date, debug, cache, progress_callback):
+        total = len(codes)
+        for idx, c in enumerate(codes):
+            if self.stop_flag and self.stop_flag.is_set():
+                self.log(">>> 用户终止任务")
+                break
 
+            if progress_callback:
+                progress_callback(idx + 1, total, c)
+
+            yield idx, c, self.excute(c, ktype, operate, tuning, cond, path, target_date, debug, cache)
+
+    def iter_parallel(self, codes, ktype, operate, tuning, cond, path, target_date, debug, cache, progress_callback, workers):
+        """
+        子进程每完成一只股票，通过有界队列回传 (日志, 结果)：消费方处理不过来时子进程阻塞，内存占用有上限
+        stop_flag 置位（或调用方提前结束迭代）后取消未开始的分片，并通知运行中的子进程在当前股票后退出
+        产出: (股票下标, 代码, {策略名: 结果})，按完成先后
+        """
+        ctx = multiprocessing.get_context()
+        queue = ctx.Queue(maxsize=workers * 8)
+        stop_event = ctx.Event()
+        n_chunks = min(len(codes), workers * 4)
+        size = -(-len(codes) // n_chunks)
+        mode = self.modes if self.multi else self.modes[0]
+
+        done = 0
+        finished = set()
+        stopped = False
+        executor = ProcessPoolExecutor(max_workers=workers, mp_context=ctx, initializer=init_worker, initargs=(queue, stop_event))
+        futures = [
+            executor.submit(predict_chunk, k, offset, mode, codes[offset:offset + size], ktype, operate, tuning, cond, path, target_date, debug, cache)
+            for k, offset in enumerate(range(0, len(codes), size))
+        ]
+        try:
+            while len(finished) < len(futures):
+                if not stopped and self.stop_flag and self.stop_flag.is_set():
+                    stopped = True
+                    stop_event.set()
+                    self.log(">>> 用户终止任务")
+                    for k, f in enumerate(futures):
+                        if f.cancel():
+                            finished.add(k)
+
+                try:
+                    kind, k, item = queue.get(timeout=0.1)
+                except Empty:
+                    # 子进程异常退出时不会再有消息
+                    for k, f in enumerate(futures):
+                        if k not in finished and f.done() and isinstance(f.exception(), BrokenProcessPool):
+                            finished.add(k)
+                    continue
+
+                if kind == "result":
+                    idx, c, hits, lines = item
+                    for line in lines:
+                        self.log(line)
+                    done += 1
+                    if progress_callback:
+                        progress_callback(done, len(codes), c)
+                    yield idx, c, hits
+                elif kind == "log":
+                    for line in item:
+                        self.log(line)
+                elif kind == "done":
+                    finished.add(k)
+        finally:
+            # 调用方提前结束迭代时：通知子进程退出，并清空队列使阻塞在 put 上的子进程得以返回
+            stop_event.set()
+            for f in futures:
+                f.cancel()
+            while not all(f.done() for f in futures):
+                try:
+                    queue.get(timeout=0.1)
+                except Empty:
+                    pass
+            executor.shutdown()
+
+    # -------------------- 组合回测 --------------------
+    def portfolio(self, code, ktype, tuning="", cond=None, path=None, target_date=None, fund=100000, max_positions=10, rank="amount", debug=False, progress_callback=None):
+        """
+        全市场组合回测：每只股票只加载一次，生成 (股票 × 交易日) 的信号与卖出位置，
+        再按交易日历统一推进，共享资金池
+        rank: 排名所用列，默认成交额从高到低，前缀 "-" 表示从低到高
+        单策略返回结果字典；多策略返回 {策略名: 结果字典}
+        """
+        codes = self.prefilter(self.resolve_codes(code), cond, ktype, path)
         total = len(codes)
-        results = []
+        universes = {mode: Universe() for mode in self.modes}
+        sign = -1.0 if rank.startswith("-") else 1.0
+        rank_col = rank.lstrip("-")
 
         for idx, c in enumerate(codes, start=1):
             if self.stop_flag and self.stop_flag.is_set():
@@ -220,11 +336,161 @@ class Predictor:
             if progress_callback:
                 progress_callback(idx, total, c)
 
-            ok, res = self.excute(c, ktype, operate, tuning, cond, path, target_date, debug)
-            if ok and res:
-                results.append(res)
+            ok, stock = load_stock(c, cond, path, target_date, ktype)
+            if not ok:
+                if debug:
+                    self.log(f"⚠️ 股票 {c} 数据加载失败: {stock}")
+                continue
 
-        return results
+            ctx = StockContext(stock, "back_test", tuning, mapping, debug)
+            for mode in self.modes:
+                plan = self.plans[mode]
+                cols = ctx.columns(plan.leaves[0])
+                signal, _ = plan.buy_signal(ctx, backtest.WARMUP, len(cols["close"]))
+
+                def sell(i, status):
+                    return plan.sell(ctx, i, status, debug)
+
+                exits = np.full(len(signal), -1, dtype=np.int64)
+                for i in np.flatnonzero(signal):
+                    exits[i], _ = backtest.find_exit(cols, i, sell)
+
+                score = cols[rank_col] if rank_col in cols else np.zeros(len(signal))
+                universes[mode].add(c, stock["name"], cols["trade_date"], cols["close"], signal, exits, sign * score)
+
+        # 按共享交易日历对齐（没有基准数据时退回各股日期的并集）
+        calendar = trade_calendar(ktype=ktype, fallback=True)
+        results = {}
+        for mode in self.modes:
+            universe = universes[mode].build(calendar)
+            res = simulate(universe, fund, max_positions, self.stop_flag)
+            summary = res["summary"]
+            self.log(
+                f"========= portfolio ===========\n"
+                f"量化策略: {self.plans[mode].name}\n"
+                f"股票数量: {len(universe.codes)}\n"
+                f"交易日数: {len(universe.calendar)}\n"
+                f"初始资金: {fund}, 最大持仓: {max_positions}, 排名: {rank}\n"
+                f"涨跌: {summary['return']:.2f}%\n"
+                f"最大回撤: {summary['max_drawdown']:.2f}%\n"
+                f"胜率: 总计 {summary['trades']} 轮操作, 取胜 {summary['win']} 轮\n"
+                f"===============================\n"
+            )
+            results[mode] = res
+
+        if self.multi:
+            return results
+        return results[self.modes[0]]
+
+    # -------------------- 历史信号回放 --------------------
+    def replay(self, code, ktype, start, end=None, tuning="", cond=None, path=None, output=None, debug=False, progress_callback=None):
+        """
+        回放 [start, end] 区间内每个交易日 buy 的结果，等价于逐日以 target_date 调用 buy，
+        但每只股票只加载、预处理一次：指标只依赖当日及以前的行情，截断与否结果相同
+        cond 的市值/成交额按最新数据判断
+        返回: DataFrame(date, code, strategy, desc)，按日期、股票顺序排列
+        """
+        codes = self.prefilter(self.resolve_codes(code), cond, ktype, path)
+        total = len(codes)
+        start = np.datetime64(pd.to_datetime(start).date(), "D")
+        rows = []
+
+        for idx, c in enumerate(codes, start=1):
+            if self.stop_flag and self.stop_flag.is_set():
+                self.log(">>> 用户终止任务")
+                break
+
+            if progress_callback:
+                progress_callback(idx, total, c)
+
+            ok, stock = load_stock(c, cond, path, end, ktype)
+            if not ok:
+                if debug:
+                    self.log(f"⚠️ 股票 {c} 数据加载失败: {stock}")
+                continue
+
+            dates = stock["records"]["trade_date"].to_numpy().astype("datetime64[D]")
+            first = int(np.searchsorted(dates, start))
+            if first >= len(dates):
+                continue
+            # 区间之前的行只作为指标的历史窗口，不需要逐行预处理
+            stock["process_from"] = first
+
+            ctx = StockContext(stock, "back_test", tuning, mapping, debug)
+            for mode in self.modes:
+                signal, desc = self.plans[mode].buy_signal(ctx, first, len(dates))
+                for i in np.flatnonzero(signal):
+                    rows.append((pd.Timestamp(dates[i]).date(), c, mode, desc(i)))
+
+        table = pd.DataFrame(rows, columns=["date", "code", "strategy", "desc"])
+        table = table.sort_values(["date"], kind="stable").reset_index(drop=True)
+        self.log(
+            f"========= replay ===========\n"
+            f"量化策略: {', '.join(self.plans[m].name for m in self.modes)}\n"
+            f"区间: {start} ~ {end or '最新'}\n"
+            f"股票数量: {total}\n"
+            f"买入信号: {len(table)} 次，涉及 {table['date'].nunique()} 个交易日\n"
+            f"============================\n"
+        )
+        if output:
+            table.to_csv(output, index=False)
+            self.log(f"回放结果已写入 {output}")
+        return table
+
+    # -------------------- 滚动窗口寻优 --------------------
+    def walk_forward(self, code, ktype, grid, cond=None, path=None, train=250, test=60, step=None, samples=0, workers=4, output=None, debug=False, progress_callback=None):
+        """
+        walk_forward 模式：每个窗口在训练期选出最优参数，再在紧随其后的测试期做样本外回测
+        grid: 参数空间，格式见 utils.parse.parse_grid
+        单策略返回结果表；多策略返回 {策略名: 结果表}
+        """
+        codes = self.prefilter(self.resolve_codes(code), cond, ktype, path)
+        tunings = expand(parse_grid(grid), samples)
+        if not tunings:
+            raise ValueError(f"参数空间为空: {grid}")
+
+        results = {}
+        for mode in self.modes:
+            table = walk_forward(
+                mode, codes, tunings, train, test, step, workers, ktype, cond, path,
+                log=self.log, progress_callback=progress_callback, stop_flag=self.stop_flag,
+            )
+            if not table.empty:
+                self.log(
+                    f"========= walk forward ===========\n"
+                    f"量化策略: {self.plans[mode].name}\n"
+                    f"{table.to_string(index=False)}\n"
+                    f"样本外平均涨跌: {table['test_return'].mean():.2f}%\n"
+                    f"==================================\n"
+                )
+                if output:
+                    name = output if len(self.modes) == 1 else f"{os.path.splitext(output)[0]}_{len(results)}.csv"
+                    table.to_csv(name, index=False)
+            results[mode] = table
+
+        if self.multi:
+            return results
+        return results[self.modes[0]]
+
+    def resolve_codes(self, code):
+        if code == "all":
+            info_files = glob(os.path.join(DATA_DIR, "*_info.csv"))
+            return [os.path.basename(f).split("_")[0] for f in info_files]
+        elif "file" in code:
+            file = code.split(",")[1]
+            return self.get_codes_from_file(file)
+        return code.split(",")
+
+    def prefilter(self, codes, cond, ktype, path=None):
+        """
+        加载行情前先用摘要表（市值、成交额、交易所、板块、上市天数）筛掉不满足条件的股票，
+        只读取 info 文件和行情文件末尾几行，且摘要按文件状态缓存
+        """
+        if path or not has_cheap_cond(cond):
+            return codes
+        kept = prefilter(codes, cond, ktype)
+        self.log(f"预筛选: {len(codes)} 只股票中 {len(kept)} 只满足条件 {cond}")
+        return kept
 
     @staticmethod
     def get_codes_from_file(path):
@@ -232,6 +498,40 @@ class Predictor:
             lines = [line.strip() for line in f.readlines()]
         return lines
 
+# ===============================
+# 多进程执行（子进程中运行）
+# ===============================
+_queue = None
+_stop_event = None
+
+
+def init_worker(queue, stop_event):
+    global _queue, _stop_event
+    _queue = queue
+    _stop_event = stop_event
+
+
+def predict_chunk(k, offset, mode, codes, ktype, operate, tuning, cond, path, target_date, debug, cache):
+    """逐只执行一个分片，每只股票的日志与结果作为一条消息回传"""
+    lines = []
+    predictor = Predictor(mode, log_callback=lines.append, stop_flag=_stop_event)
+    n = 0
+    try:
+        for n, c in enumerate(codes):
+            if _stop_event.is_set():
+                break
+            hits = predictor.excute(c, ktype, operate, tuning, cond, path, target_date, debug, cache)
+            # 终止提示由主进程统一输出
+            out = [] if _stop_event.is_set() else list(lines)
+            lines.clear()
+            _queue.put(("result", k, (offset + n, c, hits, out)))
+    except Exception as e:
+        _queue.put(("log", k, lines + [f"⚠️ 分片执行失败: {e!r}"]))
+    finally:
+        _queue.put(("done", k, None))
+    return n
+
+
 # ===============================
 # 命令行支持
 # ===============================
@@ -242,17 +542,41 @@ if __name__ == "__main__":
 
     parser.add_argument("-c", "--code", required=True)
     parser.add_argument("-k", "--ktype", type=int, default=1)
-    parser.add_argument("-m", "--mode", required=True)
-    parser.add_argument("-o", "--operate", required=True)
+    parser.add_argument("-m", "--mode", required=True, help="策略名或组合表达式(kdj&fish_tub, a|b, !a)，多个用逗号分隔")
+    parser.add_argument("-o", "--operate", required=True, help="buy|back_test|portfolio|walk_forward|replay")
     parser.add_argument("-t", "--tuning", default="")
     parser.add_argument("-s", "--stock_cond", default="")
     parser.add_argument("-p", "--path")
-    parser.add_argument("-q", "--date")
+    parser.add_argument("-q", "--date", help="截止日期（replay 为回放结束日期）")
+    parser.add_argument("--start", help="回放起始日期")
     parser.add_argument("-d", "--debug", action="store_true")
-    parser.add_argument("-u", "--use_cache", type=bool, default=False)
+    parser.add_argument("-u", "--use_cache", action="store_true", help="回测结果优先从结果库读取")
+    parser.add_argument("--fund", type=float, default=100000, help="组合回测初始资金")
+    parser.add_argument("--max_positions", type=int, default=10, help="组合回测最大持仓数")
+    parser.add_argument("--rank", default="amount", help="组合回测排名列，前缀 - 表示升序")
+    parser.add_argument("--output", help="组合回测净值曲线 / 滚动寻优 / 信号回放结果输出 CSV")
+    parser.add_argument("-g", "--grid", help="滚动寻优参数空间，如 volumn_amplify=1.5|2|2.5;rise=0.1~0.3")
+    parser.add_argument("--samples", type=int, default=0, help="滚动寻优随机抽样组数")
+    parser.add_argument("--train", type=int, default=250, help="滚动寻优训练期（交易日）")
+    parser.add_argument("--test", type=int, default=60, help="滚动寻优测试期（交易日）")
+    parser.add_argument("--step", type=int, help="窗口滚动步长（交易日），默认等于测试期")
+    parser.add_argument("-w", "--workers", type=int, default=1, help="进程数（buy/back_test/walk_forward），默认单进程")
 
     args = parser.parse_args()
 
-    predictor = Predictor(args.mode)
-    predictor.predict(args.code, args.ktype, args.operate, args.tuning, args.stock_cond, args.path, args.date, args.debug, args.use_cache)
+    modes = args.mode.split(",")
+    predictor = Predictor(modes if len(modes) > 1 else modes[0])
+    if args.operate == "portfolio":
+        res = predictor.portfolio(args.code, args.ktype, args.tuning, args.stock_cond, args.path, args.date, args.fund, args.max_positions, args.rank, args.debug)
+        if args.output and len(modes) == 1:
+            res["curve"].to_csv(args.output, index=False)
+            res["trades"].to_csv(os.path.splitext(args.output)[0] + "_trades.csv", index=False)
+    elif args.operate == "replay":
+        if not args.start:
+            parser.error("replay 需要 --start")
+        predictor.replay(args.code, args.ktype, args.start, args.date, args.tuning, args.stock_cond, args.path, args.output, args.debug)
+    elif args.operate == "walk_forward":
+        predictor.walk_forward(args.code, args.ktype, args.grid, args.stock_cond, args.path, args.train, args.test, args.step, args.samples, args.workers, args.output, args.debug)
+    else:
+        predictor.predict(args.code, args.ktype, args.operate, args.tuning, args.stock_cond, args.path, args.date, args.debug, args.use_cache, workers=args.workers)
 
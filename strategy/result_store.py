@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+@file: result_store.py
+@author: vanilla
+@date: 2025-10-25
+@desc: 回测结果持久化：按 (策略, 参数, 代码, 筛选条件, 日期区间, 数据版本) 索引，账本/净值以紧凑数组存储。
+"""
+
+import os
+import json
+import sqlite3
+import hashlib
+import threading
+import numpy as np
+import pandas as pd
+from datetime import datetime
+
+import utils.config as config
+import strategy.backtest as backtest
+from utils.meta_index import meta_index
+
+
+STORE_PATH = os.environ.get("STOCK_RESULT_STORE", f"{config.DATA_DIR}/backtest.db")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    strategy TEXT NOT NULL,
+    tuning TEXT NOT NULL,
+    code TEXT NOT NULL,
+    cond TEXT NOT NULL,
+    start_date TEXT NOT NULL,
+    end_date TEXT NOT NULL,
+    data_version TEXT NOT NULL,
+    name TEXT,
+    return REAL,
+    trades INTEGER,
+    win INTEGER,
+    lose INTEGER,
+    base REAL,
+    fund REAL,
+    capital REAL,
+    first_date TEXT,
+    last_date TEXT,
+    created TEXT,
+    dates BLOB,
+    equity BLOB,
+    ledger BLOB,
+    descs TEXT,
+    state TEXT,
+    UNIQUE (strategy, tuning, code, cond, start_date, end_date, data_version)
+);
+CREATE INDEX IF NOT EXISTS idx_runs_code ON runs (code);
+CREATE INDEX IF NOT EXISTS idx_runs_strategy ON runs (strategy, tuning);
+"""
+
+
+def data_version(code, ktype=1, path=None):
+    """
+    数据文件版本，文件不存在返回 None
+    默认路径的行情文件用元数据索引里的内容摘要（只改了修改时间不会让缓存失效），
+    指定路径的文件和 info 文件用大小 + 修改时间
+    """
+    data_file = path or config.default_data_path(code, ktype)
+    info_file = config.default_info_path(code, ktype)
+    parts = []
+    for f in (data_file, info_file):
+        if not os.path.exists(f):
+            return None
+        meta = meta_index().get(code, ktype, f) if f == config.default_data_path(code, ktype) else None
+        if meta is not None:
+            parts.append(meta["hash"])
+        else:
+            st = os.stat(f)
+            parts.append(f"{st.st_size}:{st.st_mtime_ns}")
+    return hashlib.sha1("|".join(parts).encode()).hexdigest()[:16]
+
+
+class ResultStore:
+    def __init__(self, path=None):
+        self.path = path or STORE_PATH
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.local = threading.local()
+        with self.conn() as conn:
+            conn.executescript(SCHEMA)
+            # 旧库没有检查点列
+            fields = [r[1] for r in conn.execute("PRAGMA table_info(runs)")]
+            if "state" not in fields:
+                conn.execute("ALTER TABLE runs ADD COLUMN state TEXT")
+
+    def conn(self):
+        # sqlite 连接不能跨线程共享，每个线程一个
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self.local.conn = conn
+        return conn
+
+    @staticmethod
+    def key(strategy, tuning, code, cond, start_date, end_date, version):
+        return (strategy, tuning or "", code, cond or "", str(start_date or ""), str(end_date or ""), version)
+
+    # -------------------- 读取 --------------------
+    def get(self, key):
+        """命中返回与 backtest.run 相同字段的 status 字典，未命中返回 None"""
+        if key[-1] is None:
+            return None
+        row = self.conn().execute(
+            "SELECT name, base, fund, capital, win, lose, dates, equity, ledger, descs FROM runs "
+            "WHERE strategy=? AND tuning=? AND code=? AND cond=? AND start_date=? AND end_date=? AND data_version=?",
+            key,
+        ).fetchone()
+        if row is None:
+            return None
+        name, base, fund, capital, win, lose, dates, equity, ledger, descs = row
+        dates = pd.to_datetime(np.frombuffer(dates, dtype="datetime64[D]")).array
+        descs = json.loads(descs)
+        ledger = np.frombuffer(ledger, dtype=backtest.LEDGER_DTYPE).copy()
+        return {
+            "name": name,
+            "base": base,
+            "fund": fund,
+            "capital": capital,
+            "win": win,
+            "lose": lose,
+            "stopped": False,
+            "ledger": ledger,
+            "equity": np.frombuffer(equity, dtype=np.float64),
+            "dates": dates,
+            "buy_descs": descs["buy"],
+            "sell_descs": descs["sell"],
+            "operations": backtest.operations({"trade_date": dates}, ledger, descs["buy"], descs["sell"]),
+        }
+
+    def checkpoint(self, key):
+        """
+        同一 (策略, 参数, 代码, 条件, 区间) 最近一次回测的引擎检查点，不限数据版本
+        返回可直接传给 backtest.run(state=...) 的字典，没有则返回 None
+        """
+        row = self.conn().execute(
+            "SELECT state, ledger, descs FROM runs "
+            "WHERE strategy=? AND tuning=? AND code=? AND cond=? AND start_date=? AND end_date=?",
+            key[:-1],
+        ).fetchone()
+        if row is None or not row[0]:
+            return None
+        state, ledger, descs = row
+        state = json.loads(state)
+        descs = json.loads(descs)
+        state["ledger"] = np.frombuffer(ledger, dtype=backtest.LEDGER_DTYPE).copy()
+        state["buy_descs"] = descs["buy"]
+        state["sell_descs"] = descs["sell"]
+        return state
+
+    def query(self, strategy=None, code=None, tuning=None):
+        """按条件查询汇总指标（不含数组）"""
+        sql = ("SELECT strategy, tuning, code, cond, start_date, end_date, data_version, name, return, "
+               "trades, win, lose, first_date, last_date, created FROM runs WHERE 1=1")
+        args = []
+        for col, val in (("strategy", strategy), ("code", code), ("tuning", tuning)):
+            if val is not None:
+                sql += f" AND {col}=?"
+                args.append(val)
+        return pd.read_sql_query(sql, self.conn(), params=args)
+
+    # -------------------- 写入 --------------------
+    def put(self, key, name, cols, status):
+        dates = np.asarray(cols["trade_date"], dtype="datetime64[D]")
+        equity = backtest.equity_curve(cols, status)
+        descs = {"buy": status["buy_descs"], "sell": status["sell_descs"]}
+        conn = self.conn()
+        with conn:
+            # 数据更新后旧版本的结果不会再被命中，直接替换
+            conn.execute(
+                "DELETE FROM runs WHERE strategy=? AND tuning=? AND code=? AND cond=? AND start_date=? "
+                "AND end_date=? AND data_version!=?",
+                key,
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO runs (strategy, tuning, code, cond, start_date, end_date, data_version, "
+                "name, return, trades, win, lose, base, fund, capital, first_date, last_date, created, "
+                "dates, equity, ledger, descs, state) VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)",
+                key + (
+                    name,
+                    float(backtest.total_return(status)),
+                    int(status["win"] + status["lose"]),
+                    int(status["win"]),
+                    int(status["lose"]),
+                    float(status["base"]),
+                    float(status["fund"]),
+                    float(status["capital"]),
+                    str(dates[0]) if len(dates) else "",
+                    str(dates[-1]) if len(dates) else "",
+                    datetime.now().isoformat(timespec="seconds"),
+                    dates.tobytes(),
+                    equity.astype(np.float64).tobytes(),
+                    status["ledger"].tobytes(),
+                    json.dumps(descs, ensure_ascii=False),
+                    json.dumps(status.get("state")) if status.get("state") else None,
+                ),
+            )
+
+    def purge(self, code=None):
+        """删除某只股票（或全部）的旧版本结果"""
+        conn = self.conn()
+        with conn:
+            if code is None:
+                conn.execute("DELETE FROM runs")
+            else:
+                conn.execute("DELETE FROM runs WHERE code=?", (code,))
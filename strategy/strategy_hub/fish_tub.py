@@ -12,6 +12,8 @@ import os
 import numpy as np
 import utils.indicator as indicator
 
+TUNING_KEYS = ()  # 预处理不读取参数
+
 
 def is_slope_increasing(arr):
     """
@@ -49,7 +51,7 @@ def pretreatment(stock, operate, tuning, debug):
     if operate == "back_test":
         # records["ma120"] = records["close"].rolling(window=120, min_periods=120).mean().fillna(0)
         # indicator.ma(records, 30, 0)
-        for idx in range(len(records)):
+        for idx in range(stock.get("process_from", 0), len(records)):
             data_processing(idx)
     if operate == "buy" or operate == "sell":
         # indicator.ma(records, 30, len(records) - 1)
@@ -14,6 +14,8 @@ import numpy as np
 from datetime import datetime, timedelta
 from utils.load_info import load_stock_data
 
+TUNING_KEYS = ()  # 预处理不读取参数
+
 
 def is_rising(arr):
     """
@@ -75,7 +77,7 @@ def pretreatment(stock, operate, tuning, debug):
                 records.loc[idx, "ma20_rising"] = is_continuous_rising(ma20_recent)
 
     if operate == "back_test":
-        for idx in range(len(records)):
+        for idx in range(stock.get("process_from", 0), len(records)):
             data_processing(idx)
     if operate == "buy" or operate == "sell":
         data_processing(len(records) - 1)
@@ -11,6 +11,8 @@
 import os
 import numpy as np
 
+TUNING_KEYS = ()  # 预处理不读取参数
+
 
 def is_slope_increasing(arr):
     """
@@ -57,7 +59,7 @@ def pretreatment(stock, operate, tuning, debug):
                 records.loc[idx, "cross_ready"] = False
 
     if operate == "back_test":
-        for idx in range(len(records)):
+        for idx in range(stock.get("process_from", 0), len(records)):
             data_processing(idx)
     if operate == "buy" or operate == "sell":
         data_processing(len(records) - 1)
@@ -8,6 +8,8 @@
 
 import numpy as np
 
+TUNING_KEYS = ()  # 预处理不读取参数
+
 # ✅ 解析参数字符串，例如 "prev=5,volumn_amplify=2"
 def parse_tuning(tuning_str: str):
     result = {}
@@ -82,7 +84,7 @@ def pretreatment(stock, operate, tuning=None, debug=False):
 
     # ✅ 调度模式：批量 or 单点处理
     if operate == "back_test":
-        for i in range(len(records)):
+        for i in range(stock.get("process_from", 0), len(records)):
             data_processing(i)
     elif operate in ("buy", "sell"):
         data_processing(len(records) - 1)
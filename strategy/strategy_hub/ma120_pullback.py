@@ -8,6 +8,9 @@
 """
 
 import numpy as np
+from utils.parse import parse_tuning
+
+TUNING_KEYS = ("ma_diff_ratio_limit", "hist_diff_ratio_limit")
 
 
 # ======================================================
@@ -33,11 +36,9 @@ def pretreatment(stock, operate, tuning=None, debug=False):
     """
     预处理阶段完成所有“计算型条件”，buy 中只判断状态
 
-    tuning 参数示例：
-    {
-        "ma_diff_ratio_limit": 0.10,     # 条件3：MA20/MA120 距离比例
-        "hist_diff_ratio_limit": 0.30    # 条件4：历史最大距离
-    }
+    tuning 参数示例："ma_diff_ratio_limit=0.10,hist_diff_ratio_limit=0.30"
+        ma_diff_ratio_limit      # 条件3：MA20/MA120 距离比例
+        hist_diff_ratio_limit    # 条件4：历史最大距离
     """
     records = stock["records"].copy()
 
@@ -45,6 +46,7 @@ def pretreatment(stock, operate, tuning=None, debug=False):
     ma_diff_ratio_limit = 0.05
     hist_diff_ratio_limit = 0.20
     pullback_cycle = 60
+    tuning = parse_tuning(tuning)
     if tuning:
         ma_diff_ratio_limit = tuning.get("ma_diff_ratio_limit", ma_diff_ratio_limit)
         hist_diff_ratio_limit = tuning.get("hist_diff_ratio_limit", hist_diff_ratio_limit)
@@ -59,7 +61,7 @@ def pretreatment(stock, operate, tuning=None, debug=False):
     # ==================================================
     # 2️⃣ 计算斜率
     # ==================================================
-    for i in range(len(records)):
+    for i in range(stock.get("process_from", 0), len(records)):
         # MA120 近100日斜率
         if i >= 120 + pullback_cycle:
             records.loc[i, "ma120_slope_100"] = calc_slope(
@@ -119,7 +121,7 @@ def pretreatment(stock, operate, tuning=None, debug=False):
 
     records["hist_strong_flag"] = False
 
-    for i in range(len(records)):
+    for i in range(stock.get("process_from", 0), len(records)):
         if i >= 99:
             hist_max = records["ma10_ma120_diff_ratio_pos"].iloc[i - 99: i + 1].max()
             records.loc[i, "hist_strong_flag"] = hist_max >= hist_diff_ratio_limit
@@ -18,6 +18,9 @@ import numpy as np
 import numpy as np
 import pandas as pd
 
+TUNING_KEYS = ("prev", "volumn_amplify", "volumn_period", "price_period", "volumn_slope", "rise")
+
+
 # ✅ 解析参数字符串，例如 "prev=5,volumn_amplify=2"
 def parse_tuning(tuning_str: str):
     result = {}
@@ -99,7 +102,7 @@ def pretreatment(stock, operate, tuning, debug):
 
     # ✅ 调度模式：批量 or 单点处理
     if operate == "back_test":
-        for idx in range(len(records)):
+        for idx in range(stock.get("process_from", 0), len(records)):
             data_processing(idx)
     elif operate in ("buy", "sell"):
         data_processing(len(records) - 1)
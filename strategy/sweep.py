@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+@file: sweep.py
+@author: vanilla
+@date: 2025-10-23
+@desc: 策略参数网格/随机搜索，多进程按股票分发，结果按收益率和胜率排名，支持中断后续跑。
+"""
+
+import os
+import csv
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import strategy.backtest as backtest
+from strategy.load_stock import load_stock
+from strategy.compose import StockContext
+from strategy.predict import Predictor, mapping, WORK_DIR
+from strategy.result_store import ResultStore, data_version
+from utils.parse import parse_grid, expand
+
+
+CELL_FIELDS = ["mode", "tuning", "code", "return", "trades", "win", "lose"]
+
+
+# ===============================
+# 单只股票（在子进程中执行）
+# ===============================
+def run_code(mode, code, tunings, ktype=1, cond=None, path=None, target_date=None):
+    """
+    加载一次股票数据，对每组参数做回测
+    各组参数共享预处理缓存：策略只在其 TUNING_KEYS 中的参数变化时重新预处理，买入信号同样复用
+    已在结果库中的 (参数, 股票) 直接读取，全部命中时不加载行情
+    """
+    store = ResultStore()
+    version = data_version(code, ktype, path)
+    keys = {t: store.key(mode, t, code, cond, None, target_date, version) for t in tunings}
+    cached = {t: store.get(keys[t]) for t in tunings}
+
+    stock = None
+    if any(status is None for status in cached.values()):
+        ok, stock = load_stock(code, cond, path, target_date, ktype)
+        if not ok:
+            return code, []
+
+    predictor = Predictor(mode, log_callback=lambda *_: None)
+    plan = predictor.plans[mode]
+    rows = []
+    shared = {}
+    for tuning in tunings:
+        status = cached[tuning]
+        if status is None:
+            ctx = StockContext(stock, "back_test", tuning, mapping, cache=shared)
+            status = predictor.backtesting(ctx, plan)
+            store.put(keys[tuning], stock["name"], ctx.columns(plan.leaves[0]), status)
+        rows.append({
+            "mode": mode,
+            "tuning": tuning,
+            "code": code,
+            "return": round(backtest.total_return(status), 4),
+            "trades": status["win"] + status["lose"],
+            "win": status["win"],
+            "lose": status["lose"],
+        })
+    return code, rows
+
+
+# ===============================
+# 结果表
+# ===============================
+def load_cells(path):
+    if not os.path.exists(path):
+        return pd.DataFrame(columns=CELL_FIELDS)
+    return pd.read_csv(path, dtype={"code": str, "tuning": str}, keep_default_na=False)
+
+
+def rank(cells):
+    """按参数组汇总：平均收益率降序，其次胜率降序"""
+    if cells.empty:
+        return pd.DataFrame(columns=["tuning", "codes", "mean_return", "median_return", "trades", "win", "win_rate"])
+    cells = cells.copy()
+    cells["return"] = cells["return"].astype(float)
+    table = cells.groupby("tuning").agg(
+        codes=("code", "nunique"),
+        mean_return=("return", "mean"),
+        median_return=("return", "median"),
+        trades=("trades", "sum"),
+        win=("win", "sum"),
+    ).reset_index()
+    table["win_rate"] = (table["win"] / table["trades"].where(table["trades"] > 0)).fillna(0).round(4)
+    table["mean_return"] = table["mean_return"].round(4)
+    table["median_return"] = table["median_return"].round(4)
+    return table.sort_values(["mean_return", "win_rate"], ascending=False).reset_index(drop=True)
+
+
+# ===============================
+# 主流程
+# ===============================
+def sweep(mode, codes, tunings, workers=4, output=None, ktype=1, cond=None, path=None, target_date=None, log=print):
+    """
+    :param output: 排名结果 CSV；逐格结果写入 <output>.cells.csv，重启时跳过已完成的 (参数, 股票)
+    """
+    if mode not in mapping:
+        raise ValueError(f"未知策略: {mode}, 支持: {list(mapping.keys())}")
+    output = output or f"{WORK_DIR}/data/sweep_{mode}.csv"
+    cells_path = os.path.splitext(output)[0] + ".cells.csv"
+
+    done = load_cells(cells_path)
+    done = done[done["mode"] == mode] if not done.empty else done
+    finished = set(zip(done["tuning"], done["code"]))
+
+    jobs = []
+    for code in codes:
+        pending = [t for t in tunings if (t, code) not in finished]
+        if pending:
+            jobs.append((code, pending))
+    log(f"参数组 {len(tunings)} 个，股票 {len(codes)} 只，待计算 {sum(len(p) for _, p in jobs)} 格")
+
+    new_file = not os.path.exists(cells_path)
+    os.makedirs(os.path.dirname(os.path.abspath(cells_path)), exist_ok=True)
+    with open(cells_path, "a", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=CELL_FIELDS)
+        if new_file:
+            writer.writeheader()
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(run_code, mode, code, pending, ktype, cond, path, target_date)
+                for code, pending in jobs
+            ]
+            for idx, future in enumerate(as_completed(futures), start=1):
+                try:
+                    code, rows = future.result()
+                except Exception as e:
+                    log(f"⚠️ 计算失败: {e}")
+                    continue
+                writer.writerows(rows)
+                f.flush()
+                log(f"[{idx}/{len(futures)}] {code} 完成 {len(rows)} 组参数")
+
+    table = rank(load_cells(cells_path).query("mode == @mode"))
+    table = table[table["tuning"].isin(tunings)].reset_index(drop=True)
+    table.to_csv(output, index=False)
+    log(f"排名结果已写入 {output}")
+    return table
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="策略参数搜索")
+    parser.add_argument("-m", "--mode", required=True, help="策略名")
+    parser.add_argument("-c", "--code", required=True, help="股票代码 / all / file,路径")
+    parser.add_argument("-g", "--grid", required=True, help="参数空间，如 volumn_amplify=1.5|2|2.5;rise=0.1~0.3")
+    parser.add_argument("-n", "--samples", type=int, default=0, help="随机抽样组数（含区间参数时默认 10）")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子")
+    parser.add_argument("-w", "--workers", type=int, default=os.cpu_count() or 4, help="进程数")
+    parser.add_argument("-k", "--ktype", type=int, default=1)
+    parser.add_argument("-s", "--stock_cond", default="")
+    parser.add_argument("-q", "--date")
+    parser.add_argument("-o", "--output", help="排名结果 CSV")
+    args = parser.parse_args()
+
+    codes = Predictor(args.mode).resolve_codes(args.code)
+    tunings = expand(parse_grid(args.grid), args.samples, args.seed)
+    table = sweep(args.mode, codes, tunings, args.workers, args.output, args.ktype, args.stock_cond, None, args.date)
+    print(table.head(20).to_string())
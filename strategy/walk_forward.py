@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+@file: walk_forward.py
+@author: vanilla
+@date: 2025-10-24
+@desc: 滚动训练/测试窗口的参数寻优：训练期选参数，下一段样本外区间回测。
+       并行按股票切分：每只股票在一个子进程里算完全部参数 × 全部窗口（行情和预处理只做一次），
+       窗口之间不再拆分任务。
+"""
+
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+import strategy.backtest as backtest
+import utils.config as config
+from strategy.load_stock import load_stock
+from strategy.compose import compile_plan, StockContext
+from utils.meta_index import meta_index
+from utils.trade_calendar import trade_calendar
+
+
+# ===============================
+# 窗口划分
+# ===============================
+def make_windows(calendar, train, test, step=None, start=backtest.WARMUP):
+    """
+    返回 [(train_start, train_end, test_start, test_end), ...]，均为日期，区间左闭右开
+    """
+    step = step or test
+    windows = []
+    i = start
+    while i + train + test <= len(calendar):
+        end = i + train + test
+        test_end = calendar[end] if end < len(calendar) else calendar[-1] + np.timedelta64(1, "D")
+        windows.append((calendar[i], calendar[i + train], calendar[i + train], test_end))
+        i += step
+    return windows
+
+
+def window_calendar(codes, ktype=1):
+    """
+    划分窗口用的交易日：基准股票的交易日历
+    基准数据缺失或正在写入时，按这些股票行情文件的首末交易日（元数据索引）取工作日近似，节假日会被当作交易日
+    """
+    calendar = trade_calendar(ktype=ktype, fallback=True).dates
+    if len(calendar):
+        return calendar
+    meta = meta_index().table(codes, ktype)
+    first, last = meta["first_date"].dropna(), meta["last_date"].dropna()
+    if first.empty:
+        return calendar
+    days = np.arange(np.datetime64(min(first), "D"), np.datetime64(max(last), "D") + 1)
+    return days[np.is_busday(days)]
+
+
+# ===============================
+# 单只股票（在子进程中执行）
+# ===============================
+def run_code(mode, code, tunings, windows, ktype=1, cond=None, path=None):
+    """
+    加载一次股票数据；每组参数只预处理一次（指标列在全部窗口间复用，只差非 TUNING_KEYS 参数的各组之间也复用），
+    再在每个窗口的训练区间和测试区间上分别回测
+    返回: (code, 数组 [参数, 窗口, 训练/测试, (收益率, 交易次数, 胜)])
+    """
+    from strategy.predict import mapping
+
+    ok, stock = load_stock(code, cond, path, None, ktype)
+    if not ok:
+        return code, None
+
+    plan = compile_plan(mode, mapping)
+    dates = stock["records"]["trade_date"].to_numpy().astype("datetime64[D]")
+    bounds = []
+    for train_start, train_end, test_start, test_end in windows:
+        bounds.append((
+            np.searchsorted(dates, [train_start, train_end]),
+            np.searchsorted(dates, [test_start, test_end]),
+        ))
+
+    out = np.full((len(tunings), len(windows), 2, 3), np.nan)
+    shared = {}
+    for t, tuning in enumerate(tunings):
+        ctx = StockContext(stock, "back_test", tuning, mapping, cache=shared)
+        cols = ctx.columns(plan.leaves[0])
+        signal, desc = plan.buy_signal(ctx, backtest.WARMUP, len(dates))
+
+        def sell(i, status):
+            return plan.sell(ctx, i, status)
+
+        for w, ranges in enumerate(bounds):
+            for phase, (lo, hi) in enumerate(ranges):
+                lo = max(int(lo), backtest.WARMUP)
+                if hi <= lo:
+                    continue
+                status = backtest.run(cols, signal, desc, sell, start=lo, stop=int(hi))
+                out[t, w, phase] = (backtest.total_return(status), status["win"] + status["lose"], status["win"])
+    return code, out
+
+
+# ===============================
+# 主流程
+# ===============================
+def walk_forward(mode, codes, tunings, train, test, step=None, workers=4, ktype=1, cond=None, path=None, log=print, progress_callback=None, stop_flag=None):
+    """
+    每只股票一个任务，在进程池中计算该股票全部参数在各窗口训练/测试期的回测，
+    然后逐窗口：训练期平均收益率最高的参数 → 该参数在测试期的表现
+    任务分批提交（最多 workers × 2 只在排队），stop_flag 置位后不再提交，只等正在计算的股票结束
+    """
+    calendar = window_calendar(codes, ktype)
+    windows = make_windows(calendar, train, test, step)
+    if not windows:
+        raise ValueError(f"交易日 {len(calendar)} 天，不足以划分 训练 {train} + 测试 {test} 的窗口")
+    log(f"窗口 {len(windows)} 个，参数组 {len(tunings)} 个，股票 {len(codes)} 只")
+
+    results = []
+    queue = iter(codes)
+    running = set()
+    done = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        while True:
+            if stop_flag and stop_flag.is_set():
+                log(">>> 用户终止任务")
+                for f in running:
+                    f.cancel()
+                break
+            while len(running) < workers * 2:
+                c = next(queue, None)
+                if c is None:
+                    break
+                running.add(executor.submit(run_code, mode, c, tunings, windows, ktype, cond, path))
+            if not running:
+                break
+            # 定时醒来检查 stop_flag，不必等到某只股票算完
+            finished, running = wait(running, timeout=1, return_when=FIRST_COMPLETED)
+            for future in finished:
+                code, out = future.result()
+                done += 1
+                if progress_callback:
+                    progress_callback(done, len(codes), code)
+                if out is not None:
+                    results.append(out)
+
+    if not results:
+        return pd.DataFrame()
+
+    # [股票, 参数, 窗口, 训练/测试, 指标]
+    cube = np.stack(results)
+    rows = []
+    for w, (train_start, train_end, test_start, test_end) in enumerate(windows):
+        train_ret = np.nanmean(cube[:, :, w, 0, 0], axis=0)
+        train_trades = np.nansum(cube[:, :, w, 0, 1], axis=0)
+        train_win = np.nansum(cube[:, :, w, 0, 2], axis=0)
+        train_rate = np.divide(train_win, train_trades, out=np.zeros_like(train_win), where=train_trades > 0)
+        # 先比收益率，再比胜率
+        best = int(np.lexsort((-train_rate, -np.nan_to_num(train_ret, nan=-np.inf)))[0])
+
+        test_ret = cube[:, best, w, 1, 0]
+        test_trades = np.nansum(cube[:, best, w, 1, 1])
+        test_win = np.nansum(cube[:, best, w, 1, 2])
+        rows.append({
+            "window": w + 1,
+            "train_start": pd.Timestamp(train_start).date(),
+            "train_end": pd.Timestamp(train_end).date(),
+            "test_start": pd.Timestamp(test_start).date(),
+            "test_end": pd.Timestamp(test_end).date(),
+            "tuning": tunings[best],
+            "train_return": round(float(train_ret[best]), 4),
+            "train_win_rate": round(float(train_rate[best]), 4),
+            "test_return": round(float(np.nanmean(test_ret)), 4) if not np.isnan(test_ret).all() else np.nan,
+            "test_trades": int(test_trades),
+            "test_win_rate": round(float(test_win / test_trades), 4) if test_trades else 0.0,
+        })
+    return pd.DataFrame(rows)
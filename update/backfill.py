@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+@file: backfill.py
+@author: vanilla
+@date: 2025-11-05
+@desc: 新股票/新部署的五年历史回填：按 (股票, 日期区间) 切分任务，线程池经共享限速器并发拉取，
+       每个分片先写入暂存目录（中断后重跑只拉缺的分片），一只股票的分片全部完成后合并，
+       一次性向量化计算指标并写入行情文件。总耗时取决于接口限速，而不是逐只串行处理。
+"""
+
+import os
+import time
+import glob
+import shutil
+import argparse
+import pandas as pd
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import utils.config as config
+import utils.ratelimit as ratelimit
+from update.datasource import get_source
+from update.fetch_market import compute_all_indicators
+from utils.meta_index import meta_index
+from utils.trade_calendar import trade_calendar
+from update.update_market import HISTORY_DAYS
+
+CHUNK_MONTHS = 12            # 每个分片的月数
+STAGING_DIR = f"{config.DATA_DIR}/backfill"
+CIRCUIT_WAITS = 5            # 数据源熔断时最多等待重试的次数
+
+
+# ===============================
+# 分片
+# ===============================
+def make_chunks(start, chunk_months=CHUNK_MONTHS, today=None):
+    """
+    把 [start, 今天] 切成若干 (起, 止) 日期字符串区间，最后一片不设终点
+    分界固定在每 chunk_months 个月的月初（与 start 无关），隔天重跑时已暂存的分片仍然可用
+    """
+    start = pd.Timestamp(start)
+    today = pd.Timestamp(today or datetime.today())
+    edges = [d for d in pd.date_range(start, today, freq="MS")
+             if (d.year * 12 + d.month - 1) % chunk_months == 0 and d > start]
+    bounds = [start] + edges
+    chunks = []
+    for i, lo in enumerate(bounds):
+        hi = (bounds[i + 1] - pd.Timedelta(days=1)).strftime("%Y-%m-%d") if i + 1 < len(bounds) else None
+        chunks.append((lo.strftime("%Y-%m-%d"), hi))
+    return chunks
+
+
+def chunk_path(code, start, end):
+    return f"{STAGING_DIR}/{code}/{start}_{end or 'latest'}.csv"
+
+
+# ===============================
+# 拉取与合并
+# ===============================
+def fetch_chunk(code, start, end):
+    """
+    拉取一个分片写入暂存目录，返回 ok / empty / staged（之前已暂存）
+    出错抛出异常；熔断时等待冷却后重试
+    """
+    path = chunk_path(code, start, end)
+    # 最后一片没有终点，每次都重新拉取，保证拿到最新的交易日
+    if end is not None and os.path.exists(path):
+        return "staged"
+    for attempt in range(CIRCUIT_WAITS):
+        try:
+            df = get_source().get_market(code, start, end)
+            break
+        except ratelimit.CircuitOpen:
+            if attempt + 1 == CIRCUIT_WAITS:
+                raise
+            time.sleep(ratelimit.backoff_delay(attempt, base=5, cap=60))
+    if df is None or df.empty:
+        return "empty"
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.tmp"
+    df.to_csv(tmp, index=False, encoding="utf-8")
+    os.replace(tmp, path)
+    return "ok"
+
+
+def merge(code, ktype=1, data_path=None):
+    """
+    合并暂存的分片（与已有历史，若有）→ 按交易日去重排序 → 一次性计算指标 → 写入行情文件
+    返回写入的行数，没有任何分片时返回 0
+    """
+    data_path = data_path or config.default_data_path(code, ktype)
+    parts = [pd.read_csv(p, dtype={"stock_code": str}) for p in sorted(glob.glob(f"{STAGING_DIR}/{code}/*.csv"))]
+    if not parts:
+        return 0
+    new_df = pd.concat(parts)
+    new_df["trade_date"] = pd.to_datetime(new_df["trade_date"])
+    frames = [new_df]
+    if os.path.exists(data_path):
+        history = pd.read_csv(data_path, parse_dates=["trade_date"])
+        frames.insert(0, history[[c for c in new_df.columns if c in history.columns]])
+    all_df = pd.concat(frames).drop_duplicates(subset=["trade_date"], keep="last") \
+        .sort_values("trade_date").reset_index(drop=True)
+    compute_all_indicators(all_df)
+
+    tmp = f"{data_path}.tmp"
+    all_df.to_csv(tmp, index=False, mode="w", encoding="utf-8-sig")
+    os.replace(tmp, data_path)
+    meta_index().record(code, ktype, data_path)
+    shutil.rmtree(f"{STAGING_DIR}/{code}", ignore_errors=True)
+    return len(all_df)
+
+
+# ===============================
+# 主流程
+# ===============================
+def backfill(codes, workers=8, rate=None, ktype=1, start=None, chunk_months=CHUNK_MONTHS, force=False, log=print):
+    """
+    codes 中没有行情文件的股票（force=True 时全部）拉取 start（默认五年前）至今的历史
+    同一股票的分片可能分到不同线程；分片全部成功后立即合并，有分片失败的股票保留暂存，下次运行只补缺的分片
+    分片为空（上市前、整段停牌或被限流）不算失败，中间缺的交易日由 update.check 的缺口检查补齐
+    返回 {code: 结果描述}
+    """
+    get_source(rate)
+    if ktype not in (1, "1"):
+        raise ValueError("回填只支持股票日线（ktype=1）")
+    targets = [c for c in dict.fromkeys(codes) if force or not os.path.exists(config.default_data_path(c, ktype))]
+    start = start or str(trade_calendar(ktype=ktype, fallback=True).prev(datetime.today(), HISTORY_DAYS))
+    chunks = make_chunks(start, chunk_months)
+    log(f"需要回填 {len(targets)} 只股票，自 {start} 起每只 {len(chunks)} 个分片，共 {len(targets) * len(chunks)} 个任务")
+
+    pending = {code: len(chunks) for code in targets}
+    outcome = {code: {"ok": 0, "staged": 0, "empty": 0, "failed": 0} for code in targets}
+    results = {}
+    done_jobs = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # 按分片轮转提交：先提交所有股票的第一片，使每只股票大致同时完成，尽早合并并释放暂存
+        futures = {
+            executor.submit(fetch_chunk, code, s, e): (code, s, e)
+            for s, e in chunks for code in targets
+        }
+        for future in as_completed(futures):
+            code, s, e = futures[future]
+            try:
+                outcome[code][future.result()] += 1
+            except Exception as ex:
+                outcome[code]["failed"] += 1
+                log(f"⚠️ {code} {s}~{e or '最新'} 拉取失败: {ex}")
+            done_jobs += 1
+            pending[code] -= 1
+            if pending[code]:
+                continue
+
+            # 该股票的分片全部完成：合并
+            o = outcome[code]
+            if o["failed"]:
+                results[code] = f"⚠️ {code} 有 {o['failed']} 个分片失败，已暂存 {o['ok'] + o['staged']} 个，下次继续"
+            elif not o["ok"] + o["staged"]:
+                results[code] = f"⚠️ {code} 没有取到数据"
+            else:
+                try:
+                    rows = merge(code, ktype)
+                    results[code] = f"✅ {code} 回填 {rows} 行"
+                except Exception as ex:
+                    results[code] = f"⚠️ {code} 合并失败: {ex}"
+            log(f"[{done_jobs}/{len(futures)}] {results[code]}")
+
+    log(f"回填完成：成功 {sum('✅' in r for r in results.values())} 只，失败 {sum('⚠️' in r for r in results.values())} 只。")
+    ratelimit.print_stats(log)
+    return results
+
+
+if __name__ == "__main__":
+    from update.update_market_patch import get_codes_from_remote, get_codes_from_file
+
+    parser = argparse.ArgumentParser(description='并发分片回填新股票的历史行情')
+    parser.add_argument('-f', '--fetch', default='remote', help='股票代码来源，local|remote|file')
+    parser.add_argument('-p', '--path', help='股票代码文件（-f file）')
+    parser.add_argument('-c', '--code', help='指定股票代码，逗号分隔')
+    parser.add_argument('-s', '--start', help='起始日期，默认约五年前')
+    parser.add_argument('-n', '--chunk', type=int, default=CHUNK_MONTHS, help='每个分片的月数')
+    parser.add_argument('-r', '--rate', type=float, default=2, help='每秒请求数上限（所有线程共享）')
+    parser.add_argument('-w', '--workers', type=int, default=8, help='并发线程数')
+    parser.add_argument('--force', action='store_true', help='已有行情文件的股票也重新回填')
+    parser.add_argument('--clean', action='store_true', help='开始前清空暂存目录')
+    args = parser.parse_args()
+
+    if args.clean:
+        shutil.rmtree(STAGING_DIR, ignore_errors=True)
+    get_source(args.rate)
+    if args.code:
+        codes = args.code.split(",")
+    elif args.fetch == 'remote':
+        codes = get_codes_from_remote()
+    elif args.fetch == 'file':
+        codes = get_codes_from_file(args.path)
+    else:
+        codes = config.get_codes_from_local()
+    backfill(codes, args.workers, args.rate, start=args.start, chunk_months=args.chunk, force=args.force)
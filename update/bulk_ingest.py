@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+@file: bulk_ingest.py
+@author: vanilla
+@date: 2025-10-29
+@desc: 收盘后一次性导入全市场快照：快照只解析一次，每只股票只读取文件末尾几十行，
+       全部股票的 ma/kdj 按数组一起计算，最后统一追加（或替换当日行）写入。
+"""
+
+import io
+import os
+import argparse
+import warnings
+import numpy as np
+import pandas as pd
+
+import utils.config as config
+import update.fetch_market_local as fl
+from utils.meta_index import meta_index
+
+
+MA_PERIODS = (5, 10, 20)
+KDJ_N = 9
+KDJ_SMOOTH = 3
+KDJ_WARMUP = max(KDJ_N * 3, 50)  # 与 update.fetch_market.compute_kdj 的预热窗口一致
+TAIL_ROWS = KDJ_WARMUP + 2        # 预热窗口 + 可能被替换的当日行
+
+
+# ===============================
+# 读取文件末尾
+# ===============================
+def read_tail(path, n=TAIL_ROWS, block=32768):
+    """
+    返回 (表头行, 末尾 n 行, 最后一行的起始偏移, 文件是否以换行结尾)
+    """
+    with open(path, "rb") as f:
+        header = f.readline()
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        pos = size
+        data = b""
+        while pos > len(header) and data.count(b"\n") <= n + 1:
+            step = min(block, pos - len(header))
+            pos -= step
+            f.seek(pos)
+            data = f.read(step) + data
+
+    ends_with_newline = data.endswith(b"\n")
+    lines = data.split(b"\n")
+    if ends_with_newline:
+        lines.pop()
+    offsets = []
+    at = pos
+    for line in lines:
+        offsets.append(at)
+        at += len(line) + 1
+    if pos > len(header):
+        lines, offsets = lines[1:], offsets[1:]  # 第一行可能不完整
+    keep = [(l, o) for l, o in zip(lines, offsets) if l.strip()][-n:]
+    lines = [l for l, _ in keep]
+    last_offset = keep[-1][1] if keep else size
+    return header.decode("utf-8-sig").strip(), lines, last_offset, ends_with_newline
+
+
+# ===============================
+# 指标（全部股票一起计算）
+# ===============================
+def rolling_extreme(values, window, func):
+    """values: (股票, 行)，左侧 NaN 为填充；窗口内忽略 NaN，等价于 rolling(window, min_periods=1)"""
+    pad = np.full((values.shape[0], window - 1), np.nan)
+    windows = np.lib.stride_tricks.sliding_window_view(np.hstack([pad, values]), window, axis=1)
+    with warnings.catch_warnings():
+        # 全为填充的窗口返回 NaN
+        warnings.simplefilter("ignore", RuntimeWarning)
+        return func(windows, axis=2)
+
+
+def ewm_last(values, valid, alpha):
+    """
+    逐列递推 ewm(alpha, adjust=False)，与 pandas 的计算方式逐位一致；
+    每只股票从自己的第一个有效行开始，返回逐行结果
+    """
+    old_wt = 1.0 - alpha
+    new_wt = alpha
+    out = np.full(values.shape, np.nan)
+    weighted = np.full(values.shape[0], np.nan)
+    started = np.zeros(values.shape[0], dtype=bool)
+    for t in range(values.shape[1]):
+        cur = values[:, t]
+        first = valid[:, t] & ~started
+        step = valid[:, t] & started & (weighted != cur)
+        with np.errstate(all="ignore"):
+            blended = (old_wt * weighted + new_wt * cur) / (old_wt + new_wt)
+        weighted = np.where(first, cur, np.where(step, blended, weighted))
+        started |= valid[:, t]
+        out[:, t] = np.where(valid[:, t], weighted, np.nan)
+    return out
+
+
+def compute_new_rows(close, high, low, prev):
+    """
+    close/high/low: (股票, KDJ_WARMUP + 1)，最后一列为新行，左侧不足的历史以 NaN 填充
+    prev: 上一行已存储的指标 {列名: 数组}，没有上一行的股票为 NaN / ""
+    返回新行的指标 {列名: 数组}
+    """
+    valid = ~np.isnan(close) | ~np.isnan(high) | ~np.isnan(low)
+    # 填充位置以外的行都参与计算（与 iloc[calc_start:] 一致）
+    first_valid = np.argmax(valid, axis=1)
+    cols = np.arange(close.shape[1])
+    valid = cols[None, :] >= first_valid[:, None]
+    n_rows = valid.sum(axis=1)
+
+    out = {}
+    last_close = close[:, -1]
+    for p in MA_PERIODS:
+        window = close[:, -p:]
+        with np.errstate(all="ignore"):
+            ma = window.mean(axis=1)
+        ma = np.where((n_rows >= p) & ~np.isnan(ma), ma, 0.0)
+        above = np.where((ma > 0) & (last_close > ma), "y", "n")
+        prev_above = prev[f"above_ma{p}"]
+        has_prev = n_rows > 1
+        out[f"ma{p}"] = ma
+        out[f"above_ma{p}"] = above
+        out[f"first_above_ma{p}"] = np.where(has_prev & (above == "y") & (prev_above == "n"), "y", "n")
+        out[f"first_under_ma{p}"] = np.where(has_prev & (above == "n") & (prev_above == "y"), "y", "n")
+
+    low_min = rolling_extreme(np.where(valid, low, np.nan), KDJ_N, np.nanmin)
+    high_max = rolling_extreme(np.where(valid, high, np.nan), KDJ_N, np.nanmax)
+    with np.errstate(all="ignore"):
+        rsv = (close - low_min) / (high_max - low_min) * 100
+    rsv = np.where(np.isnan(rsv), 0.0, rsv)
+    k = ewm_last(rsv, valid, 1 / KDJ_SMOOTH)
+    d = ewm_last(k, valid, 1 / KDJ_SMOOTH)
+    k, d = k[:, -1], d[:, -1]
+    out["K"] = k
+    out["D"] = d
+    out["J"] = 3 * k - 2 * d
+
+    k_prev, d_prev = prev["K"], prev["D"]
+    signal = np.full(len(k), "no_cross", dtype=object)
+    signal[(n_rows > 1) & (k_prev < d_prev) & (k > d)] = "golden_cross"
+    signal[(n_rows > 1) & (k_prev > d_prev) & (k < d)] = "death_cross"
+    out["kdj_signal"] = signal
+    return out
+
+
+# ===============================
+# 主流程
+# ===============================
+def format_value(v):
+    """与 DataFrame.to_csv 的输出一致：NaN 为空，浮点数用 repr"""
+    if v is None:
+        return ""
+    if isinstance(v, (float, np.floating)):
+        return "" if np.isnan(v) else repr(float(v))
+    return str(v)
+
+
+def ingest(snapshot=None, ktype=1, dry_run=False, log=print):
+    snapshot = snapshot or fl.snapshot_path()
+    table = fl.load_stock_table(snapshot)
+    if table.empty:
+        log(f"⚠️ 快照 {snapshot} 中没有有效记录")
+        return {}
+    table = table.dropna(subset=["close"]).drop_duplicates("stock_code", keep="last")
+    trade_date = pd.Timestamp(table["trade_date"].iloc[0])
+    date_str = trade_date.strftime("%Y-%m-%d")
+    log(f"快照 {snapshot}: {len(table)} 只股票，交易日 {date_str}")
+
+    # 1️⃣ 读取每只股票的文件末尾
+    jobs = []
+    stats = {"append": 0, "replace": 0, "missing": 0, "stale": 0}
+    for row in table.itertuples(index=False):
+        path = config.default_data_path(row.stock_code, ktype)
+        if not os.path.exists(path):
+            stats["missing"] += 1  # 没有历史文件的新股需要从远程拉取完整历史
+            continue
+        header, lines, last_offset, newline = read_tail(path)
+        jobs.append((row, path, header, lines, last_offset, newline))
+
+    # 2️⃣ 全部末尾行合并成一张表解析（按表头分组，通常只有一组）
+    groups = {}
+    for job in jobs:
+        groups.setdefault(job[2], []).append(job)
+
+    writes = []
+    for header, group in groups.items():
+        columns = header.split(",")
+        counts = [len(job[3]) for job in group]
+        text = header + "\n" + "\n".join(b"\n".join(job[3]).decode("utf-8") for job in group if job[3])
+        tails = pd.read_csv(io.StringIO(text), dtype={"stock_code": str, "kdj_signal": str}, keep_default_na=False, na_values=[""])
+        tails["trade_date"] = pd.to_datetime(tails["trade_date"])
+        bounds = np.concatenate([[0], np.cumsum(counts)])
+
+        width = KDJ_WARMUP + 1
+        s = len(group)
+        close = np.full((s, width), np.nan)
+        high = np.full((s, width), np.nan)
+        low = np.full((s, width), np.nan)
+        prev = {c: np.full(s, np.nan) for c in ("K", "D")}
+        prev.update({f"above_ma{p}": np.full(s, "", dtype=object) for p in MA_PERIODS})
+        modes = []
+
+        for k, (row, path, _, lines, last_offset, newline) in enumerate(group):
+            tail = tails.iloc[bounds[k]:bounds[k + 1]]
+            if len(tail) and tail["trade_date"].iloc[-1] > trade_date:
+                modes.append("stale")
+                continue
+            replace = len(tail) > 0 and tail["trade_date"].iloc[-1] == trade_date
+            base = tail.iloc[:-1] if replace else tail
+            base = base.iloc[-KDJ_WARMUP:]
+            m = len(base)
+            if m:
+                close[k, width - 1 - m:width - 1] = base["close"].to_numpy(dtype=float)
+                high[k, width - 1 - m:width - 1] = base["high"].to_numpy(dtype=float)
+                low[k, width - 1 - m:width - 1] = base["low"].to_numpy(dtype=float)
+                last = base.iloc[-1]
+                prev["K"][k] = last.get("K", np.nan)
+                prev["D"][k] = last.get("D", np.nan)
+                for p in MA_PERIODS:
+                    prev[f"above_ma{p}"][k] = last.get(f"above_ma{p}", "")
+            close[k, -1] = row.close
+            high[k, -1] = row.high
+            low[k, -1] = row.low
+            modes.append("replace" if replace else "append")
+
+        indicators = compute_new_rows(close, high, low, prev)
+
+        for k, (row, path, _, lines, last_offset, newline) in enumerate(group):
+            mode = modes[k]
+            stats[mode] += 1
+            if mode == "stale":
+                continue
+            values = row._asdict()
+            values["trade_date"] = date_str
+            line = ",".join(
+                format_value(indicators[c][k]) if c in indicators else
+                format_value(float(values[c]) if c not in ("stock_code", "trade_time", "trade_date") and c in values else values.get(c))
+                for c in columns
+            )
+            writes.append((row.stock_code, path, mode, last_offset, newline, line))
+
+    log(f"追加 {stats['append']} 只，替换当日行 {stats['replace']} 只，无历史文件 {stats['missing']} 只，快照早于本地数据 {stats['stale']} 只")
+    if dry_run:
+        return stats
+
+    # 3️⃣ 统一写入
+    index = meta_index()
+    for code, path, mode, last_offset, newline, line in writes:
+        before = index.get(code, ktype, path)
+        with open(path, "r+b") as f:
+            if mode == "replace":
+                f.truncate(last_offset)
+                f.seek(last_offset)
+            else:
+                f.seek(0, os.SEEK_END)
+                if not newline:
+                    f.write(b"\n")
+            f.write(line.encode("utf-8") + b"\n")
+        index.record_line(code, ktype, path, before, line.encode("utf-8"), replace=(mode == "replace"))
+    log(f"✅ 已写入 {len(writes)} 个文件")
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="全市场快照批量导入")
+    parser.add_argument("-s", "--snapshot", help="快照文件，默认为当日 *_all_market.txt")
+    parser.add_argument("-k", "--ktype", type=int, default=1)
+    parser.add_argument("-n", "--dry_run", action="store_true", help="只计算不写入")
+    args = parser.parse_args()
+    ingest(args.snapshot, args.ktype, args.dry_run)
@@ -1,92 +1,152 @@
-import os
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+@file: check.py
+@author: vanilla
+@date: 2025-11-01
+@desc: 全市场缺口检查：以基准股票的交易日为日历，一次性构建 (股票 × 交易日) 的存在位图，
+       输出 JSON 格式的缺口清单；repair 只重新拉取缺失的区间。
+"""
+
+import sys
+import json
+import argparse
+import numpy as np
 import pandas as pd
-from typing import List
-from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
 import utils.config as config
+import utils.ratelimit as ratelimit
+from utils.meta_index import meta_index, RECENT_DAYS
+from utils.trade_calendar import trade_calendar, BENCHMARK
+
+
+# ===============================
+# 日期
+# ===============================
+def stock_dates(meta, code, ktype, days):
+    """最近 days 个交易日：不超过索引保存的天数时直接取索引，否则只读取 trade_date 一列"""
+    if days <= RECENT_DAYS:
+        return np.array(json.loads(meta["recent"]), dtype="datetime64[D]")
+    dates = pd.read_csv(config.default_data_path(code, ktype), usecols=["trade_date"])["trade_date"]
+    return pd.to_datetime(dates).to_numpy(dtype="datetime64[D]")[-days:]
+
+
+def build_calendar(ktype, days, benchmark=BENCHMARK):
+    """基准股票最近 days 个交易日（升序、去重）"""
+    return trade_calendar(ktype, benchmark).tail(days)
+
+
+def presence_bitmap(calendar, dates_list):
+    """
+    返回 (present, extra)
+    present: (股票, 交易日) bool 位图；extra: 每只股票不在日历中的日期
+    """
+    present = np.zeros((len(dates_list), len(calendar)), dtype=bool)
+    counts = [len(d) for d in dates_list]
+    if not sum(counts):
+        return present, [[] for _ in dates_list]
+    rows = np.repeat(np.arange(len(dates_list)), counts)
+    dates = np.concatenate(dates_list)
+    pos = np.clip(np.searchsorted(calendar, dates), 0, len(calendar) - 1)
+    hit = calendar[pos] == dates
+    present[rows[hit], pos[hit]] = True
+    # 晚于日历起点却不在日历里的日期视为多余
+    stray = ~hit & (dates >= calendar[0])
+    extra = [[] for _ in dates_list]
+    for r, d in zip(rows[stray], dates[stray]):
+        extra[r].append(str(d))
+    return present, extra
+
+
+# ===============================
+# 检查
+# ===============================
+def find_gaps(codes=None, days=15, ktype=1, benchmark=BENCHMARK):
+    """
+    返回缺口清单 [{code, last_date, missing: [日期], extra: [日期]}]，只包含有问题的股票
+    上市（首个交易日）之前的日子不算缺失
+    """
+    codes = codes if codes is not None else config.get_codes_from_local()
+    calendar = build_calendar(ktype, days, benchmark)
+    table = meta_index().table(codes, ktype)
+
+    codes = [c for c in dict.fromkeys(codes) if c in table.index]
+    dates_list = [stock_dates(table.loc[c], c, ktype, days) for c in codes]
+    present, extra = presence_bitmap(calendar, dates_list)
+
+    first = pd.to_datetime(table.loc[codes, "first_date"]).to_numpy(dtype="datetime64[D]")
+    expected = calendar[None, :] >= first[:, None]
+    missing = expected & ~present
+
+    gaps = []
+    for i in np.flatnonzero(missing.any(axis=1) | np.array([bool(e) for e in extra], dtype=bool)):
+        gaps.append({
+            "code": codes[i],
+            "last_date": table.loc[codes[i], "last_date"],
+            "missing": [str(d) for d in calendar[missing[i]]],
+            "extra": extra[i],
+        })
+    return gaps
 
 
-def check_stock_against_benchmark(
-    df_stock: pd.DataFrame,
-    symbol: str,
-    df_benchmark: pd.DataFrame,
-    day: int = 5,
-    date_col: str = 'trade_date'
-) -> None:
+# ===============================
+# 修复
+# ===============================
+def repair_one(code, start, end, ktype):
+    from update.fetch_market import MarketAnalyzer
+    df = MarketAnalyzer(code, start, end, None, ktype, "remote").run()
+    if df.empty:
+        return f"⚠️ {code} {start}~{end} 没有取到数据"
+    return f"✅ {code} 补齐 {start}~{end}"
+
+
+def repair(gaps, ktype=1, workers=4):
     """
-    以基准股票的 trade_date 作为交易日历，检查目标股票最近day个交易日是否连续。
-    
-    参数：
-        df_stock: 目标股票的 DataFrame
-        symbol: 目标股票代码（用于输出）
-        df_benchmark: 基准股票的 DataFrame（视为完整交易日历）
-        date_col: 日期列名，默认 'trade_date'
+    每只股票只请求一次最早到最晚缺失日之间的区间（中间已有的几天一并覆盖），
+    合并写回并重算之后的指标
     """
-    # 统一转为 datetime 并排序
-    df_stock = df_stock.copy()
-    df_benchmark = df_benchmark.copy()
-    
-    df_stock[date_col] = pd.to_datetime(df_stock[date_col])
-    df_benchmark[date_col] = pd.to_datetime(df_benchmark[date_col])
-    
-    df_stock = df_stock.sort_values(date_col).reset_index(drop=True)
-    df_benchmark = df_benchmark.sort_values(date_col).reset_index(drop=True)
-
-    # 构建基准交易日历（去重、升序）
-    calendar = df_benchmark[date_col].drop_duplicates().reset_index(drop=True)
-
-    if len(df_stock) < day:
-        print(f"股票 {symbol} 数据不足 {day} 条")
-        return
-
-    # 取目标股票最后day个日期
-    last_day = df_stock[date_col].iloc[-day:].reset_index(drop=True)
-    latest_date = last_day.iloc[-1]
-
-    # 检查最新日期是否在基准日历中
-    if latest_date not in calendar.values:
-        print(f"股票 {symbol} 的最新日期 {latest_date.strftime('%Y-%m-%d')} 不在基准交易日历中")
-        return
-
-    # 找到 latest_date 在基准日历中的索引
-    idx = calendar[calendar == latest_date].index[0]
-    if idx < day - 1:
-        print(f"股票 {symbol}：基准日历中无法向前回溯day个交易日（当前仅到索引 {idx}）")
-        return
-
-    # 获取基准日历中应有的最后day个交易日
-    expected_day = calendar.iloc[idx - (day - 1) : idx + 1].reset_index(drop=True)  # 共day天
-
-    # 转为集合比较
-    set_actual = set(last_day)
-    set_expected = set(expected_day)
-
-    if set_actual != set_expected:
-        missing = sorted(set_expected - set_actual)
-        extra = sorted(set_actual - set_expected)
-        messages = []
-        if missing:
-            messages.append(f"缺失: {[d.strftime('%Y-%m-%d') for d in missing]}")
-        if extra:
-            messages.append(f"多余: {[d.strftime('%Y-%m-%d') for d in extra]}")
-        print(f"股票 {symbol}：" + "; ".join(messages))
-
-
-def load_market(code, mtype):
-    """读取数据（如存在）"""
-    path = config.default_data_path(code, mtype)
-    if os.path.exists(path):
-        return pd.read_csv(
-            path,
-            parse_dates=["trade_date"],
-        )
-    return pd.DataFrame()
-
-def run(df_benchmark, code, mtype):
-    """执行完整流程"""
-    df_stock = load_market(code, mtype)
-    check_stock_against_benchmark(df_stock, code, df_benchmark, 15)
-
-df_benchmark = load_market("000001", "1")
-stock_codes = config.get_codes_from_local()
-for code in stock_codes:
-    run(df_benchmark, code, "1")
+    jobs = {g["code"]: (min(g["missing"]), max(g["missing"])) for g in gaps if g["missing"]}
+    print(f"需要修复 {len(jobs)} 只股票")
+
+    results = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(repair_one, code, start, end, ktype): code for code, (start, end) in jobs.items()}
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                result = f"⚠️ {futures[future]} 修复失败: {e}"
+            print(result)
+            results.append(result)
+    print(f"成功 {sum('✅' in r for r in results)} 只，失败 {sum('⚠️' in r for r in results)} 只。")
+    ratelimit.print_stats()
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='检查行情缺口并按需修复')
+    parser.add_argument('-o', '--operate', choices=['check', 'repair'], default='check')
+    parser.add_argument('-d', '--days', type=int, default=15, help='检查最近多少个交易日')
+    parser.add_argument('-k', '--ktype', type=int, default=1, help='数据类型')
+    parser.add_argument('-f', '--file', help='缺口清单 JSON：check 时写入，repair 时读取（默认标准输出/重新检查）')
+    parser.add_argument('-w', '--workers', type=int, default=4, help='修复时的并发线程数')
+    args = parser.parse_args()
+
+    if args.operate == 'check':
+        gaps = find_gaps(days=args.days, ktype=args.ktype)
+        text = json.dumps(gaps, ensure_ascii=False, indent=1)
+        if args.file:
+            with open(args.file, "w", encoding="utf-8") as f:
+                f.write(text)
+            print(f"{len(gaps)} 只股票有缺口，已写入 {args.file}", file=sys.stderr)
+        else:
+            print(text)
+    else:
+        if args.file:
+            with open(args.file, encoding="utf-8") as f:
+                gaps = json.load(f)
+        else:
+            gaps = find_gaps(days=args.days, ktype=args.ktype)
+        repair(gaps, args.ktype, args.workers)
@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+@file: datasource.py
+@author: vanilla
+@date: 2025-10-30
+@desc: 远程数据源适配：adata/akshare 的调用统一经过 utils.ratelimit 的共享限速器；
+       FakeSource 离线生成确定性的假数据，用于不联网测试更新流程；
+       HttpSource 请求本地模拟行情服务（update.fake_server），用于压测。
+"""
+
+import os
+import time
+import zlib
+import random
+import threading
+import numpy as np
+import pandas as pd
+from datetime import datetime, timedelta
+
+import utils.ratelimit as ratelimit
+
+
+def _is_empty(df):
+    return df is None or df.empty
+
+
+class AdataSource:
+    """
+    :param rate: 每秒请求数上限（adata 与 akshare 各自一个限速器，所有线程共享）
+    """
+
+    name = "adata"
+
+    def __init__(self, rate=None, retries=4):
+        rate = rate or float(os.environ.get("STOCK_FETCH_RATE", 2))
+        self.limiter = ratelimit.limiter("adata", rate=rate, retries=retries)
+        self.ak_limiter = ratelimit.limiter("akshare", rate=rate, retries=retries)
+
+    def all_code(self):
+        import adata
+        return self.limiter.call(adata.stock.info.all_code, is_empty=_is_empty)
+
+    def get_market(self, code, start_date=None, end_date=None):
+        """指定起始日期时区间可能确实没有行情（上市前、停牌），空结果不当作限流"""
+        import adata
+        return self.limiter.call(
+            adata.stock.market.get_market,
+            stock_code=code, start_date=start_date, end_date=end_date,
+            is_empty=_is_empty, empty_ok=start_date is not None,
+        )
+
+    def get_stock_shares(self, code):
+        import adata
+        return self.limiter.call(adata.stock.info.get_stock_shares, stock_code=code, is_history=False, is_empty=_is_empty)
+
+    def get_etf_hist(self, code, start_date, end_date):
+        """start_date/end_date 格式为 YYYYMMDD"""
+        import akshare as ak
+        return self.ak_limiter.call(
+            ak.fund_etf_hist_em,
+            symbol=code, start_date=start_date, end_date=end_date, adjust="qfq",
+            is_empty=_is_empty,
+        )
+
+    def limiters(self):
+        return [self.limiter, self.ak_limiter]
+
+
+class FakeSource:
+    """
+    离线假数据：同一代码每次生成的数据相同（以代码为随机种子的随机游走）
+    :param codes: 股票数量或代码列表
+    :param fail_rate: 请求抛异常的概率
+    :param empty_rate: 请求返回空表的概率（模拟限流）
+    :param latency: 每次请求的模拟耗时（秒）
+    """
+
+    name = "fake"
+
+    def __init__(self, codes=50, fail_rate=0.0, empty_rate=0.0, latency=0.0, rate=None, retries=4, seed=0):
+        if isinstance(codes, int):
+            codes = [f"{600000 + i:06d}" for i in range(codes)]
+        self.codes = list(codes)
+        self.fail_rate = fail_rate
+        self.empty_rate = empty_rate
+        self.latency = latency
+        self.random = random.Random(seed)
+        rate = rate or float(os.environ.get("STOCK_FETCH_RATE", 1000))
+        self.limiter = ratelimit.limiter("fake", rate=rate, retries=retries)
+
+    def _request(self, build):
+        if self.latency:
+            time.sleep(self.latency)
+        r = self.random.random()
+        if r < self.fail_rate:
+            raise ConnectionError("模拟请求失败")
+        if r < self.fail_rate + self.empty_rate:
+            return pd.DataFrame()
+        return build()
+
+    @staticmethod
+    def _seed(code):
+        return zlib.crc32(str(code).encode())
+
+    def all_code(self):
+        def build():
+            return pd.DataFrame({
+                "stock_code": self.codes,
+                "short_name": [f"测试{c}" for c in self.codes],
+                "exchange": ["SH" if c.startswith("6") else "SZ" for c in self.codes],
+                "list_date": ["2015-01-05"] * len(self.codes),
+            })
+        return self.limiter.call(self._request, build, is_empty=_is_empty)
+
+    def history(self, code, start_date=None, end_date=None):
+        """工作日行情，2015-01-05 起；不经过限速器。总是生成到今天再截取，区间不同时同一天的数据也相同"""
+        days = pd.bdate_range("2015-01-05", datetime.today().strftime("%Y-%m-%d"))
+        rng = np.random.default_rng(self._seed(code))
+        close = np.round(10 * np.exp(np.cumsum(rng.normal(0, 0.02, len(days)))), 2)
+        pre_close = np.concatenate([[close[0]], close[:-1]])
+        spread = np.abs(rng.normal(0, 0.01, len(days))) * close
+        volume = rng.integers(10_000, 1_000_000, len(days)) * 100.0
+        df = pd.DataFrame({
+            "stock_code": code,
+            "trade_time": days.strftime("%Y-%m-%d 00:00:00"),
+            "trade_date": days.strftime("%Y-%m-%d"),
+            "open": np.round(pre_close + rng.normal(0, 0.3, len(days)) * spread, 2),
+            "close": close,
+            "high": np.round(close + spread, 2),
+            "low": np.round(close - spread, 2),
+            "volume": volume,
+            "amount": np.round(volume * close, 2),
+            "change_pct": np.round((close / pre_close - 1) * 100, 2),
+            "change": np.round(close - pre_close, 2),
+            "turnover_ratio": np.round(rng.uniform(0.1, 5, len(days)), 2),
+            "pre_close": pre_close,
+        })
+        if start_date:
+            df = df[df["trade_date"] >= start_date]
+        if end_date:
+            df = df[df["trade_date"] <= end_date]
+        return df.reset_index(drop=True)
+
+    def get_market(self, code, start_date=None, end_date=None):
+        return self.limiter.call(self._request, lambda: self.history(code, start_date, end_date), is_empty=_is_empty,
+                                 empty_ok=start_date is not None)
+
+    def get_stock_shares(self, code):
+        def build():
+            shares = 1e8 * (1 + self._seed(code) % 100)
+            return pd.DataFrame({
+                "stock_code": [code, code],
+                "change_date": ["2015-01-05", (datetime.today() - timedelta(days=365)).strftime("%Y-%m-%d")],
+                "total_shares": [shares, shares * 1.2],
+                "limit_shares": [0.0, 0.0],
+                "list_a_shares": [shares, shares * 1.2],
+                "change_reason": ["上市", "增发"],
+            })
+        return self.limiter.call(self._request, build, is_empty=_is_empty)
+
+    def get_etf_hist(self, code, start_date, end_date):
+        return pd.DataFrame()  # 不模拟 ETF
+
+    def limiters(self):
+        return [self.limiter]
+
+
+class HttpSource:
+    """
+    本地模拟行情服务的客户端，接口与 AdataSource 相同，请求同样经过共享限速器
+    :param url: 服务地址，默认取环境变量 STOCK_SOURCE_URL
+    """
+
+    name = "http"
+
+    def __init__(self, url=None, rate=None, retries=4, timeout=10):
+        import requests
+        self.url = (url or os.environ.get("STOCK_SOURCE_URL", "http://127.0.0.1:8765")).rstrip("/")
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.trust_env = False  # 本地服务不走代理
+        rate = rate or float(os.environ.get("STOCK_FETCH_RATE", 1000))
+        self.limiter = ratelimit.limiter("http", rate=rate, retries=retries)
+
+    def _get(self, path, **params):
+        resp = self.session.get(f"{self.url}{path}", params=params, timeout=self.timeout)
+        resp.raise_for_status()
+        body = resp.json()
+        return pd.DataFrame(body["data"], columns=body["columns"])
+
+    def all_code(self):
+        return self.limiter.call(self._get, "/stock/codes", is_empty=_is_empty)
+
+    def get_market(self, code, start_date=None, end_date=None):
+        return self.limiter.call(self._get, "/stock/market", code=code, start_date=start_date, end_date=end_date,
+                                 is_empty=_is_empty, empty_ok=start_date is not None)
+
+    def get_stock_shares(self, code):
+        return self.limiter.call(self._get, "/stock/shares", code=code, is_empty=_is_empty)
+
+    def get_etf_hist(self, code, start_date, end_date):
+        return pd.DataFrame()  # 不模拟 ETF
+
+    def limiters(self):
+        return [self.limiter]
+
+
+_source = None
+_source_lock = threading.Lock()
+
+
+def get_source(rate=None):
+    """
+    进程内共享的数据源，环境变量 STOCK_DATA_SOURCE=fake 时使用离线假数据，
+    =http 时请求 STOCK_SOURCE_URL 指向的模拟行情服务
+    :param rate: 调整共享限速器的每秒请求数上限
+    """
+    global _source
+    with _source_lock:
+        if _source is None:
+            _source = _create_source()
+        if rate:
+            for lim in _source.limiters():
+                lim.bucket.set_rate(rate)
+        return _source
+
+
+def _create_source():
+    kind = os.environ.get("STOCK_DATA_SOURCE", "adata")
+    if kind == "http":
+        return HttpSource()
+    if kind == "fake":
+        return FakeSource(
+            codes=int(os.environ.get("STOCK_FAKE_CODES", 50)),
+            fail_rate=float(os.environ.get("STOCK_FAKE_FAIL_RATE", 0)),
+            empty_rate=float(os.environ.get("STOCK_FAKE_EMPTY_RATE", 0)),
+        )
+    return AdataSource()
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+@file: fake_server.py
+@author: vanilla
+@date: 2025-11-03
+@desc: 本地模拟行情服务：东方财富 clist 分页、个股历史行情、股本信息，
+       数据由 FakeSource 确定性生成或从录制目录回放，可配置延迟、出错率、空结果率，
+       配合 datasource.HttpSource / filter.fetcher 离线压测更新流程。
+"""
+
+import os
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qsl
+
+from update.datasource import FakeSource
+
+
+BENCHMARK = "000001"
+
+# clist 字段：价格、涨跌幅、换手率 ×100 取整，成交量以手为单位（与 fetch_market_local 的解析对应）
+CLIST_FIELDS = {
+    "f2": ("close", 100), "f3": ("change_pct", 100), "f4": ("change", 100),
+    "f5": ("volume", 0.01), "f6": ("amount", 1), "f8": ("turnover_ratio", 100),
+    "f15": ("high", 100), "f16": ("low", 100), "f17": ("open", 100), "f18": ("pre_close", 100),
+}
+
+
+def replay_key(path, query):
+    """录制文件名：接口路径 + 排序后的参数摘要（忽略时间戳参数 _）"""
+    params = sorted((k, v) for k, v in parse_qsl(query, keep_blank_values=True) if k != "_")
+    digest = hashlib.sha1(json.dumps([path, params]).encode()).hexdigest()[:16]
+    return f"{path.strip('/').replace('/', '_')}_{digest}.json"
+
+
+def record(url, replay_dir, session=None):
+    """请求真实接口并按 replay_key 保存响应，供 --replay 回放"""
+    import requests
+    session = session or requests.Session()
+    resp = session.get(url, timeout=10)
+    resp.raise_for_status()
+    parts = urlsplit(url)
+    os.makedirs(replay_dir, exist_ok=True)
+    path = os.path.join(replay_dir, replay_key(parts.path, parts.query))
+    with open(path, "wb") as f:
+        f.write(resp.content)
+    return path
+
+
+class MarketData:
+    """
+    :param codes: 股票数量或代码列表（数量时额外包含基准 000001）
+    :param latency: 每次请求的基础延迟（秒），另加 [0, jitter) 的随机抖动
+    :param fail_rate: 返回 503 的概率
+    :param empty_rate: 返回空数据的概率（模拟限流）
+    :param replay_dir: 录制目录，命中的请求原样返回录制内容
+    """
+
+    def __init__(self, codes=200, latency=0.0, jitter=0.0, fail_rate=0.0, empty_rate=0.0, seed=0, replay_dir=None):
+        if isinstance(codes, int):
+            codes = [BENCHMARK] + [f"{600000 + i:06d}" for i in range(codes)]
+        self.source = FakeSource(codes)
+        self.latency = latency
+        self.jitter = jitter
+        self.fail_rate = fail_rate
+        self.empty_rate = empty_rate
+        self.replay_dir = replay_dir
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.build_lock = threading.Lock()
+        self.snapshot = None
+        self.histories = {}  # {代码: 生成到今天的完整行情}，避免每次请求重新生成
+        self.counts = {}
+
+    # -------------------- 故障注入 --------------------
+    def draw(self):
+        """返回 (延迟, 结果)，结果为 ok / fail / empty"""
+        with self.lock:
+            delay = self.latency + self.random.random() * self.jitter
+            r = self.random.random()
+        if r < self.fail_rate:
+            return delay, "fail"
+        if r < self.fail_rate + self.empty_rate:
+            return delay, "empty"
+        return delay, "ok"
+
+    def count(self, endpoint, outcome):
+        with self.lock:
+            c = self.counts.setdefault(endpoint, {"requests": 0, "ok": 0, "fail": 0, "empty": 0})
+            c["requests"] += 1
+            c[outcome] += 1
+
+    def stats(self):
+        with self.lock:
+            return {k: dict(v) for k, v in self.counts.items()}
+
+    # -------------------- 数据 --------------------
+    def replay(self, path, query):
+        if not self.replay_dir:
+            return None
+        file = os.path.join(self.replay_dir, replay_key(path, query))
+        if not os.path.exists(file):
+            return None
+        with open(file, "rb") as f:
+            return f.read()
+
+    def history(self, code, start_date=None, end_date=None):
+        df = self.histories.get(code)
+        if df is None:
+            df = self.histories[code] = self.source.history(code)
+        if start_date:
+            df = df[df["trade_date"] >= start_date]
+        if end_date:
+            df = df[df["trade_date"] <= end_date]
+        return df
+
+    def quotes(self):
+        """全部股票最新一天的 clist 记录（首次请求时生成，并发的首批请求只生成一次）"""
+        with self.build_lock:
+            if self.snapshot is None:
+                infos = self.source.all_code().set_index("stock_code")
+                rows = []
+                for code in self.source.codes:
+                    bar = self.history(code).iloc[-1]
+                    row = {f: int(round(float(bar[col]) * scale)) for f, (col, scale) in CLIST_FIELDS.items()}
+                    row.update({
+                        "f12": code,
+                        "f13": 1 if code.startswith("6") else 0,
+                        "f14": infos.loc[code, "short_name"],
+                        "f20": int(round(float(bar["close"]) * self.source.get_stock_shares(code)["total_shares"].iloc[-1])),
+                    })
+                    rows.append(row)
+                self.snapshot = rows
+            return self.snapshot
+
+    def clist(self, params, empty):
+        pn, pz = int(params.get("pn", 1)), int(params.get("pz", 20))
+        if empty:
+            return {"rc": 0, "data": None}
+        rows = self.quotes()
+        fid = params.get("fid", "f20")
+        rows = sorted(rows, key=lambda r: r.get(fid, 0), reverse=params.get("po", "1") == "1")
+        page = rows[(pn - 1) * pz:pn * pz]
+        # 超出页数时与真实接口一样 data 为 null
+        return {"rc": 0, "data": {"total": len(rows), "diff": page} if page else None}
+
+    @staticmethod
+    def frame(df):
+        return {"columns": list(df.columns), "data": df.values.tolist()}
+
+    def handle(self, path, query):
+        """返回 (状态码, 响应体 bytes)；未知接口返回 404"""
+        params = dict(parse_qsl(query))
+        if path == "/stats":
+            return 200, json.dumps(self.stats()).encode()
+        routes = {
+            "/api/qt/clist/get": lambda empty: self.clist(params, empty),
+            "/stock/codes": lambda empty: self.frame(self.source.all_code().head(0 if empty else None)),
+            "/stock/market": lambda empty: self.frame(self.history(
+                params["code"], params.get("start_date"), params.get("end_date")).head(0 if empty else None)),
+            "/stock/shares": lambda empty: self.frame(self.source.get_stock_shares(params["code"]).head(0 if empty else None)),
+        }
+        if path not in routes:
+            return 404, b"not found"
+
+        delay, outcome = self.draw()
+        if delay:
+            time.sleep(delay)
+        self.count(path, outcome)
+        if outcome == "fail":
+            return 503, b"service unavailable"
+        body = None if outcome == "empty" else self.replay(path, query)
+        if body is None:
+            body = json.dumps(routes[path](outcome == "empty"), ensure_ascii=False).encode()
+        return 200, body
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # 支持长连接
+
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        try:
+            status, body = self.server.market.handle(parts.path, parts.query)
+        except Exception as e:
+            status, body = 500, str(e).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(market, host="127.0.0.1", port=8765, background=False):
+    """
+    启动服务；background=True 时在守护线程中运行并立即返回 server（port=0 取随机端口）
+    server.url 为服务地址，server.shutdown() 停止
+    """
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    server.market = market
+    server.url = f"http://{host}:{server.server_address[1]}"
+    if background:
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+    print(f"模拟行情服务 {server.url}，共 {len(market.source.codes)} 只股票")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='本地模拟行情服务')
+    parser.add_argument('-o', '--operate', choices=['serve', 'record'], default='serve')
+    parser.add_argument('-p', '--port', type=int, default=8765)
+    parser.add_argument('-n', '--codes', type=int, default=200, help='模拟的股票数量')
+    parser.add_argument('-l', '--latency', type=float, default=0.0, help='每次请求的基础延迟（秒）')
+    parser.add_argument('-j', '--jitter', type=float, default=0.0, help='延迟的随机抖动上限（秒）')
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='返回 503 的概率')
+    parser.add_argument('--empty-rate', type=float, default=0.0, help='返回空数据的概率')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--replay', help='录制目录：serve 时优先回放，record 时写入')
+    parser.add_argument('-u', '--url', action='append', help='record 时要录制的真实接口地址，可多次指定')
+    args = parser.parse_args()
+
+    if args.operate == 'record':
+        for url in args.url or []:
+            print(f"已录制 {record(url, args.replay or 'replay')}")
+    else:
+        serve(MarketData(args.codes, args.latency, args.jitter, args.fail_rate, args.empty_rate, args.seed, args.replay),
+              port=args.port)
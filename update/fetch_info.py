@@ -1,9 +1,9 @@
-import adata
 import pandas as pd
 import time
 import argparse
 import os
 import utils.config as config
+from update.datasource import get_source
 
 def save_data(df: pd.DataFrame, data_path):
     """以覆盖方式写入 CSV，并保持股票代码为字符串"""
@@ -18,7 +18,7 @@ def fetch():
     # 1. 获取所有大A股票代码
     print("获取所有A股股票代码...")
     try:
-        res_df = adata.stock.info.all_code()
+        res_df = get_source().all_code()
         # 过滤掉没有上市日期的股票（可选）
         res_df = res_df[res_df['list_date'].notna()]
     except Exception as e:
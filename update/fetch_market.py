@@ -1,11 +1,11 @@
 import os
 import pandas as pd
-import adata
-import akshare as ak
 from datetime import datetime, timedelta
-import threading
 import numpy as np
+import utils.config as config
 import update.fetch_market_local as fl
+from update.datasource import get_source
+from utils.meta_index import meta_index
 
 
 def compute_kdj(all_df, new_start_idx, n=9, k_smooth=3, d_smooth=3):
@@ -64,9 +64,43 @@ def compute_kdj(all_df, new_start_idx, n=9, k_smooth=3, d_smooth=3):
         all_df.drop(columns=['rsv'], inplace=True)
 
 
+MA_PERIODS = (5, 10, 20)
+
+
+def compute_all_indicators(all_df, n=9, k_smooth=3, d_smooth=3):
+    """
+    一次性向量化计算全部指标（MA 及突破标记、KDJ 及金叉死叉），
+    结果与 MarketAnalyzer.compute_indicators 从第 0 行起的增量计算逐列一致
+    :param all_df: 已按交易日排序去重、索引从 0 开始的 DataFrame，原地添加指标列
+    """
+    close = all_df["close"]
+    for win in MA_PERIODS:
+        ma = close.rolling(window=win, min_periods=win).mean().fillna(0)
+        above = (ma > 0).to_numpy() & (close > ma).to_numpy()
+        prev = np.concatenate([[above[0] if len(above) else False], above[:-1]])
+        all_df[f"ma{win}"] = ma
+        all_df[f"above_ma{win}"] = np.where(above, "y", "n")
+        all_df[f"first_above_ma{win}"] = np.where(above & ~prev, "y", "n")
+        all_df[f"first_under_ma{win}"] = np.where(~above & prev, "y", "n")
+
+    low_min = all_df["low"].rolling(window=n, min_periods=1).min()
+    high_max = all_df["high"].rolling(window=n, min_periods=1).max()
+    rsv = ((close - low_min) / (high_max - low_min) * 100).fillna(0)
+    k = rsv.ewm(alpha=1/k_smooth, adjust=False).mean()
+    d = k.ewm(alpha=1/d_smooth, adjust=False).mean()
+    all_df["K"], all_df["D"], all_df["J"] = k, d, 3 * k - 2 * d
+
+    kv, dv = k.to_numpy(), d.to_numpy()
+    golden = np.zeros(len(kv), dtype=bool)
+    death = np.zeros(len(kv), dtype=bool)
+    golden[1:] = (kv[:-1] < dv[:-1]) & (kv[1:] > dv[1:])
+    death[1:] = (kv[:-1] > dv[:-1]) & (kv[1:] < dv[1:])
+    all_df["kdj_signal"] = np.where(golden, "golden_cross", np.where(death, "death_cross", "no_cross"))
+    return all_df
+
+
 class MarketAnalyzer:
-    _cache = {}  # 类级别的缓存：{file_path: parsed_dict}
-    _cache_lock = threading.Lock()  # 类级别的锁（所有实例共享）
+    _cache = fl.SnapshotCache(maxsize=2)  # 类级别的快照缓存（所有实例共享）
 
     def __init__(self, code: str, start_date: str, end_date: str = None, data_path: str = None, ktype: int=1, fetch_from: str = "remote"):
         """
@@ -90,11 +124,7 @@ class MarketAnalyzer:
         """股票类型"""
         res_df = pd.DataFrame()
         if self.ktype == "1" or self.ktype == 1:
-            res_df = adata.stock.market.get_market(
-                stock_code=self.code,
-                start_date=self.start_date,
-                end_date=self.end_date,
-            )
+            res_df = get_source().get_market(self.code, self.start_date, self.end_date)
         """ETF基金类型"""
         if self.ktype == "2" or self.ktype == 2:
             start_date = self.start_date.replace('-', '') if self.start_date else '19900101'
@@ -102,36 +132,12 @@ class MarketAnalyzer:
             end_date = self.end_date.replace('-', '') if self.end_date else today
             # akshare 的实际接口可能需要调整
             print(start_date, end_date)
-            res_df = ak.fund_etf_hist_em(
-                symbol=self.code,
-                start_date=start_date,
-                end_date=end_date,
-                adjust="qfq",
-            )
+            res_df = get_source().get_etf_hist(self.code, start_date, end_date)
         return res_df
 
 
     def fetch_market_data_from_local(self):
-        now = datetime.now()
-        date_str = now.strftime("%Y-%m-%d")
-        file_path = f"/root/stock/data/{date_str}_all_market.txt"
-
-        # 先快速检查缓存（无锁，提高命中时的性能）
-        if file_path in self._cache:
-            res = self._cache[file_path]
-            return res.get(self.code, pd.DataFrame())
-
-        # 缓存未命中 → 获取锁，防止多个线程重复加载
-        with self._cache_lock:
-            # 再次检查（double-check pattern）：可能在等待锁时已被其他线程加载
-            if file_path in self._cache:
-                res = self._cache[file_path]
-            else:
-                print("load stock_data")
-                res = fl.load_stock_data(file_path)
-                self._cache[file_path] = res
-
-        return res.get(self.code, pd.DataFrame())
+        return self._cache.lookup(fl.snapshot_path(), self.code)
 
     def load_history(self):
         # """读取历史数据（如存在）"""
@@ -236,17 +242,23 @@ class MarketAnalyzer:
             subset=["trade_date"], keep="last"
         ).sort_values("trade_date").reset_index(drop=True)
     
-        # ✅ 在你的前提下，这是安全的
+        # 新数据通常追加在末尾；补缺口时可能插在中间，从第一条新数据开始重算
         new_start_idx = len(all_df) - len(df)
+        inserted = np.flatnonzero(all_df["trade_date"].isin(df["trade_date"]).to_numpy())
+        if len(inserted):
+            new_start_idx = min(new_start_idx, int(inserted[0]))
         
         # 安全兜底（理论上不会触发，但防御性编程）
         if new_start_idx < 0:
             new_start_idx = 0
     
+        # 没有历史（新股票/首次拉取）时一次性向量化计算
+        if new_start_idx == 0:
+            return compute_all_indicators(all_df)
+
         # 增量计算（实际会重算 [new_start_idx:]）
-        self.ma(all_df, 5, new_start_idx)
-        self.ma(all_df, 10, new_start_idx)
-        self.ma(all_df, 20, new_start_idx)
+        for period in MA_PERIODS:
+            self.ma(all_df, period, new_start_idx)
         compute_kdj(all_df, new_start_idx)
     
         return all_df
@@ -255,6 +267,8 @@ class MarketAnalyzer:
         """以追加方式写入 CSV，并保持股票代码为字符串"""
         # 写入 CSV
         df.to_csv(self.data_path, index=False, mode="w", encoding="utf-8-sig")
+        if not df.empty:
+            meta_index().record(self.code, self.ktype, self.data_path)
 
     def run(self):
         """执行完整流程"""
@@ -1,5 +1,11 @@
+import os
+import re
 import json
+import time
+import threading
+import numpy as np
 import pandas as pd
+from collections import OrderedDict
 from datetime import datetime
 
 # ===== 配置区 =====
@@ -12,6 +18,14 @@ TRADE_TIME_STR = CURRENT_DATE.strftime("%Y-%m-%d 00:00:00")  # "2026-01-20 00:00
 # TRADE_DATE_STR = "2026-01-19"
 # TRADE_TIME_STR = "2026-01-19 00:00:00"
 
+# 收盘快照（filter/all_stock.py 的输出）所在目录，可指向测试目录
+SNAPSHOT_DIR = os.environ.get("STOCK_SNAPSHOT_DIR", "/root/stock/data")
+
+
+def snapshot_path(date_str=None):
+    date_str = date_str or datetime.now().strftime("%Y-%m-%d")
+    return f"{SNAPSHOT_DIR}/{date_str}_all_market.txt"
+
 # 字段映射（原始 f 字段 → 目标列名）
 FIELD_MAPPING = {
     'f2': 'close',
@@ -33,93 +47,95 @@ DIVIDE_100_FIELDS = {'open', 'close', 'high', 'low', 'pre_close', 'change_pct',
 # volume 需要乘以 100
 MULTIPLY_100_FIELDS = {'volume'}
 
-def parse_concatenated_json(text):
-    """手动解析 [{...}][{...}] 格式的拼接 JSON"""
-    records = []
+NUMERIC_COLS = ['open', 'close', 'high', 'low', 'pre_close', 'change', 'change_pct', 'turnover_ratio', 'volume', 'amount']
+
+_WS = re.compile(r'\s*')
+
+def iter_arrays(text, decoder):
+    """依次解码 [..][..] 中的每个数组，解析失败的片段跳到下一个 '][' 处继续"""
     i = 0
     n = len(text)
-    
-    while i < n:
-        while i < n and text[i].isspace():
-            i += 1
+    while True:
+        i = _WS.match(text, i).end()
         if i >= n:
             break
         if text[i] != '[':
             raise ValueError(f"期望 '['，但在位置 {i} 遇到 '{text[i]}'")
-        i += 1
-        
-        depth = 0
-        start = i
-        in_string = False
-        escape = False
-        
-        while i < n:
-            c = text[i]
-            if not escape:
-                if c == '\\':
-                    escape = True
-                elif c == '"':
-                    in_string = not in_string
-                elif not in_string:
-                    if c == '[':
-                        depth += 1
-                    elif c == ']':
-                        if depth == 0:
-                            break
-                        else:
-                            depth -= 1
-            else:
-                escape = False
-            i += 1
-        else:
-            raise ValueError("未找到匹配的 ']'")
-        
-        content = text[start:i]
-        i += 1
-        
-        if content.strip() == '':
-            continue
-        
-        json_str = '[' + content + ']'
         try:
-            arr = json.loads(json_str)
-            if isinstance(arr, list):
-                records.extend(arr)
+            arr, i = decoder.raw_decode(text, i)
         except json.JSONDecodeError as e:
-            print(f"JSON 解析失败: {e}，片段: {json_str[:100]}...")
-    
+            print(f"JSON 解析失败: {e}，片段: {text[i:i + 100]}...")
+            nxt = text.find('][', e.pos)
+            if nxt < 0:
+                break
+            i = nxt + 1
+            continue
+        yield arr
+
+
+def parse_concatenated_json(text):
+    """解析 [{...}][{...}] 格式的拼接 JSON，返回全部记录"""
+    records = []
+    for arr in iter_arrays(text, json.JSONDecoder()):
+        if isinstance(arr, list):
+            records.extend(arr)
     return records
 
-def load_stock_data(file_path):
+
+def parse_snapshot_columns(text):
+    """
+    解析快照并直接投影到 FIELD_MAPPING 的列
+    返回 {目标列名: 值列表}，只包含至少出现过一次的字段；没有股票代码的记录被丢弃
+    """
+    return project_columns(iter_arrays(text, json.JSONDecoder()))
+
+
+def project_columns(pages):
+    """把若干页 clist 记录（每页一个 list）投影到 FIELD_MAPPING 的列，返回值同 parse_snapshot_columns"""
+    columns = {f: [] for f in FIELD_MAPPING}
+    present = set()
+    for arr in pages:
+        if not isinstance(arr, list):
+            continue
+        # 整页按列取值，不逐条构造中间结构
+        arr = [r for r in arr if isinstance(r, dict) and 'f12' in r]
+        for f, col in columns.items():
+            col.extend([r.get(f) for r in arr])
+        present.update(f for f in FIELD_MAPPING if any(f in r for r in arr))
+    if not columns['f12']:
+        return {}
+    return {
+        FIELD_MAPPING[f]: col
+        for f, col in columns.items() if f in present
+    }
+
+
+def columns_to_frame(columns):
+    """列投影结果 → 数值已转换、缩放的 DataFrame（不含日期列）"""
+    # 强制转换为数值（处理 "-" 等字符串）
+    data = {}
+    for col, values in columns.items():
+        if col in NUMERIC_COLS:
+            values = pd.to_numeric(pd.Series(values), errors='coerce')
+            # 数值缩放
+            if col in DIVIDE_100_FIELDS:
+                values = values / 100.0
+            elif col in MULTIPLY_100_FIELDS:
+                values = values * 100
+        data[col] = values
+    return pd.DataFrame(data)
+
+
+def load_stock_table(file_path):
+    """解析快照文件，返回全部股票一张表（每只股票一行），无有效记录时返回空表"""
     with open(file_path, 'r', encoding='utf-8') as f:
         content = f.read()
-    
-    records = parse_concatenated_json(content)
-    valid_records = [r for r in records if isinstance(r, dict) and 'f12' in r]
-    
-    if not valid_records:
+
+    columns = parse_snapshot_columns(content)
+    if not columns:
         print("没有找到有效的股票记录。")
-        return {}
-    
-    df = pd.DataFrame(valid_records)
-    
-    # 字段映射
-    needed_f_fields = [k for k in FIELD_MAPPING if k in df.columns]
-    df = df[needed_f_fields].rename(columns=FIELD_MAPPING)
-
-    # 强制转换为数值（处理字符串数字）
-    numeric_cols = ['open', 'close', 'high', 'low', 'pre_close', 'change', 'change_pct', 'turnover_ratio', 'volume', 'amount']
-    for col in numeric_cols:
-        if col in df.columns:
-            df[col] = pd.to_numeric(df[col], errors='coerce')
-
-    # 数值缩放
-    for col in DIVIDE_100_FIELDS:
-        if col in df.columns:
-            df[col] = df[col] / 100.0
-    for col in MULTIPLY_100_FIELDS:
-        if col in df.columns:
-            df[col] = df[col] * 100
+        return pd.DataFrame()
+    df = columns_to_frame(columns)
 
     # 添加日期时间字段
     df['trade_date'] = TRADE_DATE_STR
@@ -143,7 +159,12 @@ def load_stock_data(file_path):
     ]
     # 只保留存在的列
     final_cols = [col for col in desired_order if col in df.columns]
-    df = df[final_cols]
+    return df[final_cols]
+
+def load_stock_data(file_path):
+    df = load_stock_table(file_path)
+    if df.empty:
+        return {}
 
     # 按 stock_code 分组返回
     result = {}
@@ -151,6 +172,104 @@ def load_stock_data(file_path):
         result[code] = group.reset_index(drop=True)
     return result
 
+class SnapshotCache:
+    """
+    快照缓存（进程内共享）：每个快照存成一张按代码排序的列式表 + 代码→行区间索引，
+    按 LRU 和 TTL 淘汰，快照文件被改写（大小/修改时间变化）后重新加载
+    """
+
+    def __init__(self, maxsize=2, ttl=6 * 3600, loader=load_stock_table):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.loader = loader
+        self.entries = OrderedDict()  # {file_path: (表, {代码: (起, 止)}, 文件状态, 加载时间)}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _stat(file_path):
+        try:
+            st = os.stat(file_path)
+        except OSError:
+            return None
+        return st.st_size, st.st_mtime_ns
+
+    @staticmethod
+    def _index(table):
+        if table.empty:
+            return table, {}
+        table = table.sort_values('stock_code', kind='stable').reset_index(drop=True)
+        codes, starts, counts = np.unique(table['stock_code'].to_numpy(dtype=str), return_index=True, return_counts=True)
+        return table, {c: (int(s), int(s + n)) for c, s, n in zip(codes, starts, counts)}
+
+    def _fresh(self, entry, stat):
+        return entry[2] == stat and time.monotonic() - entry[3] < self.ttl
+
+    def get(self, file_path):
+        """返回 (表, 索引)，未命中时加载；同一时间只有一个线程加载"""
+        stat = self._stat(file_path)
+        entry = self.entries.get(file_path)
+        if entry is not None and self._fresh(entry, stat):
+            with self.lock:
+                self.hits += 1
+                if file_path in self.entries:
+                    self.entries.move_to_end(file_path)
+            return entry[0], entry[1]
+
+        with self.lock:
+            # 等锁期间可能已被其他线程加载
+            entry = self.entries.get(file_path)
+            if entry is not None and self._fresh(entry, stat):
+                self.hits += 1
+                self.entries.move_to_end(file_path)
+                return entry[0], entry[1]
+            self.misses += 1
+            print(f"load stock_data: {file_path}")
+            table, index = self._index(self.loader(file_path))
+            self.entries[file_path] = (table, index, stat, time.monotonic())
+            self.entries.move_to_end(file_path)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+            return table, index
+
+    def lookup(self, file_path, code):
+        """某只股票在快照中的行（共享底层数据的切片，不在缓存内复制），没有则返回空表"""
+        table, index = self.get(file_path)
+        span = index.get(code)
+        if span is None:
+            return pd.DataFrame()
+        return table.iloc[span[0]:span[1]].reset_index(drop=True)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        """命中/淘汰次数与每个快照占用的内存（字节）"""
+        with self.lock:
+            entries = {
+                path: {
+                    "rows": len(table),
+                    "codes": len(index),
+                    "bytes": int(table.memory_usage(index=True, deep=True).sum()),
+                    "age": round(time.monotonic() - loaded, 1),
+                }
+                for path, (table, index, _, loaded) in self.entries.items()
+            }
+            return {
+                "entries": entries,
+                "bytes": sum(e["bytes"] for e in entries.values()),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+            }
+
+
 if __name__ == "__main__":
     file_path = "/root/stock/data/2026-01-20_all_market.txt.bak"  # 改成你的文件路径
     data = load_stock_data(file_path)
@@ -1,32 +1,72 @@
-import adata
 import pandas as pd
-import time
 import argparse
+import json
 import os
 import utils.config as config
+import update.fetch_market_local as fl
+import utils.ratelimit as ratelimit
+from update.datasource import get_source
+from utils.meta_index import meta_index
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
 
 
+# 每次运行最多轮换检查全部股票的 1/ROTATE_DAYS，约 ROTATE_DAYS 天轮完一遍
+ROTATE_DAYS = 30
+# 快照推算的总股本与上次检查时相差超过该比例，视为股本变动（价格取整带来的误差远小于此）
+SHARES_TOLERANCE = 0.01
+
+
 def save_data(df: pd.DataFrame, data_path):
-    """以追加方式写入 CSV，并保持股票代码为字符串"""
+    """
+    覆盖写入 CSV，并保持股票代码为字符串
+    内容与现有文件一致时不写，返回是否写入
+    """
     # 确保 stock_code 列为字符串
     df["stock_code"] = df["stock_code"].astype(str)
+    text = df.to_csv(index=False)
+    if os.path.exists(data_path):
+        with open(data_path, encoding="utf-8-sig", newline="") as f:
+            if f.read() == text:
+                return False
     # 创建目录
     os.makedirs(os.path.dirname(data_path), exist_ok=True)
     # 写入 CSV，覆盖写入
-    df.to_csv(data_path, index=False, mode="w", encoding="utf-8-sig")
+    with open(data_path, "w", encoding="utf-8-sig", newline="") as f:
+        f.write(text)
+    return True
 
 
-def fetch_stock(code, stock_info, idx, total, delay=1):
-    print(f"\n[{idx}/{total}] 正在处理股票: {code}")
+def latest_change_date(df):
+    return str(df["change_date"].max()) if "change_date" in df.columns and len(df) else None
+
+
+def implied_shares(path):
+    """
+    由收盘快照（filter/all_stock.py 的输出）推算每只股票的总股本：总市值 f20 / 最新价 f2
+    f2 为价格 ×100 的整数，停牌等没有价格的记录跳过，返回 {code: 股本}
+    """
+    with open(path, encoding="utf-8") as f:
+        text = f.read()
+    shares = {}
+    for arr in fl.iter_arrays(text, json.JSONDecoder()):
+        for r in arr if isinstance(arr, list) else []:
+            cap, price = r.get("f20"), r.get("f2")
+            if isinstance(cap, (int, float)) and isinstance(price, (int, float)) and price > 0:
+                shares[str(r["f12"])] = cap / (price / 100)
+    return shares
+
 
-    if delay != 0:
-        time.sleep(delay)
+def shares_changed(old, new):
+    return abs(new - old) > SHARES_TOLERANCE * old
+
+
+def fetch_stock(code, stock_info, idx, total, snapshot_shares=None):
+    print(f"\n[{idx}/{total}] 正在处理股票: {code}")
 
     try:
-        # 获取股票历史股本/流通股数据
-        df_shares = adata.stock.info.get_stock_shares(stock_code=code, is_history=False)
+        # 获取股票历史股本/流通股数据（经过共享限速器）
+        df_shares = get_source().get_stock_shares(code)
 
         if df_shares.empty:
             return f"⚠️ 股票 {code} 没有历史股本数据，跳过"
@@ -35,39 +75,124 @@ def fetch_stock(code, stock_info, idx, total, delay=1):
         if "stock_code" in df_shares.columns:
             df_shares = df_shares.drop(columns=["stock_code"])
 
-        # 获取res_df中对应股票的信息
         # 将stock_info扩展为与df_shares行数相同
         stock_info_df = pd.DataFrame([stock_info] * len(df_shares)).reset_index(drop=True)
 
         # 合并数据
         df_combined = pd.concat([stock_info_df.reset_index(drop=True), df_shares.reset_index(drop=True)], axis=1)
 
-        # 保存
+        # 保存（内容没变不重写）
         path = config.default_info_path(code, "1")
-        save_data(df_combined, path)
-        return f"✅ {code} 成功"
+        written = save_data(df_combined, path)
+        meta_index().record_info(code, latest_change_date(df_shares), stock_info["short_name"], stock_info["exchange"],
+                                 snapshot_shares)
+        return f"✅ {code} {'已更新' if written else '未变化'}"
     except Exception as e:
         return f"⚠️ 股票 {code} 处理失败: {e}"
 
 
-def fetch(workers, delay=1):
+def relabel(code, stock_info, snapshot_shares=None):
+    """只有名称/交易所变化时，就地改写已有 info 文件中的基本信息列，不请求股本数据"""
+    path = config.default_info_path(code, "1")
+    df = pd.read_csv(path, dtype=str, keep_default_na=False)
+    for col in ("short_name", "exchange"):
+        if col in df.columns:
+            df[col] = stock_info[col]
+    save_data(df, path)
+    meta_index().record_info(code, latest_change_date(df), stock_info["short_name"], stock_info["exchange"],
+                             snapshot_shares)
+
+
+def seed_state(code, snapshot_shares=None):
+    """没有检查记录但已有 info 文件的股票（如索引是新建的），按文件内容补一条状态"""
+    df = pd.read_csv(config.default_info_path(code, "1"), dtype=str, keep_default_na=False)
+    last = df.iloc[-1] if len(df) else {}
+    return {
+        "checked": "",
+        "change_date": latest_change_date(df),
+        "short_name": last.get("short_name"),
+        "exchange": last.get("exchange"),
+        "snapshot_shares": snapshot_shares,
+    }
+
+
+def plan(res_df, state, rotate, shares=None):
+    """
+    返回 (需要拉取股本的代码, 只需改名的代码, 需补记的状态 {代码: 状态})
+    拉取：
+      - 新上市（没有 info 文件）或没记下变动日期（拉取失败或文件不完整）
+      - 股本变动：shares（今天快照推算的总股本）与上次检查时记录的相差超过 SHARES_TOLERANCE
+      - 兜底轮换最久未检查的 rotate 只，覆盖快照看不出的变动（如只改流通股）
+    有 info 文件但没有检查记录的股票先按文件补记状态，并以今天的快照作为比较基准
+    没有今天的快照时只能靠轮换，股本变动最长要 ROTATE_DAYS 天才会被拉取
+    改名：名称或交易所与上次记录不同
+    """
+    shares = shares or {}
+    fetch_codes, renamed, pool, seeds = [], [], [], {}
+    for row in res_df.itertuples(index=False):
+        code = row.stock_code
+        if not os.path.exists(config.default_info_path(code, "1")):
+            fetch_codes.append(code)
+            continue
+        last = state.get(code)
+        if last is None:
+            last = seeds[code] = seed_state(code, shares.get(code))
+        if not last["change_date"]:
+            seeds.pop(code, None)
+            fetch_codes.append(code)
+            continue
+        now_shares, old_shares = shares.get(code), last["snapshot_shares"]
+        if now_shares is not None and old_shares is not None and shares_changed(old_shares, now_shares):
+            fetch_codes.append(code)
+            continue
+        if now_shares is not None and old_shares is None:
+            seeds[code] = dict(last, snapshot_shares=now_shares)
+        if (last["short_name"], last["exchange"]) != (row.short_name, row.exchange):
+            renamed.append(code)
+        pool.append((last["checked"] or "", code))
+    rotated = [code for _, code in sorted(pool)[:rotate]]
+    fetch_codes += rotated
+    rotated = set(rotated)
+    renamed = [c for c in renamed if c not in rotated]
+    return fetch_codes, renamed, seeds
+
+
+def fetch(workers, rate=None, rotate=None, full=False):
     # 1. 获取所有大A股票代码
     print("获取所有A股股票代码...")
     try:
-        res_df = adata.stock.info.all_code()
+        res_df = get_source(rate).all_code()
         # 过滤掉没有上市日期的股票（可选）
         res_df = res_df[res_df['list_date'].notna()]
-        stock_codes = res_df['stock_code'].tolist()
-        print(f"共获取 {len(stock_codes)} 只股票")
+        res_df = res_df.assign(stock_code=res_df["stock_code"].astype(str)).drop_duplicates("stock_code")
+        print(f"共获取 {len(res_df)} 只股票")
     except Exception as e:
         print(f"获取股票失败")
         return
 
+    # 2. 与上次的状态比较，只拉取需要的股票
+    infos = {row["stock_code"]: row for row in res_df.to_dict("records")}
+    snapshot = fl.snapshot_path()
+    shares = implied_shares(snapshot) if os.path.exists(snapshot) else {}
+    if not shares:
+        print(f"没有今天的收盘快照 {snapshot}，只按轮换检查股本变动")
+    if full:
+        stock_codes, renamed = list(infos), []
+    else:
+        if rotate is None:
+            rotate = -(-len(infos) // ROTATE_DAYS)
+        stock_codes, renamed, seeds = plan(res_df, meta_index().info_state(), rotate, shares)
+        meta_index().seed_info(seeds)
+    print(f"需要拉取股本 {len(stock_codes)} 只，只需改名 {len(renamed)} 只")
+
+    for code in renamed:
+        relabel(code, infos[code], shares.get(code))
+
     # 并发执行
     results = []
     with ThreadPoolExecutor(max_workers=workers) as executor:
         future_to_code = {
-            executor.submit(fetch_stock, code, res_df[res_df["stock_code"] == code].iloc[0], idx, len(stock_codes), delay): code
+            executor.submit(fetch_stock, code, infos[code], idx, len(stock_codes), shares.get(code)): code
             for idx, code in enumerate(stock_codes, start=1)
         }
         for future in as_completed(future_to_code):
@@ -75,16 +200,17 @@ def fetch(workers, delay=1):
             print(result)
             results.append(result)
 
-    print(f"成功 {sum('✅' in r for r in results)} 只，失败 {sum('⚠️' in r for r in results)} 只。")
-
-    #for idx, code in  enumerate(stock_codes, start=1):
-    #    print(fetch_stock(code, res_df[res_df["stock_code"] == code].iloc[0], idx, len(stock_codes), delay))
+    print(f"成功 {sum('✅' in r for r in results)} 只（其中更新 {sum('已更新' in r for r in results)} 只），"
+          f"失败 {sum('⚠️' in r for r in results)} 只。")
+    ratelimit.print_stats()
 
 
 if __name__ == "__main__":
-    parser = argparse.ArgumentParser(description='并发更新所有股票数据')
+    parser = argparse.ArgumentParser(description='增量更新股票股本信息')
     parser.add_argument('-w', '--workers', type=int, default=5, help='并发线程数')
-    parser.add_argument('-d', '--delay', type=int, default=1, help='获取股票延迟')
+    parser.add_argument('-r', '--rate', type=float, default=2, help='每秒请求数上限（所有线程共享）')
+    parser.add_argument('-n', '--rotate', type=int, help=f'本次轮换检查的股票数，默认全部的 1/{ROTATE_DAYS}')
+    parser.add_argument('--full', action='store_true', help='拉取全部股票')
     args = parser.parse_args()
 
-    fetch(args.workers, args.delay)
+    fetch(args.workers, args.rate, args.rotate, args.full)
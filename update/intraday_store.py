@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+@file: intraday_store.py
+@author: vanilla
+@date: 2025-11-04
+@desc: 盘中快照存储：每次拉取全市场快照存成一个按代码排序的列式批次（data/intraday/日期/HHMMSS.npz，
+       同一秒内的后续批次为 HHMMSS_1.npz、HHMMSS_2.npz…），只追加不改写；读取时把当天所有批次拼成 (时间, 代码) 有序的列，
+       支持每只股票的最新行情、单只股票的盘中序列和按周期聚合的分钟 K 线。
+"""
+
+import os
+import re
+import argparse
+import threading
+import numpy as np
+import pandas as pd
+from glob import glob
+from datetime import datetime
+
+import utils.config as config
+import update.fetch_market_local as fl
+
+
+INTRADAY_DIR = os.environ.get("STOCK_INTRADAY_DIR", f"{config.DATA_DIR}/intraday")
+
+BATCH_RE = re.compile(r"^(\d{6})(?:_(\d+))?\.npz$")
+
+
+def batch_name(ts, seq=0):
+    return f"{ts:%H%M%S}.npz" if not seq else f"{ts:%H%M%S}_{seq}.npz"
+
+
+def batch_key(name):
+    """批次的排序键 (HHMMSS, 序号)，同一秒内按写入先后"""
+    m = BATCH_RE.match(name)
+    return m.group(1), int(m.group(2) or 0)
+
+
+def write_batch(table, path):
+    """
+    table: 快照表（stock_code + fl.NUMERIC_COLS 中存在的列），按代码排序后写入
+    先写临时文件再硬链接到 path，读取方不会看到写了一半的批次；path 已存在时抛出 FileExistsError，不覆盖
+    """
+    table = table.drop_duplicates("stock_code", keep="last").sort_values("stock_code")
+    arrays = {"stock_code": table["stock_code"].astype(str).to_numpy(dtype="U6")}
+    for col in fl.NUMERIC_COLS:
+        if col in table.columns:
+            arrays[col] = table[col].to_numpy(dtype=np.float64)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp, "wb") as f:
+            np.savez(f, **arrays)
+        os.link(tmp, path)
+    finally:
+        os.remove(tmp)
+    return len(table)
+
+
+class IntradayStore:
+    """
+    一个交易日的盘中快照
+    rows: 当天所有批次按 (时间, 代码) 顺序拼接的列 {列名: 数组}，另有 time 列
+    by_code: 按 (代码, 时间) 排序的行号，配合 codes_sorted 做单只股票的二分查找
+    """
+
+    def __init__(self, date=None, root=None):
+        self.date = pd.Timestamp(date or datetime.now()).strftime("%Y-%m-%d")
+        self.dir = f"{root or INTRADAY_DIR}/{self.date}"
+        self.lock = threading.Lock()
+        self.batches = {}  # {文件名: {列名: 数组}}
+        self.rows = None
+
+    # -------------------- 写入 --------------------
+    def append(self, table, ts=None):
+        """
+        追加一个批次，ts 为拉取时间（默认当前时间），返回写入的股票数
+        同一秒内已有批次时依次加序号，不覆盖已写入的批次
+        """
+        ts = ts or datetime.now()
+        seq = 0
+        while True:
+            try:
+                return write_batch(table, f"{self.dir}/{batch_name(ts, seq)}")
+            except FileExistsError:
+                seq += 1
+
+    def append_pages(self, pages, ts=None):
+        """直接追加 clist 分页结果（每页一个记录 list），不经过文本快照"""
+        columns = fl.project_columns(pages)
+        if not columns:
+            return 0
+        return self.append(fl.columns_to_frame(columns), ts)
+
+    def import_snapshot(self, file_path, ts):
+        """导入已有的文本快照文件"""
+        table = fl.load_stock_table(file_path)
+        if table.empty:
+            return 0
+        return self.append(table, ts)
+
+    # -------------------- 读取 --------------------
+    def refresh(self):
+        """加载新出现的批次；批次只追加，已加载的不会变化"""
+        names = sorted((os.path.basename(p) for p in glob(f"{self.dir}/*.npz") if BATCH_RE.match(os.path.basename(p))),
+                       key=batch_key)
+        with self.lock:
+            new = [n for n in names if n not in self.batches]
+            for name in new:
+                with np.load(f"{self.dir}/{name}") as npz:
+                    self.batches[name] = {k: npz[k] for k in npz.files}
+            if new or self.rows is None:
+                self._build()
+        return self
+
+    def _build(self):
+        names = sorted(self.batches, key=batch_key)
+        cols = ["stock_code"] + [c for c in fl.NUMERIC_COLS if any(c in self.batches[n] for n in names)]
+        times = [np.datetime64(f"{self.date}T{n[:2]}:{n[2:4]}:{n[4:6]}", "s") for n in names]
+        sizes = [len(self.batches[n]["stock_code"]) for n in names]
+        rows = {"time": np.repeat(np.array(times, dtype="datetime64[s]"), sizes)}
+        for col in cols:
+            parts = [self.batches[n].get(col, np.full(size, np.nan)) for n, size in zip(names, sizes)]
+            rows[col] = np.concatenate(parts) if parts else np.array([], dtype="U6" if col == "stock_code" else np.float64)
+        # 批次内已按代码排序，按代码稳定排序后同一代码内部即为时间顺序
+        self.by_code = np.argsort(rows["stock_code"], kind="stable")
+        self.codes_sorted = rows["stock_code"][self.by_code]
+        self.times = np.array(times, dtype="datetime64[s]")
+        self.rows = rows
+
+    def _frame(self, idx):
+        return pd.DataFrame({col: values[idx] for col, values in self.rows.items()})
+
+    def latest(self, codes=None, at=None):
+        """
+        每只股票最新的一行（最近一次出现的批次），at 指定时只看该时刻及之前的批次
+        codes 为 None 时返回全部股票
+        """
+        self.refresh()
+        idx = self.by_code
+        if at is not None:
+            idx = idx[self.rows["time"][idx] <= np.datetime64(pd.Timestamp(at), "s")]
+        codes_sorted = self.rows["stock_code"][idx]
+        # 每个代码的最后一行
+        last = np.flatnonzero(np.append(codes_sorted[1:] != codes_sorted[:-1], True)) if len(idx) else idx
+        df = self._frame(idx[last])
+        if codes is not None:
+            df = df[df["stock_code"].isin(list(codes))]
+        return df.set_index("stock_code", drop=False)
+
+    def series(self, code, start=None, end=None):
+        """单只股票当天的快照序列（按时间升序，以 time 为索引）"""
+        self.refresh()
+        lo = np.searchsorted(self.codes_sorted, code, side="left")
+        hi = np.searchsorted(self.codes_sorted, code, side="right")
+        df = self._frame(self.by_code[lo:hi]).set_index("time")
+        return df.loc[start:end] if start is not None or end is not None else df
+
+    def bars(self, code, freq="5min"):
+        """
+        由快照序列聚合的盘中 K 线：open/high/low/close 取区间内的最新价，
+        volume/amount 为累计值之差（当天第一根相对 0）
+        """
+        df = self.series(code)
+        if df.empty:
+            return pd.DataFrame(columns=["open", "high", "low", "close", "volume", "amount"])
+        out = df["close"].resample(freq, label="right", closed="right").ohlc()
+        for col in ("volume", "amount"):
+            if col in df.columns:
+                cum = df[col].resample(freq, label="right", closed="right").last().ffill()
+                out[col] = cum.diff().fillna(cum)
+        return out.dropna(subset=["close"])
+
+    def __len__(self):
+        self.refresh()
+        return len(self.times)
+
+
+def snapshot_time(file_path):
+    """
+    文本快照的拉取时间：filter/all_stock.py 改名后的文件名中带 日期_HH:MM，
+    当前快照（只有日期）取文件修改时间
+    """
+    name = os.path.basename(file_path)
+    m = re.match(r"^(\d{4}-\d{2}-\d{2})_(\d{2}):(\d{2})_all_market\.txt", name)
+    if m:
+        return datetime.strptime(f"{m.group(1)} {m.group(2)}:{m.group(3)}", "%Y-%m-%d %H:%M")
+    return datetime.fromtimestamp(os.path.getmtime(file_path))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='盘中快照存储')
+    parser.add_argument('-o', '--operate', choices=['import', 'latest', 'series', 'bars'], default='latest')
+    parser.add_argument('-s', '--snapshot', nargs='*', default=[], help='import 时要导入的文本快照文件')
+    parser.add_argument('-d', '--date', help='交易日，默认今天')
+    parser.add_argument('-c', '--code', help='股票代码（series/bars），latest 时可用逗号分隔多个')
+    parser.add_argument('-f', '--freq', default='5min', help='bars 的聚合周期')
+    args = parser.parse_args()
+
+    if args.operate == 'import':
+        for path in args.snapshot:
+            ts = snapshot_time(path)
+            store = IntradayStore(args.date or ts)
+            print(f"{path} → {store.dir}（{ts:%H:%M:%S}）：{store.import_snapshot(path, ts)} 只")
+    else:
+        store = IntradayStore(args.date)
+        print(f"{store.date} 共 {len(store)} 个批次")
+        if args.operate == 'latest':
+            print(store.latest(args.code.split(",") if args.code else None).to_string(index=False))
+        elif args.operate == 'series':
+            print(store.series(args.code).to_string())
+        else:
+            print(store.bars(args.code, args.freq).to_string())
@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+@file: load_test.py
+@author: vanilla
+@date: 2025-11-03
+@desc: 离线压测：启动本地模拟行情服务，在临时目录里依次跑 clist 分页抓取（写成当日快照）、股本信息、
+       全量行情更新和按快照的本地增量更新，统计吞吐量、重试次数、失败数，输出 JSON 报告；
+       检查请求速率不超过 -r，可与基线报告对比做回归检查。
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import tempfile
+import argparse
+import subprocess
+from datetime import datetime
+
+from update.fake_server import MarketData, serve
+from filter.fetcher import fetch_pages
+import utils.ratelimit as ratelimit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PHASES = ["clist", "info", "full", "incremental"]
+
+CLIST_QUERY = "/api/qt/clist/get?np=1&fltt=1&invt=2&fid=f20&po=1&pz=100"
+
+
+def diff_stats(before, after):
+    """两次服务端计数之差，按接口汇总"""
+    out = {}
+    for path, c in after.items():
+        prev = before.get(path, {})
+        out[path] = {k: v - prev.get(k, 0) for k, v in c.items()}
+    return out
+
+
+def limiter_stats(name):
+    return next((s for s in ratelimit.all_stats() if s["source"] == name), {})
+
+
+def run_clist(url, pages, workers, rate, snapshot):
+    """与 filter/all_stock.py 相同的分页抓取，结果写成收盘快照，供之后的本地增量更新读取"""
+    before = limiter_stats("eastmoney")
+    rows = fetch_pages(f"{url}{CLIST_QUERY}", range(1, pages + 1), concurrency=workers, rate=rate, proxy=None,
+                       log=lambda msg: None)
+    after = limiter_stats("eastmoney")
+    os.makedirs(os.path.dirname(snapshot), exist_ok=True)
+    with open(snapshot, "w", encoding="utf-8") as f:
+        for page in rows:
+            f.write(json.dumps(page))
+    # 出错或空结果的请求都会被限速器重试（最后一次除外）
+    retries = sum(after.get(k, 0) - before.get(k, 0) for k in ("errors", "empty"))
+    return {"items": sum(len(r) for r in rows), "failed": sum(not r for r in rows), "retries": retries}
+
+
+def run_module(module, args, env, log_path):
+    """子进程运行更新脚本（与线上用法一致），从输出统计成功/失败和重试"""
+    with open(log_path, "w", encoding="utf-8") as log:
+        proc = subprocess.run([sys.executable, "-m", module, *args], cwd=ROOT, env=env,
+                              stdout=log, stderr=subprocess.STDOUT)
+    with open(log_path, encoding="utf-8") as f:
+        text = f.read()
+    m = re.search(r"成功 (\d+) 只.*?失败 (\d+) 只", text)
+    ok, failed = (int(m.group(1)), int(m.group(2))) if m else (0, 0)
+    return {"items": ok, "failed": failed, "retries": text.count("后重试"), "exit": proc.returncode}
+
+
+def run(codes=200, workers=8, rate=50, latency=0.02, jitter=0.02, fail_rate=0.05, empty_rate=0.02,
+        seed=0, phases=PHASES, work_dir=None, keep=False):
+    market = MarketData(codes, latency, jitter, fail_rate, empty_rate, seed)
+    server = serve(market, port=0, background=True)
+    work_dir = work_dir or tempfile.mkdtemp(prefix="stock_load_")
+    snapshot_dir = f"{work_dir}/snapshot"
+    env = dict(os.environ, STOCK_WORK_DIR=work_dir, STOCK_DATA_SOURCE="http", STOCK_SOURCE_URL=server.url,
+               STOCK_SNAPSHOT_DIR=snapshot_dir,
+               PYTHONPATH=os.pathsep.join(filter(None, [ROOT, os.environ.get("PYTHONPATH")])))
+    env.pop("STOCK_META_INDEX", None)
+    os.makedirs(f"{work_dir}/data", exist_ok=True)
+
+    jobs = {
+        "clist": lambda: run_clist(server.url, -(-len(market.source.codes) // 100), workers, rate,
+                                   f"{snapshot_dir}/{datetime.now():%Y-%m-%d}_all_market.txt"),
+        "info": lambda: run_module("update.fetch_stock_info", ["-w", str(workers), "-r", str(rate), "--full"],
+                                   env, f"{work_dir}/info.log"),
+        "full": lambda: run_module("update.update_market_patch", ["-f", "remote", "-w", str(workers), "-r", str(rate)],
+                                   env, f"{work_dir}/full.log"),
+        "incremental": lambda: run_module("update.update_market_patch", ["-f", "local", "-w", str(workers), "-r", str(rate)],
+                                          env, f"{work_dir}/incremental.log"),
+    }
+
+    report = {
+        "config": {"codes": len(market.source.codes), "workers": workers, "rate": rate, "latency": latency,
+                   "jitter": jitter, "fail_rate": fail_rate, "empty_rate": empty_rate, "seed": seed},
+        "phases": {},
+    }
+    market.quotes()  # 预先生成 clist 快照，不计入抓取耗时
+    try:
+        for name in phases:
+            before = market.stats()
+            start = time.time()
+            result = jobs[name]()
+            elapsed = time.time() - start
+            requests = diff_stats(before, market.stats())
+            count = sum(c["requests"] for c in requests.values())
+            result.update({
+                "seconds": round(elapsed, 2),
+                "throughput": round(result["items"] / elapsed, 2) if elapsed else 0.0,  # 成功条数/秒
+                "requests": count,
+                "request_rate": round(count / elapsed, 2) if elapsed else 0.0,  # 服务端收到的请求数/秒
+                "injected": {k: sum(c[k] for c in requests.values()) for k in ("fail", "empty")},
+            })
+            report["phases"][name] = result
+            print(f"⏱ {name}: 成功 {result['items']}，失败 {result['failed']}，重试 {result['retries']}，"
+                  f"请求 {count}（{result['request_rate']} 次/秒），{result['seconds']}s，{result['throughput']} 条/秒")
+    finally:
+        server.shutdown()
+        server.server_close()
+        if not keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+        else:
+            print(f"工作目录保留在 {work_dir}")
+    return report
+
+
+def check_rate(report):
+    """
+    每个阶段服务端收到的请求不能超过限速：rate × 耗时，另加开始时一个突发容量（rate 个）
+    限速器失效时吞吐量没有意义，返回问题列表
+    """
+    rate = report["config"]["rate"]
+    problems = []
+    for name, cur in report["phases"].items():
+        allowed = rate * (cur["seconds"] + 1)
+        if cur["requests"] > allowed:
+            problems.append(f"{name}: 请求 {cur['requests']} 次超过限速允许的 {allowed:.0f} 次"
+                            f"（{cur['request_rate']} 次/秒 > {rate}）")
+    return problems
+
+
+def compare(report, baseline, tolerance=0.2):
+    """与基线对比：吞吐量下降超过 tolerance 或失败数增加视为回归，返回问题列表"""
+    problems = []
+    for name, cur in report["phases"].items():
+        base = baseline.get("phases", {}).get(name)
+        if base is None:
+            continue
+        if cur["throughput"] < base["throughput"] * (1 - tolerance):
+            problems.append(f"{name}: 吞吐量 {cur['throughput']} < 基线 {base['throughput']} × {1 - tolerance:.2f}")
+        if cur["failed"] > base["failed"]:
+            problems.append(f"{name}: 失败 {cur['failed']} > 基线 {base['failed']}")
+    return problems
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='用本地模拟行情服务压测更新流程')
+    parser.add_argument('-n', '--codes', type=int, default=200, help='模拟的股票数量')
+    parser.add_argument('-w', '--workers', type=int, default=8, help='并发数')
+    parser.add_argument('-r', '--rate', type=float, default=50, help='每秒请求数上限')
+    parser.add_argument('-l', '--latency', type=float, default=0.02, help='每次请求的基础延迟（秒）')
+    parser.add_argument('-j', '--jitter', type=float, default=0.02, help='延迟的随机抖动上限（秒）')
+    parser.add_argument('--fail-rate', type=float, default=0.05, help='返回 503 的概率')
+    parser.add_argument('--empty-rate', type=float, default=0.02, help='返回空数据的概率')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-p', '--phases', default=",".join(PHASES), help=f'要跑的阶段，逗号分隔：{",".join(PHASES)}')
+    parser.add_argument('-o', '--output', help='报告写入的 JSON 文件')
+    parser.add_argument('-b', '--baseline', help='基线报告，吞吐量或失败数回归时以非零状态退出（请求速率超过 -r 时总是非零退出）')
+    parser.add_argument('-t', '--tolerance', type=float, default=0.2, help='允许的吞吐量下降比例')
+    parser.add_argument('--keep', action='store_true', help='保留临时工作目录和日志')
+    args = parser.parse_args()
+
+    phases = [p for p in args.phases.split(",") if p]
+    unknown = set(phases) - set(PHASES)
+    if unknown:
+        parser.error(f"未知阶段: {','.join(unknown)}")
+
+    report = run(args.codes, args.workers, args.rate, args.latency, args.jitter, args.fail_rate, args.empty_rate,
+                 args.seed, phases, keep=args.keep)
+    text = json.dumps(report, ensure_ascii=False, indent=1)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+
+    problems = check_rate(report)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            problems += compare(report, json.load(f), args.tolerance)
+    for p in problems:
+        print(f"❌ {p}")
+    sys.exit(1 if problems else 0)
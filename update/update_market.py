@@ -12,9 +12,14 @@ import argparse
 import os
 import utils.config as config
 import pandas as pd
-from datetime import datetime, timedelta
+from datetime import datetime
 import mplfinance as mpf
 from update.fetch_market import MarketAnalyzer  # 你之前实现的类
+from utils.meta_index import meta_index
+from utils.trade_calendar import trade_calendar
+
+# 新股票默认拉取的历史长度：约五年的交易日
+HISTORY_DAYS = 1215
 
 
 def update(code, start_date, end_date=None, data_path=None, ktype=1, fetch_from="local"):
@@ -24,28 +29,26 @@ def update(code, start_date, end_date=None, data_path=None, ktype=1, fetch_from=
     if data_path is None:
         data_path = config.default_data_path(code, ktype)
 
+    # 基准数据还没有时按工作日推算
+    calendar = trade_calendar(ktype=ktype, fallback=True)
+
     if not os.path.exists(data_path):
         # 历史文件不存在 → 默认取五年数据
         print(data_path)
         if start_date is None:
-            start_date = (today - timedelta(days=1825)).strftime("%Y-%m-%d")
+            start_date = str(calendar.prev(today, HISTORY_DAYS))
         # 之前没有历史数据，需要从远程获取
         fetch_from = "remote"
         analyzer = MarketAnalyzer(code, start_date, end_date, data_path, ktype, fetch_from)
         df = analyzer.run()
 
     else:
-        # 历史文件存在 → 检查是否需要更新
-        history = pd.read_csv(
-            data_path,
-            parse_dates=["trade_date"],
-        )
-        history.sort_values("trade_date", inplace=True)
-        last_date = history["trade_date"].iloc[-1].date()
+        # 历史文件存在 → 检查是否需要更新（最后交易日取自元数据索引，不解析整个文件）
+        last_date = meta_index().last_date(code, ktype, data_path)
 
-        days = 0
-        if start_date is None:
-            start_date = (last_date - timedelta(days=days)).strftime("%Y-%m-%d")
+        days = 0  # 与已有数据重叠的交易日数
+        if start_date is None and last_date is not None:
+            start_date = str(calendar.prev(last_date, days))
         analyzer = MarketAnalyzer(code, start_date, end_date, data_path, ktype, fetch_from)
         df = analyzer.run()
 
@@ -8,18 +8,21 @@
 @desc: 并发更新所有股票数据，支持控制并发数。
 """
 
-import adata
 from update.update_market import update
+from update.datasource import get_source
 import time
 import os
 import argparse
 from concurrent.futures import ThreadPoolExecutor, as_completed
 import utils.config as config
+import utils.ratelimit as ratelimit
+from utils.meta_index import meta_index
+from datetime import datetime
 
 
 
 def get_codes_from_remote():
-    res_df = adata.stock.info.all_code()
+    res_df = get_source().all_code()
     res_df = res_df[res_df['list_date'].notna()]  # 过滤未上市股票
     return res_df['stock_code'].tolist()
 
@@ -29,21 +32,20 @@ def get_codes_from_file(path):
         return [line.strip() for line in f if line.strip()]
 
 
-def process_code(code, idx, total, ktype, delay):
-    """单只股票处理逻辑"""
+def process_code(code, idx, total, ktype):
+    """单只股票处理逻辑（远程请求由共享限速器控制频率）"""
     try:
-        # time.sleep(delay)
         print(f"\n[{idx}/{total}] 正在处理股票: {code}")
         df = update(code, None, None, None, ktype)
         if df.empty:
-        #    time.sleep(delay)
             raise ValueError("更新失败")
         return f"✅ {code} 成功"
     except Exception as e:
         return f"⚠️ 股票 {code} 处理失败: {e}"
 
 
-def update_codes(fetch, ktype, path, delay, workers):
+def update_codes(fetch, ktype, path, rate, workers, resume=False, backfill_new=False):
+    get_source(rate)
     if fetch == 'remote':
         print("获取所有A股股票代码...")
         stock_codes = get_codes_from_remote()
@@ -56,20 +58,43 @@ def update_codes(fetch, ktype, path, delay, workers):
 
     print(f"共获取 {len(stock_codes)} 只股票")
 
+    # 没有行情文件的股票先按分片并发回填，不再在日常更新里逐只拉取五年数据
+    if backfill_new:
+        from update.backfill import backfill
+        new_codes = [c for c in stock_codes if not os.path.exists(config.default_data_path(c, ktype))]
+        if new_codes:
+            backfill(new_codes, workers, rate, ktype)
+            new_codes = set(new_codes)
+            stock_codes = [c for c in stock_codes if c not in new_codes]
+
+    # 运行日志：同一天、同样参数的未完成运行可以续跑，跳过已成功的股票
+    index = meta_index()
+    run_args = {"fetch": fetch, "ktype": ktype, "path": path, "date": datetime.today().strftime("%Y-%m-%d")}
+    run_id = index.unfinished_run("update_market", run_args) if resume else None
+    if run_id is not None:
+        done = index.done_codes(run_id)
+        stock_codes = [c for c in stock_codes if c not in done]
+        print(f"续跑运行 #{run_id}：跳过已完成的 {len(done)} 只，剩余 {len(stock_codes)} 只")
+    else:
+        run_id = index.start_run("update_market", run_args, stock_codes)
+
     # 并发执行
     results = []
     with ThreadPoolExecutor(max_workers=workers) as executor:
         future_to_code = {
-            executor.submit(process_code, code, idx, len(stock_codes), ktype, delay): code
+            executor.submit(process_code, code, idx, len(stock_codes), ktype): code
             for idx, code in enumerate(stock_codes, start=1)
         }
         for future in as_completed(future_to_code):
             result = future.result()
             print(result)
             results.append(result)
+            index.mark(run_id, future_to_code[future], "✅" in result, result)
 
+    index.finish_run(run_id)
     print("\n处理完成！")
     print(f"成功 {sum('✅' in r for r in results)} 只，失败 {sum('⚠️' in r for r in results)} 只。")
+    ratelimit.print_stats()
     print(f"失败的股票信息如下：")
     for r in results:
         if '失败' in r:
@@ -81,9 +106,11 @@ if __name__ == "__main__":
     parser.add_argument('-f', '--fetch', required=True, help='指定股票代码，local|remote|file')
     parser.add_argument('-p', '--path', help='指定数据文件')
     parser.add_argument('-k', '--ktype', type=int, default=1, help='数据类型')
-    parser.add_argument('-d', '--delay', type=float, default=0.75, help='请求间延迟（秒）')
+    parser.add_argument('-r', '--rate', type=float, default=2, help='每秒请求数上限（所有线程共享）')
     parser.add_argument('-w', '--workers', type=int, default=5, help='并发线程数')
+    parser.add_argument('--resume', action='store_true', help='续跑当天中断的更新，跳过已成功的股票')
+    parser.add_argument('-b', '--backfill', action='store_true', help='没有行情文件的股票先用 update.backfill 分片回填')
     args = parser.parse_args()
 
-    update_codes(args.fetch, args.ktype, args.path, args.delay, args.workers)
+    update_codes(args.fetch, args.ktype, args.path, args.rate, args.workers, args.resume, args.backfill)
 
@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+@file: meta_index.py
+@author: vanilla
+@date: 2025-10-31
+@desc: 行情文件元数据索引（首末交易日、行数、表头/模式版本、内容摘要、最近交易日和收盘数据，
+       按文件大小/修改时间校验）和更新任务的运行日志，存放在 data/meta.db。
+       新鲜度检查、缺口检查、结果缓存版本和条件预筛选都读索引，不再打开行情文件。
+"""
+
+import os
+import json
+import sqlite3
+import hashlib
+import threading
+import pandas as pd
+from datetime import datetime
+
+import utils.config as config
+
+
+META_PATH = os.environ.get("STOCK_META_INDEX", f"{config.DATA_DIR}/meta.db")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    code TEXT NOT NULL,
+    ktype TEXT NOT NULL,
+    last_date TEXT,
+    size INTEGER,
+    mtime_ns INTEGER,
+    updated TEXT,
+    PRIMARY KEY (code, ktype)
+);
+CREATE TABLE IF NOT EXISTS info (
+    code TEXT PRIMARY KEY,
+    checked TEXT,
+    change_date TEXT,
+    short_name TEXT,
+    exchange TEXT
+);
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    task TEXT NOT NULL,
+    args TEXT,
+    total INTEGER,
+    started TEXT,
+    finished TEXT
+);
+CREATE TABLE IF NOT EXISTS journal (
+    run_id INTEGER NOT NULL,
+    code TEXT NOT NULL,
+    status TEXT NOT NULL,
+    message TEXT,
+    updated TEXT,
+    PRIMARY KEY (run_id, code)
+);
+"""
+
+
+# files 表在建表语句之后追加的列（旧库自动补齐）
+FILE_FIELDS = {
+    "first_date": "TEXT",
+    "n_rows": "INTEGER",
+    "columns": "TEXT",
+    "schema": "TEXT",
+    "hash": "TEXT",
+    "prev_hash": "TEXT",
+    "last_close": "REAL",
+    "prev_close": "REAL",
+    "last_amount": "REAL",
+    "prev_amount": "REAL",
+    "recent": "TEXT",
+}
+
+# info 表在建表语句之后追加的列
+INFO_FIELDS = {
+    "snapshot_shares": "REAL",  # 上次检查时由收盘快照推算的总股本（总市值 / 最新价）
+}
+
+RECENT_DAYS = 30  # 保存最近多少个交易日，用于缺口检查
+
+
+def now():
+    return datetime.now().isoformat(timespec="seconds")
+
+
+def chain_hash(prev, line):
+    """逐行链式摘要：追加一行只需在上一个摘要上计算，不用重读整个文件"""
+    return hashlib.sha1(bytes.fromhex(prev) + line.rstrip(b"\r\n")).hexdigest()
+
+
+EMPTY_HASH = hashlib.sha1(b"").hexdigest()
+
+
+def _number(value):
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+def scan(path):
+    """读取整个文件计算元数据（索引失效或整体重写后调用）"""
+    with open(path, "rb") as f:
+        header = f.readline()
+        lines = [line for line in f.read().split(b"\n") if line.strip()]
+    columns = header.decode("utf-8-sig").strip()
+    meta = {"columns": columns, "schema": hashlib.sha1(columns.encode()).hexdigest()[:8], "n_rows": len(lines)}
+    h = prev = EMPTY_HASH
+    for line in lines:
+        prev, h = h, chain_hash(h, line)
+    meta["hash"], meta["prev_hash"] = h, prev
+    rows = [line.decode("utf-8").strip().split(",") for line in lines[-RECENT_DAYS:]]
+    meta.update(_row_fields(columns, rows, lines[0].decode("utf-8").split(",") if lines else None))
+    return meta
+
+
+def _row_fields(columns, rows, first_row):
+    """由最近的若干行（已按逗号拆分）得到日期和收盘数据"""
+    names = columns.split(",")
+    date_i, close_i, amount_i = (names.index(c) if c in names else None for c in ("trade_date", "close", "amount"))
+    out = {"first_date": None, "last_date": None, "last_close": None, "prev_close": None,
+           "last_amount": None, "prev_amount": None, "recent": "[]"}
+    if not rows or date_i is None:
+        return out
+    recent = [pd.Timestamp(r[date_i]).strftime("%Y-%m-%d") for r in rows]
+    out["first_date"] = pd.Timestamp(first_row[date_i]).strftime("%Y-%m-%d")
+    out["last_date"] = recent[-1]
+    out["recent"] = json.dumps(recent)
+    if close_i is not None:
+        out["last_close"] = _number(rows[-1][close_i])
+        out["prev_close"] = _number(rows[-2][close_i]) if len(rows) > 1 else None
+    if amount_i is not None:
+        out["last_amount"] = _number(rows[-1][amount_i])
+        out["prev_amount"] = _number(rows[-2][amount_i]) if len(rows) > 1 else None
+    return out
+
+
+class MetaIndex:
+    def __init__(self, path=None):
+        self.path = path or META_PATH
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.local = threading.local()
+        with self.conn() as conn:
+            conn.executescript(SCHEMA)
+            fields = [r[1] for r in conn.execute("PRAGMA table_info(files)")]
+            for name, kind in FILE_FIELDS.items():
+                if name not in fields:
+                    conn.execute(f"ALTER TABLE files ADD COLUMN {name} {kind}")
+            fields = [r[1] for r in conn.execute("PRAGMA table_info(info)")]
+            for name, kind in INFO_FIELDS.items():
+                if name not in fields:
+                    conn.execute(f"ALTER TABLE info ADD COLUMN {name} {kind}")
+
+    def conn(self):
+        # sqlite 连接不能跨线程共享，每个线程一个
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self.local.conn = conn
+        return conn
+
+    # -------------------- 文件元数据 --------------------
+    def _store(self, code, ktype, path, meta):
+        st = os.stat(path)
+        row = dict(meta, code=code, ktype=str(ktype), size=st.st_size, mtime_ns=st.st_mtime_ns, updated=now())
+        fields = list(row)
+        with self.conn() as conn:
+            conn.execute(
+                f"INSERT OR REPLACE INTO files ({', '.join(fields)}) VALUES ({', '.join('?' * len(fields))})",
+                [row[f] for f in fields],
+            )
+        return row
+
+    def record(self, code, ktype, path):
+        """文件整体写入后重新计算并记录"""
+        return self._store(code, ktype, path, scan(path))
+
+    def record_line(self, code, ktype, path, before, line, replace=False):
+        """
+        追加一行（replace=True 时替换最后一行）后增量更新，before 为写入前的 get() 结果
+        只用到写入前的摘要和最近交易日，不重读文件
+        """
+        if before is None:
+            return self.record(code, ktype, path)
+        line = line.rstrip(b"\r\n")
+        base_hash = before["prev_hash"] if replace else before["hash"]
+        recent = json.loads(before["recent"])
+        if replace:
+            recent = recent[:-1]
+        new_row = line.decode("utf-8").split(",")
+        meta = _row_fields(before["columns"], [new_row], new_row)
+        n_rows = before["n_rows"] + (0 if replace else 1)
+        if n_rows > 1:
+            meta["first_date"] = before["first_date"]
+        if replace:
+            meta["prev_close"], meta["prev_amount"] = before["prev_close"], before["prev_amount"]
+        else:
+            meta["prev_close"], meta["prev_amount"] = before["last_close"], before["last_amount"]
+        meta.update({
+            "n_rows": n_rows,
+            "columns": before["columns"],
+            "schema": before["schema"],
+            "hash": chain_hash(base_hash, line),
+            "prev_hash": base_hash,
+            "recent": json.dumps((recent + [meta["last_date"]])[-RECENT_DAYS:]),
+        })
+        return self._store(code, ktype, path, meta)
+
+    def get(self, code, ktype=1, path=None):
+        """
+        文件的元数据字典，文件不存在返回 None
+        索引与文件大小/修改时间一致时直接返回，否则重新扫描文件并更新索引
+        """
+        path = path or config.default_data_path(code, ktype)
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        cur = self.conn().execute("SELECT * FROM files WHERE code=? AND ktype=?", (code, str(ktype)))
+        row = cur.fetchone()
+        if row is not None:
+            row = dict(zip([d[0] for d in cur.description], row))
+            if row["size"] == st.st_size and row["mtime_ns"] == st.st_mtime_ns and row["hash"]:
+                return row
+        return self.record(code, ktype, path)
+
+    def last_date(self, code, ktype=1, path=None):
+        """文件的最后交易日（date），文件不存在或为空返回 None"""
+        meta = self.get(code, ktype, path)
+        if meta is None or not meta["last_date"]:
+            return None
+        return pd.Timestamp(meta["last_date"]).date()
+
+    def table(self, codes, ktype=1):
+        """多只股票的元数据表（以 code 为索引，一次查询），文件不存在的股票不在表中"""
+        cur = self.conn().execute("SELECT * FROM files WHERE ktype=?", (str(ktype),))
+        names = [d[0] for d in cur.description]
+        cached = {r["code"]: r for r in (dict(zip(names, row)) for row in cur)}
+        rows = []
+        for code in dict.fromkeys(codes):
+            path = config.default_data_path(code, ktype)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            row = cached.get(code)
+            if row is None or row["size"] != st.st_size or row["mtime_ns"] != st.st_mtime_ns or not row["hash"]:
+                row = self.record(code, ktype, path)
+            rows.append(row)
+        return pd.DataFrame(rows, columns=names).set_index("code", drop=False)
+
+    # -------------------- 股本信息 --------------------
+    def info_state(self):
+        """{code: {checked, change_date, short_name, exchange, snapshot_shares}}，上次检查股本信息时的状态"""
+        names = ("checked", "change_date", "short_name", "exchange", "snapshot_shares")
+        cur = self.conn().execute(f"SELECT code, {', '.join(names)} FROM info")
+        return {row[0]: dict(zip(names, row[1:])) for row in cur}
+
+    def record_info(self, code, change_date, short_name, exchange, snapshot_shares=None):
+        with self.conn() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO info (code, checked, change_date, short_name, exchange, snapshot_shares) "
+                "VALUES (?,?,?,?,?,?)",
+                (code, now(), change_date, short_name, exchange, snapshot_shares),
+            )
+
+    def seed_info(self, rows):
+        """
+        rows: {code: {change_date, short_name, exchange, snapshot_shares}}，补记股本变动的比较基准
+        没有记录的股票按 rows 建立记录（检查时间留空，轮换时最先检查）；已有记录只更新 snapshot_shares
+        """
+        with self.conn() as conn:
+            conn.executemany(
+                "INSERT INTO info (code, checked, change_date, short_name, exchange, snapshot_shares) "
+                "VALUES (?,?,?,?,?,?) ON CONFLICT(code) DO UPDATE SET snapshot_shares = excluded.snapshot_shares",
+                [(code, "", r["change_date"], r["short_name"], r["exchange"], r["snapshot_shares"])
+                 for code, r in rows.items()],
+            )
+
+    # -------------------- 运行日志 --------------------
+    def start_run(self, task, args, codes):
+        with self.conn() as conn:
+            cur = conn.execute(
+                "INSERT INTO runs (task, args, total, started) VALUES (?,?,?,?)",
+                (task, json.dumps(args, sort_keys=True), len(codes), now()),
+            )
+            return cur.lastrowid
+
+    def unfinished_run(self, task, args):
+        """同一任务、同一参数最近一次未完成的运行，没有返回 None"""
+        row = self.conn().execute(
+            "SELECT id FROM runs WHERE task=? AND args=? AND finished IS NULL ORDER BY id DESC LIMIT 1",
+            (task, json.dumps(args, sort_keys=True)),
+        ).fetchone()
+        return row[0] if row else None
+
+    def mark(self, run_id, code, ok, message=""):
+        with self.conn() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO journal (run_id, code, status, message, updated) VALUES (?,?,?,?,?)",
+                (run_id, code, "ok" if ok else "failed", message, now()),
+            )
+
+    def done_codes(self, run_id):
+        rows = self.conn().execute("SELECT code FROM journal WHERE run_id=? AND status='ok'", (run_id,))
+        return {r[0] for r in rows}
+
+    def finish_run(self, run_id):
+        with self.conn() as conn:
+            conn.execute("UPDATE runs SET finished=? WHERE id=?", (now(), run_id))
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def meta_index():
+    """进程内共享的索引实例"""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = MetaIndex()
+        return _index
+
+
+def reset():
+    """丢弃当前实例，下次 meta_index() 重新打开连接"""
+    global _index, _index_lock
+    _index = None
+    _index_lock = threading.Lock()
+
+
+# fork 出的子进程（predict/sweep/walk_forward 的进程池）会继承父进程的 sqlite 连接和锁，
+# 与父进程共用同一连接会损坏数据库，子进程里一律重新打开
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=reset)
@@ -1,8 +1,14 @@
+import random
+import itertools
+
+
 # ✅ 解析参数字符串，例如 "prev=5,volumn_amplify=2"
 def parse_tuning(tuning_str: str):
     result = {}
     if not tuning_str:
         return result
+    if isinstance(tuning_str, dict):
+        return dict(tuning_str)
     for item in tuning_str.split(","):
         if "=" not in item:
             continue
@@ -15,3 +21,67 @@ def parse_tuning(tuning_str: str):
             pass
         result[k.strip()] = v
     return result
+
+
+def parse_grid(spec):
+    """
+    解析参数空间，参数之间用 ; 分隔：
+        volumn_amplify=1.5|2|2.5    离散取值
+        rise=0.1~0.3                随机区间（配合 samples 使用）
+    返回: {参数名: 取值列表 或 (下限, 上限)}
+    """
+    grid = {}
+    for item in (spec or "").split(";"):
+        if "=" not in item:
+            continue
+        k, v = item.split("=", 1)
+        k, v = k.strip(), v.strip()
+        if "~" in v:
+            lo, hi = (number(x) for x in v.split("~", 1))
+            grid[k] = (lo, hi)
+        else:
+            grid[k] = [number(x) for x in v.split("|") if x.strip()]
+    return grid
+
+
+def number(v):
+    v = v.strip()
+    try:
+        return float(v) if "." in v else int(v)
+    except ValueError:
+        return v
+
+
+def format_tuning(params):
+    """参数字典 → parse_tuning 可识别的字符串"""
+    return ",".join(f"{k}={v}" for k, v in params.items())
+
+
+def expand(grid, samples=0, seed=0):
+    """
+    只有离散取值时做笛卡尔积；含随机区间或指定 samples 时随机抽样 samples 组
+    返回: tuning 字符串列表（去重，顺序稳定）
+    """
+    keys = list(grid.keys())
+    has_range = any(isinstance(v, tuple) for v in grid.values())
+
+    if not has_range and not samples:
+        points = [dict(zip(keys, values)) for values in itertools.product(*(grid[k] for k in keys))]
+    else:
+        rng = random.Random(seed)
+        points = []
+        for _ in range(samples or 10):
+            point = {}
+            for k in keys:
+                v = grid[k]
+                if isinstance(v, tuple):
+                    lo, hi = v
+                    if isinstance(lo, int) and isinstance(hi, int):
+                        point[k] = rng.randint(lo, hi)
+                    else:
+                        point[k] = round(rng.uniform(lo, hi), 4)
+                else:
+                    point[k] = rng.choice(v)
+            points.append(point)
+
+    return list(dict.fromkeys(format_tuning(p) for p in points))
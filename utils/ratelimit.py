@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+@file: ratelimit.py
+@author: vanilla
+@date: 2025-10-30
+@desc: 远程数据源共用的限速器（线程安全）：令牌桶 + 出错/空结果时自适应降速 + 熔断，按数据源统计吞吐。
+"""
+
+import time
+import random
+import threading
+
+
+def backoff_delay(attempt, base=0.5, cap=30.0):
+    """抖动指数退避（full jitter）：[0, min(cap, base * 2^attempt)] 内均匀取值"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class CircuitOpen(Exception):
+    """数据源处于熔断状态，请求被直接拒绝"""
+
+
+# ===============================
+# 令牌桶
+# ===============================
+class TokenBucket:
+    """
+    平均 rate 次/秒，允许 burst 次突发；
+    出错时速率减半（不低于 min_rate），成功时逐步恢复到 max_rate
+    """
+
+    def __init__(self, rate, burst=None, min_rate=None, max_rate=None):
+        self.rate = float(rate)
+        self.max_rate = float(max_rate or rate)
+        self.min_rate = float(min_rate or self.max_rate / 16)
+        self.burst = burst
+        self.capacity = float(burst or max(1.0, rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def set_rate(self, rate):
+        """改变速率上限；突发容量随之调整，已积攒的令牌不超过新容量"""
+        with self.lock:
+            self.rate = self.max_rate = float(rate)
+            self.min_rate = self.max_rate / 16
+            self.capacity = float(self.burst or max(1.0, rate))
+            self.tokens = min(self.tokens, self.capacity)
+
+    def slow_down(self):
+        with self.lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+
+    def speed_up(self):
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+
+# ===============================
+# 熔断
+# ===============================
+class CircuitBreaker:
+    """
+    连续失败 threshold 次后打开，cooldown 秒内拒绝所有请求；
+    冷却结束后放行一个试探请求（半开），成功则关闭，失败则重新打开
+    """
+
+    def __init__(self, threshold=10, cooldown=60):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened = None
+        self.probing = False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened is None:
+            return "closed"
+        if time.monotonic() - self.opened < self.cooldown:
+            return "open"
+        return "half_open"
+
+    def allow(self):
+        with self.lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half_open" and not self.probing:
+                self.probing = True
+                return True
+            return False
+
+    def success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened = None
+            self.probing = False
+
+    def failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.probing or self.failures >= self.threshold:
+                self.opened = time.monotonic()
+            self.probing = False
+
+
+# ===============================
+# 限速器
+# ===============================
+class Limiter:
+    """
+    一个数据源一个实例，所有线程共享
+    :param rate: 每秒请求数上限
+    :param retries: 出错或空结果时的最多尝试次数
+    """
+
+    def __init__(self, name, rate=2, burst=None, retries=4, threshold=10, cooldown=60, log=print):
+        self.name = name
+        self.bucket = TokenBucket(rate, burst)
+        self.breaker = CircuitBreaker(threshold, cooldown)
+        self.retries = retries
+        self.log = log
+        self.started = time.monotonic()
+        self.lock = threading.Lock()
+        self.counts = {"ok": 0, "empty": 0, "errors": 0, "rejected": 0}
+        self.busy = 0.0  # 请求耗时合计
+
+    def count(self, key, elapsed=0.0):
+        with self.lock:
+            self.counts[key] += 1
+            self.busy += elapsed
+
+    def call(self, func, *args, is_empty=None, empty_ok=False, **kwargs):
+        """
+        限速调用 func；出错或 is_empty(结果) 为真（空结果通常是被限流）时降速并退避重试
+        empty_ok=True：空结果本身就是合理的答案（如指定区间在上市前或停牌中），只计数，直接返回，不降速不重试
+        重试用尽后：出错抛出最后一次的异常，空结果原样返回；熔断时抛出 CircuitOpen
+        只有异常计入熔断，停牌等原因确实没有数据的股票不会触发熔断
+        """
+        for attempt in range(self.retries):
+            if not self.breaker.allow():
+                self.count("rejected")
+                raise CircuitOpen(f"{self.name} 已熔断，{self.breaker.cooldown}s 后重试")
+            self.bucket.acquire()
+            start = time.monotonic()
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                self.count("errors", time.monotonic() - start)
+                self.breaker.failure()
+                self.bucket.slow_down()
+                if attempt + 1 == self.retries:
+                    raise
+                reason = f"异常：{e}"
+            else:
+                self.breaker.success()
+                if is_empty is None or not is_empty(result):
+                    self.count("ok", time.monotonic() - start)
+                    self.bucket.speed_up()
+                    return result
+                self.count("empty", time.monotonic() - start)
+                if empty_ok:
+                    return result
+                self.bucket.slow_down()
+                if attempt + 1 == self.retries:
+                    return result
+                reason = "空结果"
+            delay = backoff_delay(attempt)
+            self.log(f"⚠️ {self.name}: {reason}，{delay:.1f}s 后重试 {attempt + 1}/{self.retries}")
+            time.sleep(delay)
+
+    def stats(self):
+        with self.lock:
+            counts = dict(self.counts)
+            busy = self.busy
+        requests = counts["ok"] + counts["empty"] + counts["errors"]
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        return {
+            "source": self.name,
+            "requests": requests,
+            **counts,
+            "rate": round(self.bucket.rate, 2),
+            "state": self.breaker.state,
+            "throughput": round(counts["ok"] / elapsed, 2),  # 成功次数/秒
+            "avg_latency": round(busy / requests, 3) if requests else 0.0,
+        }
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def limiter(name, **kwargs):
+    """按数据源名称取共享的限速器，首次调用时用 kwargs 创建"""
+    with _limiters_lock:
+        if name not in _limiters:
+            _limiters[name] = Limiter(name, **kwargs)
+        return _limiters[name]
+
+
+def all_stats():
+    with _limiters_lock:
+        return [lim.stats() for lim in _limiters.values()]
+
+
+def print_stats(log=print):
+    for s in all_stats():
+        log(f"📊 {s['source']}: 成功 {s['ok']}，空结果 {s['empty']}，出错 {s['errors']}，熔断拒绝 {s['rejected']}，"
+            f"{s['throughput']} 次/秒，平均耗时 {s['avg_latency']}s，当前限速 {s['rate']} 次/秒（{s['state']}）")
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+@file: stock_summary.py
+@author: vanilla
+@date: 2025-10-27
+@desc: 每只股票一行的摘要表（市值、成交额、交易所、板块、上市天数），用于加载行情前的条件预筛选。
+"""
+
+import os
+import numpy as np
+import pandas as pd
+
+import utils.config as config
+from utils.parse import parse_tuning
+from utils.meta_index import meta_index
+
+
+SUMMARY_FIELDS = [
+    "code", "name", "exchange", "board", "list_date", "last_date",
+    "prev_close", "amount", "list_a_shares", "market_cap", "data_stat", "info_stat",
+]
+
+# 代码前缀 → 板块
+BOARDS = {
+    "main": ("600", "601", "603", "605", "000", "001", "002", "003"),
+    "gem": ("300", "301"),      # 创业板
+    "star": ("688", "689"),     # 科创板
+    "bj": ("4", "8", "920"),    # 北交所
+}
+
+# 只依赖摘要表即可判断的条件
+CHEAP_KEYS = ("market", "amount", "exchange", "board", "min_list_days")
+
+
+def board_of(code):
+    for board, prefixes in BOARDS.items():
+        if str(code).startswith(prefixes):
+            return board
+    return "other"
+
+
+def summary_path(ktype=1):
+    return f"{config.DATA_DIR}/summary_{ktype}.csv"
+
+
+def file_stat(path):
+    st = os.stat(path)
+    return f"{st.st_size}:{st.st_mtime_ns}"
+
+
+def summarize(code, ktype=1):
+    """单只股票的摘要，口径与 utils.load_info.load_stock_data 一致（上一日收盘价 × 最新流通A股股本）"""
+    info_file = config.default_info_path(code, ktype)
+    data_file = config.default_data_path(code, ktype)
+    if not os.path.exists(info_file) or not os.path.exists(data_file):
+        return None
+
+    df_info = pd.read_csv(info_file, parse_dates=["list_date", "change_date"])
+    if df_info.empty:
+        return None
+    latest_info = df_info.sort_values("change_date").iloc[-1]
+
+    # 最新/上一交易日的数据取自元数据索引，不读取行情文件
+    meta = meta_index().get(code, ktype, data_file)
+    if meta is None or meta["n_rows"] < 2:
+        return None
+
+    return {
+        "code": code,
+        "name": df_info.iloc[-1]["short_name"],
+        "exchange": latest_info["exchange"],
+        "board": board_of(code),
+        "list_date": latest_info["list_date"],
+        "last_date": pd.Timestamp(meta["last_date"]),
+        "prev_close": meta["prev_close"],
+        "amount": meta["prev_amount"],
+        "list_a_shares": latest_info["list_a_shares"],
+        "market_cap": meta["prev_close"] * latest_info["list_a_shares"],
+        "data_stat": file_stat(data_file),
+        "info_stat": file_stat(info_file),
+    }
+
+
+def load_summary(codes, ktype=1):
+    """
+    摘要表缓存在 data/summary_{ktype}.csv，只重新计算文件有变化的股票
+    返回: 以 code 为索引的 DataFrame（数据缺失的股票不在表中）
+    """
+    path = summary_path(ktype)
+    if os.path.exists(path):
+        cached = pd.read_csv(path, dtype={"code": str}, parse_dates=["list_date", "last_date"], keep_default_na=False)
+        cached = cached.set_index("code", drop=False)
+    else:
+        cached = pd.DataFrame(columns=SUMMARY_FIELDS).set_index("code", drop=False)
+
+    rows = []
+    changed = False
+    for code in codes:
+        data_file = config.default_data_path(code, ktype)
+        info_file = config.default_info_path(code, ktype)
+        if code in cached.index:
+            row = cached.loc[code]
+            try:
+                fresh = row["data_stat"] == file_stat(data_file) and row["info_stat"] == file_stat(info_file)
+            except OSError:
+                fresh = False
+            if fresh:
+                rows.append(row.to_dict())
+                continue
+        row = summarize(code, ktype)
+        if row is not None:
+            rows.append(row)
+            changed = True
+
+    table = pd.DataFrame(rows, columns=SUMMARY_FIELDS)
+    table["code"] = table["code"].astype(str)
+    table = table.set_index("code", drop=False)
+    if changed:
+        merged = pd.concat([cached[~cached.index.isin(table.index)], table])
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        merged.to_csv(path, index=False)
+    return table
+
+
+# ===============================
+# 条件筛选
+# ===============================
+def has_cheap_cond(cond):
+    t_arr = parse_tuning(cond)
+    return any(k in t_arr for k in CHEAP_KEYS)
+
+
+def rejects(table, cond):
+    """
+    返回 [(未通过的 bool 掩码, 原因)]
+    cond 示例: "market=50000000000,amount=100000000,exchange=SH|SZ,board=main|gem,min_list_days=365"
+    """
+    t_arr = parse_tuning(cond)
+    out = []
+    market = t_arr.get("market", 0)
+    if market:
+        out.append((table["market_cap"].astype(float) < market, f"股票市值小于 {market} 元"))
+    amount = t_arr.get("amount", 0)
+    if amount:
+        out.append((table["amount"].astype(float) < amount, f"股票成交额小于 {amount} 元"))
+    if "exchange" in t_arr:
+        allowed = str(t_arr["exchange"]).upper().split("|")
+        out.append((~table["exchange"].astype(str).str.upper().isin(allowed), f"交易所不在 {allowed}"))
+    if "board" in t_arr:
+        allowed = str(t_arr["board"]).split("|")
+        out.append((~table["board"].isin(allowed), f"板块不在 {allowed}"))
+    min_days = t_arr.get("min_list_days", 0)
+    if min_days:
+        days = (pd.to_datetime(table["last_date"]) - pd.to_datetime(table["list_date"])).dt.days
+        out.append((days.fillna(-1).to_numpy() < min_days, f"上市不足 {min_days} 天"))
+    return out
+
+
+def prefilter(codes, cond, ktype=1):
+    """按摘要表筛选，返回保持原顺序的代码列表"""
+    table = load_summary(codes, ktype)
+    mask = np.ones(len(table), dtype=bool)
+    for rejected, _ in rejects(table, cond):
+        mask &= ~np.asarray(rejected, dtype=bool)
+    keep = set(table.index[mask])
+    return [c for c in codes if c in keep]
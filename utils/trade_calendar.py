@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+@file: trade_calendar.py
+@author: vanilla
+@date: 2025-11-02
+@desc: 交易日历：以基准股票的交易日为准，有序 datetime64[D] 数组 + 日期→下标字典，
+       提供前后 N 个交易日、日期下标等运算；进程内缓存，基准文件变化后自动重新加载。
+"""
+
+import os
+import threading
+import numpy as np
+import pandas as pd
+
+import utils.config as config
+
+
+BENCHMARK = "000001"
+
+
+def to_day(date):
+    return np.datetime64(pd.Timestamp(date).date(), "D")
+
+
+class TradeCalendar:
+    """
+    dates: 升序、去重的交易日
+    超出日历范围的推算按工作日（周一至周五）外推
+    """
+
+    def __init__(self, dates):
+        self.dates = np.unique(np.asarray(dates, dtype="datetime64[D]"))
+        self.pos = {d: i for i, d in enumerate(self.dates.tolist())}
+
+    def __len__(self):
+        return len(self.dates)
+
+    def __contains__(self, date):
+        return to_day(date).item() in self.pos
+
+    def index(self, date):
+        """交易日的下标，不是交易日返回 -1（O(1)）"""
+        return self.pos.get(to_day(date).item(), -1)
+
+    def locate(self, dates, side="left"):
+        """批量日期 → 下标（searchsorted，非交易日落到其后的第一个交易日）"""
+        return np.searchsorted(self.dates, np.asarray(dates, dtype="datetime64[D]"), side=side)
+
+    def shift(self, date, n):
+        """
+        date 之后（n > 0）或之前（n < 0）第 |n| 个交易日；date 不是交易日时，
+        向后数从其后的第一个交易日算起，向前数从其前的最后一个交易日算起；n == 0 原样返回
+        日历之外的日期按工作日接到日历两端：从日历之后往回数时，先按工作日走到日历最后一天，
+        再沿真实日历往回数，只有超出日历的部分按工作日推算
+        """
+        day = to_day(date)
+        if n == 0:
+            return day
+        if not len(self.dates):
+            return np.busday_offset(day, n, roll="backward" if n > 0 else "forward")
+        # i0: 不早于 day 的第一个交易日的下标（日历之外按工作日延伸，可以 < 0 或 >= len）
+        if day > self.dates[-1]:
+            i0 = len(self.dates) + int(np.busday_count(self.dates[-1] + 1, day))
+            trading = bool(np.is_busday(day))
+        elif day < self.dates[0]:
+            i0 = -int(np.busday_count(day, self.dates[0]))
+            trading = bool(np.is_busday(day))
+        else:
+            i0 = int(self.locate([day], side="left")[0])
+            trading = day.item() in self.pos
+        i = i0 + n if trading or n < 0 else i0 - 1 + n
+        if 0 <= i < len(self.dates):
+            return self.dates[i]
+        # 超出范围：从日历边界按工作日外推
+        if i < 0:
+            return np.busday_offset(self.dates[0], i)
+        return np.busday_offset(self.dates[-1], i - len(self.dates) + 1)
+
+    def next(self, date, n=1):
+        return self.shift(date, n)
+
+    def prev(self, date, n=1):
+        return self.shift(date, -n)
+
+    def between(self, start=None, end=None):
+        """[start, end] 内的交易日"""
+        lo = 0 if start is None else int(self.locate([to_day(start)], side="left")[0])
+        hi = len(self.dates) if end is None else int(self.locate([to_day(end)], side="right")[0])
+        return self.dates[lo:hi]
+
+    def tail(self, n):
+        return self.dates[-n:] if n else self.dates[:0]
+
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def trade_calendar(ktype=1, benchmark=BENCHMARK, fallback=False):
+    """
+    基准股票的交易日历（进程内缓存，按文件大小/修改时间失效）
+    基准数据不存在时：fallback=True 返回空日历（全部按工作日推算），否则抛出 ValueError
+    """
+    path = config.default_data_path(benchmark, ktype)
+    try:
+        st = os.stat(path)
+    except OSError:
+        if fallback:
+            return TradeCalendar([])
+        raise ValueError(f"基准数据 {path} 不存在，无法生成交易日历")
+
+    key = (path, st.st_size, st.st_mtime_ns)
+    with _cache_lock:
+        cal = _cache.get(path)
+        if cal is not None and cal[0] == key:
+            return cal[1]
+    try:
+        dates = pd.read_csv(path, usecols=["trade_date"], parse_dates=["trade_date"])["trade_date"]
+    except ValueError:
+        # 基准文件正在被其他线程写入（空文件/表头不完整），下次调用时按新的大小重新加载
+        if fallback:
+            return TradeCalendar([])
+        raise ValueError(f"基准数据 {path} 无法读取，无法生成交易日历")
+    cal = TradeCalendar(dates.to_numpy().astype("datetime64[D]"))
+    with _cache_lock:
+        _cache[path] = (key, cal)
+    return cal
@@ -56,18 +56,22 @@ with col2:
     if operate == "back_test":
         code_input = st.text_input("股票代码（回测）", value="", placeholder="例如：600519")
         stock_cond = st.text_input("股票筛选条件（市值，回测忽略）", value="")
+        use_cache = st.checkbox("使用缓存（数据未更新时直接读取历史回测结果）", value=True)
     else:
         code_input = st.text_area("股票代码 / all", value="all", height=80)
         stock_cond = st.text_input("市值，示例：1000", value="")
+        use_cache = False
+    workers = st.number_input("并行进程数（大于 1 时启用多进程）", value=1, min_value=1, step=1)
 
 # -------------------- 输出区域 --------------------
+result_box = st.empty()
 log_box = st.empty()
 status_slot = st.empty()
 progress_bar = st.progress(0)
 progress_text = st.empty()
 
 # -------------------- worker 线程 --------------------
-def worker_predict(code, operate, mode, tuning, cond, target_date, q: queue.Queue, stop_flag: threading.Event):
+def worker_predict(code, operate, mode, tuning, cond, target_date, use_cache, workers, q: queue.Queue, stop_flag: threading.Event):
     def print_q(txt):
         q.put(("stdout", txt))
 
@@ -83,7 +87,8 @@ def worker_predict(code, operate, mode, tuning, cond, target_date, q: queue.Queu
         # 每个任务独立 Predictor 实例，保证线程安全
         predictor = Predictor(mode, log_callback=print_q, stop_flag=stop_flag)
 
-        predictor.predict(
+        # 逐条产出结果，命中后立即显示
+        for stock_code, _, res in predictor.iter_predict(
             code.strip() or "all",
             "1",  # ktype
             operate,
@@ -92,9 +97,11 @@ def worker_predict(code, operate, mode, tuning, cond, target_date, q: queue.Queu
             None,
             date_str,
             debug=False,
-            cache=False,
+            cache=use_cache,
             progress_callback=progress_callback,
-        )
+            workers=int(workers),
+        ):
+            q.put(("result", (stock_code, res)))
 
         print_q(">>> 后端脚本执行完成。\n")
 
@@ -120,6 +127,8 @@ with col_btn1:
                     args=(code_input.strip() or "all",
                           operate, mode, tuning_string, stock_cond.strip() or None,
                           target_date,
+                          use_cache,
+                          workers,
                           st.session_state.output_queue,
                           st.session_state.stop_flag),
                 )
@@ -138,6 +147,7 @@ with col_btn1:
 if st.session_state.running:
     q = st.session_state.output_queue
     log_lines = []
+    hits = []
 
     while True:
         try:
@@ -152,6 +162,10 @@ if st.session_state.running:
         elif kind == "stdout":
             log_lines.append(item)
             log_box.code("".join(log_lines))
+        elif kind == "result":
+            stock_code, res = item
+            hits.append(res)
+            result_box.markdown(f"**命中 {len(hits)} 条**\n\n" + "\n\n".join(h.strip() for h in hits))
         elif kind == "progress":
             cur, total, code_name = item
             ratio = min(cur / total, 1.0)